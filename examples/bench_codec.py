@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for the serial frame codec. Compares the per frame cost
+of building and decoding frames the old way (get_checksum, to_twoscomp,
+struct.pack of single characters) with TC3625_Codec.
+"""
+import struct
+import timeit
+from tc3625.tc3625_serial import SERIAL_CMDS, ADDRESS, STX, ETX, ACK
+from tc3625.tc3625_serial import get_checksum, to_twoscomp, from_twoscomp
+from tc3625.tc3625_codec import TC3625_Codec
+
+NUMBER = 20000
+
+codec = TC3625_Codec(ADDRESS, SERIAL_CMDS)
+read_cmd = 'input1'
+write_cmd = 'fixed desired control setting'
+write_val = -1234
+val_2c = to_twoscomp(write_val)
+response = STX + val_2c + get_checksum(val_2c) + ACK
+response_view = memoryview(bytearray(response))
+
+def legacy_read_frame():
+    cc = SERIAL_CMDS[read_cmd]['read']
+    cs = get_checksum(ADDRESS+cc)
+    cmd_tuple = (STX,ADDRESS[0],ADDRESS[1],cc[0],cc[1],cs[0],cs[1],ETX)
+    return struct.pack('c'*8,*cmd_tuple)
+
+def legacy_write_frame():
+    cc = SERIAL_CMDS[write_cmd]['write']
+    val = to_twoscomp(int(write_val))
+    cs = get_checksum(ADDRESS+cc+val)
+    cmd_list = [STX,ADDRESS[0],ADDRESS[1],cc[0],cc[1]]
+    cmd_list.extend(val)
+    cmd_list.extend([cs[0],cs[1],ETX])
+    return struct.pack('c'*16,*cmd_list)
+
+def legacy_decode():
+    ret = response
+    cs = get_checksum(ret[1:-3])
+    if cs != ret[-3:-1]:
+        raise IOError, 'checksum'
+    if ret[1:-3] == 'X'*8:
+        raise IOError, 'sent checksum incorrect'
+    return from_twoscomp(ret[1:-3])
+
+assert legacy_read_frame() == codec.read_frame(read_cmd)
+assert legacy_write_frame() == codec.write_frame(write_cmd, write_val)
+assert legacy_decode() == codec.decode(response_view) == write_val
+
+cases = [
+    ('read frame', legacy_read_frame, lambda: codec.read_frame(read_cmd)),
+    ('write frame', legacy_write_frame, lambda: codec.write_frame(write_cmd, write_val)),
+    ('decode', legacy_decode, lambda: codec.decode(response_view)),
+    ]
+
+print '%-12s %12s %12s %8s'%('', 'legacy (us)', 'codec (us)', 'speedup')
+for name, legacy, new in cases:
+    t_legacy = min(timeit.repeat(legacy, number=NUMBER, repeat=3))/NUMBER
+    t_new = min(timeit.repeat(new, number=NUMBER, repeat=3))/NUMBER
+    print '%-12s %12.2f %12.2f %7.1fx'%(name, 1e6*t_legacy, 1e6*t_new, t_legacy/t_new)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for transaction latency and throughput.
+
+Runs against an emulated controller on a pseudo-terminal (default) or a
+real device given with --port, and measures
+
+  * round trip latency percentiles of TC3625_Serial.read/write
+  * TC3625.get_all() wall time
+  * sustained samples/sec for TC3625.get_input1()
+  * get_input1() latency and throughput with injected checksum errors
+    (emulator only)
+
+Results are written as JSON. With --compare the results are checked
+against a stored baseline and the script exits with status 1 if the
+mean, p50 or p90 latency or the throughput of any measurement is worse
+than the baseline by more than --tolerance.
+
+  python benchmark.py --output baseline.json
+  python benchmark.py --output new.json --compare baseline.json
+"""
+import sys
+import json
+import time
+import optparse
+import tc3625
+from tc3625.tc3625_serial import TC3625_Serial
+from tc3625.tc3625_emulator import TC3625_Emulator
+
+READ_CMDS = ['input1', 'alarm status', 'sensor type', 'proportional bandwidth']
+WRITE_CMD = 'alarm deadband'
+
+# Statistics checked by --compare. Tail latencies (p99, max) are too
+# noisy for a fixed tolerance and are reported only.
+COMPARED = ['mean', 'p50', 'p90', 'samples_per_sec']
+# Statistics for which larger values are better, all others are times
+HIGHER_IS_BETTER = ['samples_per_sec']
+
+
+def percentiles(samples):
+    """ Summary statistics, in seconds, of a list of latencies """
+    samples = sorted(samples)
+    n = len(samples)
+    def pct(p):
+        return samples[min(n-1, int(p*n))]
+    return {
+        'n': n,
+        'mean': sum(samples)/float(n),
+        'p50': pct(0.50),
+        'p90': pct(0.90),
+        'p99': pct(0.99),
+        'max': samples[-1],
+        }
+
+def time_calls(func, n):
+    """ Latency of n calls of func """
+    samples = []
+    for i in range(n):
+        t0 = time.time()
+        func()
+        samples.append(time.time() - t0)
+    return samples
+
+def rate(func, duration):
+    """ Calls per second of func sustained over duration seconds """
+    cnt = 0
+    t0 = time.time()
+    while time.time() - t0 < duration:
+        func()
+        cnt += 1
+    return cnt/(time.time() - t0)
+
+def bench_serial(port, opts):
+    """ Round trip latency of the low level read/write commands """
+    dev = TC3625_Serial(port=port, baud_rate=opts.baudrate)
+    dev.open()
+    results = {}
+    for cmd in READ_CMDS:
+        samples = time_calls(lambda: dev.read(cmd), opts.samples)
+        results['read ' + cmd] = percentiles(samples)
+    val = dev.read(WRITE_CMD)
+    samples = time_calls(lambda: dev.write(WRITE_CMD, val), opts.samples)
+    results['write ' + WRITE_CMD] = percentiles(samples)
+    dev.close()
+    return results
+
+def bench_tc3625(port, opts):
+    """ get_all wall time and get_input1 throughput """
+    ctlr = tc3625.TC3625(port=port, baudrate=opts.baudrate)
+    results = {}
+    samples = time_calls(ctlr.get_all, opts.get_all_samples)
+    results['get_all'] = percentiles(samples)
+    results['get_input1'] = {'samples_per_sec': rate(ctlr.get_input1, opts.duration)}
+    ctlr.close()
+    return results
+
+def bench_errors(port, opts):
+    """ get_input1 latency and throughput with injected errors """
+    ctlr = tc3625.TC3625(port=port, baudrate=opts.baudrate)
+    samples = time_calls(ctlr.get_input1, opts.samples)
+    results = percentiles(samples)
+    results['samples_per_sec'] = rate(ctlr.get_input1, opts.duration)
+    ctlr.close()
+    return {'get_input1 with errors': results}
+
+def run(opts):
+    """ Run all benchmarks """
+    results = {
+        'config': {
+            'port': opts.port or 'emulator',
+            'baudrate': opts.baudrate,
+            'samples': opts.samples,
+            'duration': opts.duration,
+            'error_rate': opts.error_rate,
+            },
+        'metrics': {},
+        }
+    emu = None
+    port = opts.port
+    if port == None:
+        emu = TC3625_Emulator(baud_rate=opts.baudrate, seed=0)
+        port = emu.start()
+    try:
+        results['metrics'].update(bench_serial(port, opts))
+        results['metrics'].update(bench_tc3625(port, opts))
+        if emu != None and opts.error_rate > 0:
+            emu.error_rate = opts.error_rate
+            results['metrics'].update(bench_errors(port, opts))
+            results['config']['errors_injected'] = emu.errors_injected
+    finally:
+        if emu != None:
+            emu.stop()
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with baseline. Returns a list of (metric, baseline,
+    new) for the metrics which are worse than baseline by more than
+    tolerance (fraction).
+    """
+    regressions = []
+    for name, stats in sorted(results['metrics'].items()):
+        base_stats = baseline['metrics'].get(name, {})
+        for key, val in sorted(stats.items()):
+            if not key in COMPARED or not key in base_stats:
+                continue
+            base = base_stats[key]
+            if key in HIGHER_IS_BETTER:
+                worse = val < base*(1.0 - tolerance)
+            else:
+                worse = val > base*(1.0 + tolerance)
+            if worse:
+                regressions.append(('%s %s'%(name, key), base, val))
+    return regressions
+
+def print_results(results):
+    for name, stats in sorted(results['metrics'].items()):
+        items = []
+        for key in ['mean', 'p50', 'p90', 'p99', 'max']:
+            if key in stats:
+                items.append('%s %7.2f ms'%(key, 1e3*stats[key]))
+        if 'samples_per_sec' in stats:
+            items.append('%7.1f samples/s'%(stats['samples_per_sec'],))
+        print '%-32s %s'%(name, ', '.join(items))
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--port', default=None,
+            help='serial port of a real device, default is to use the emulator')
+    parser.add_option('--baudrate', type='int', default=9600)
+    parser.add_option('--samples', type='int', default=200,
+            help='number of transactions per latency measurement')
+    parser.add_option('--get-all-samples', type='int', default=5)
+    parser.add_option('--duration', type='float', default=5.0,
+            help='seconds per throughput measurement')
+    parser.add_option('--error-rate', type='float', default=0.05,
+            help='fraction of emulator transactions with injected errors')
+    parser.add_option('--output', default='benchmark.json')
+    parser.add_option('--compare', default=None,
+            help='baseline JSON file to compare against')
+    parser.add_option('--tolerance', type='float', default=0.10,
+            help='allowed fractional regression relative to baseline')
+    opts, args = parser.parse_args()
+
+    results = run(opts)
+    print_results(results)
+    fid = open(opts.output, 'w')
+    json.dump(results, fid, indent=2, sort_keys=True)
+    fid.close()
+
+    if opts.compare != None:
+        fid = open(opts.compare)
+        baseline = json.load(fid)
+        fid.close()
+        regressions = compare(results, baseline, opts.tolerance)
+        for name, base, val in regressions:
+            print 'REGRESSION %s: baseline %g, now %g'%(name, base, val)
+        if regressions:
+            sys.exit(1)
+        print 'no regressions against %s'%(opts.compare,)
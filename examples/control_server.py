@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Serve TC-36-25 controllers to local clients (see tc3625/tc3625_server.py).
+
+Controllers are given as name=port pairs, where port is a device name or
+a transport URL, optionally followed by @address for a controller on a
+multi-drop line. The server listens on a TCP port on localhost, or on a
+UNIX socket with --unix.
+
+  python control_server.py bath=/dev/ttyUSB0 stage=/dev/ttyUSB1
+  python control_server.py --unix /tmp/tc3625.sock bath=loop://
+
+Clients connect with
+
+  ctlr = TC3625_Client('bath', address=('127.0.0.1', 3625))
+"""
+import optparse
+import tc3625
+from tc3625.tc3625_server import TC3625_Server, DFLT_SERVER_ADDRESS
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options] name=port[@address] ...')
+    parser.add_option('--host', default=DFLT_SERVER_ADDRESS[0])
+    parser.add_option('--port', type='int', default=DFLT_SERVER_ADDRESS[1])
+    parser.add_option('--unix', default=None,
+            help='listen on this UNIX socket instead of TCP')
+    parser.add_option('--baudrate', type='int', default=tc3625.DFLT_BAUDRATE)
+    parser.add_option('--no-cache', dest='cache', action='store_false', default=True,
+            help='do not serve configuration registers from the cache')
+    opts, args = parser.parse_args()
+    if not args:
+        parser.error('no controllers given')
+
+    ctlrs = {}
+    for arg in args:
+        name, port = arg.split('=', 1)
+        address = tc3625.DFLT_ADDRESS
+        if '@' in port:
+            port, address = port.rsplit('@', 1)
+        ctlrs[name] = tc3625.TC3625(port=port, baudrate=opts.baudrate, address=address)
+
+    if opts.unix != None:
+        address = opts.unix
+    else:
+        address = (opts.host, opts.port)
+    server = TC3625_Server(ctlrs, address=address, cache=opts.cache)
+    print 'serving %s on %s'%(', '.join(sorted(ctlrs)), server.address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    for ctlr in ctlrs.values():
+        ctlr.close()
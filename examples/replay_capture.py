@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Print and replay a serial capture file (see tc3625/tc3625_capture.py).
+
+The commands sent in the capture are read and written again through
+TC3625_Serial to a TC3625_Replay of the same capture, at maximum speed
+by default, so the parser, decode and error paths process exactly the
+captured traffic. The read timeout of a replay is fixed. Reports the number of transactions, errors and the time per
+transaction.
+
+  python replay_capture.py session.cap --print
+  python replay_capture.py session.cap --speed 1.0
+"""
+import time
+import optparse
+from tc3625.tc3625_serial import TC3625_Serial, SERIAL_CMDS
+from tc3625.tc3625_codec import SEND_SIZE_WRITE
+from tc3625.tc3625_capture import TC3625_Replay, read_capture, SENT
+
+READ_CODES=dict([(v['read'], k) for k, v in SERIAL_CMDS.items() if v['read'] != None])
+WRITE_CODES=dict([(v['write'], k) for k, v in SERIAL_CMDS.items() if v['write'] != None])
+
+
+def print_capture(filename):
+    for t, direction, data in read_capture(filename):
+        print '%12.6f %s %r'%(t, direction, data)
+
+def captured_commands(filename):
+    """
+    List of the (address, command, value) of the frames sent in a
+    capture, value is None for reads.
+    """
+    commands = []
+    for t, direction, frame in read_capture(filename):
+        if direction != SENT:
+            continue
+        address, code = frame[1:3], frame[3:5]
+        if len(frame) == SEND_SIZE_WRITE:
+            val = int(frame[5:13], 16)
+            if val >= 0x80000000:
+                val -= 0x100000000
+            commands.append((address, WRITE_CODES[code], val))
+        else:
+            commands.append((address, READ_CODES[code], None))
+    return commands
+
+def replay(filename, speed, timeout):
+    """
+    Repeat every captured command through TC3625_Serial. Returns the
+    number of transactions, number of errors and elapsed time.
+    """
+    commands = captured_commands(filename)
+    dev = TC3625_Serial(port=TC3625_Replay(filename, speed=speed, timeout=timeout),
+                        timeout=timeout)
+    dev.open()
+    errors = 0
+    t0 = time.time()
+    for address, cmd, val in commands:
+        try:
+            if val == None:
+                dev.read(cmd, address)
+            else:
+                dev.write(cmd, val, address)
+        except IOError:
+            errors += 1
+    elapsed = time.time() - t0
+    dev.close()
+    return len(commands), errors, elapsed
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='%prog [options] capture_file')
+    parser.add_option('--print', dest='print_records', action='store_true', default=False,
+            help='print the captured records')
+    parser.add_option('--speed', type='float', default=None,
+            help='replay speed relative to the capture, default is maximum speed')
+    parser.add_option('--timeout', type='float', default=0.5,
+            help='response timeout in seconds')
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('expected a capture file')
+
+    if opts.print_records:
+        print_capture(args[0])
+    n, errors, elapsed = replay(args[0], opts.speed, opts.timeout)
+    print '%d transactions, %d errors, %.3f s, %.1f us per transaction'%(
+        n, errors, elapsed, 1e6*elapsed/max(n, 1))
@@ -26,3 +26,26 @@ License along with tc3625.  If not, see
 ----------------------------------------------------------------------
 """
 from tc3625 import *
+from tc3625_bus import TC3625_Bus
+from tc3625_queue import TC3625_CommandQueue
+from tc3625_metrics import TC3625_Metrics
+from tc3625_trace import TC3625_TraceHook, TC3625_ChromeTrace
+from tc3625_retry import TC3625_RetryPolicy, TC3625_CircuitBreaker
+from tc3625_retry import TC3625_CircuitOpenError
+from tc3625_codec import TC3625_ChecksumError, TC3625_NakError
+from tc3625_codec import TC3625_FrameError, TC3625_TimeoutError, TC3625_LinkError
+from tc3625_capture import TC3625_Replay
+from tc3625_fleet import TC3625Fleet
+from tc3625_server import TC3625_Server, TC3625_Client
+try:
+    from tc3625_async import AsyncTC3625
+except ImportError:
+    # asyncio (or trollius) not available
+    pass
+try:
+    from tc3625_telemetry import TC3625_RingBuffer
+    from tc3625_log import TC3625_LogWriter, TC3625_LogReader
+    from tc3625_shard import TC3625_ShardedFleet, TC3625_SharedTable
+except ImportError:
+    # numpy not available
+    pass
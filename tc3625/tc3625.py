@@ -50,6 +50,8 @@ Functions:
   dec2int
   amp2cnt
   cnt2amp
+  set_order
+  method_stub
 
 
 Note: some functions may require special case treatment such as: 
@@ -59,13 +61,52 @@ Author: Will Dickson
 
 -------------------------------------------------------------------
 """
-from tc3625_serial import TC3625_Serial
+import time
+import logging
+from collections import OrderedDict
+import warnings
+import threading
+from tc3625_serial import TC3625_Serial, DFLT_ADAPTIVE_TIMEOUT
+from tc3625_serial import VOLATILE_CMDS
+from tc3625_queue import TC3625_CommandQueue
+from tc3625_metrics import TC3625_Metrics
+from tc3625_clock import monotonic
+from tc3625_retry import TC3625_RetryPolicy, TC3625_CircuitBreaker
+from tc3625_retry import TC3625_CircuitOpenError
+from tc3625_codec import TC3625_LinkError
+from tc3625_transport import LINK_EXCEPTIONS
+from tc3625_poller import TC3625_Poller, DFLT_SCAN_LIST
 
 # Default port settings
 DFLT_PORT='/dev/ttyS0'
 DFLT_TIMEOUT=2.0
 DFLT_BAUDRATE=9600
 DFLT_MAX_ATTEMPT=10
+DFLT_ADDRESS='00'
+DFLT_CACHE_TTL=None
+
+log = logging.getLogger('tc3625')
+
+# Reads of a register started within this many seconds of the start of
+# a read of the same register share its result. With 0 only reads made
+# while the other read is in progress share it.
+DFLT_COALESCE_WINDOW=0.0
+
+# Properties written first and last by TC3625.set_by_dict, see set_order
+SET_ORDER_FIRST=['eeprom write', 'working units']
+SET_ORDER_LAST=['power state', 'alarm latch reset']
+
+# Serial commands which change the units of the temperature registers.
+# Writing these invalidates the register cache.
+UNIT_CMDS=['temperature working units']
+
+# Serial command of the eeprom write setting. While it is off written
+# values are kept in RAM only, and are restored by TC3625 after
+# reconnecting.
+EEPROM_CMD='eeprom write enable'
+
+# Minimum time between attempts to reopen a lost connection
+DFLT_RECONNECT_INTERVAL=1.0
 
 AMPS_PER_COUNT=2.5
 
@@ -564,9 +605,74 @@ def cnt2amp(x):
     """
     return x*AMPS_PER_COUNT
 
+def set_order(prop_list):
+    """
+    Sort a list of METHOD_DICT keys into a dependency safe order for
+    writing: the properties in SET_ORDER_FIRST (eeprom write mode and
+    working units, which determine how the other values are stored and
+    interpreted), then type settings such as the control type, then
+    numeric settings, then the properties in SET_ORDER_LAST (power
+    state and alarm latch reset).
+    """
+    def rank(k):
+        if k in SET_ORDER_FIRST:
+            return (0, SET_ORDER_FIRST.index(k), k)
+        if k in SET_ORDER_LAST:
+            return (3, SET_ORDER_LAST.index(k), k)
+        if isinstance(METHOD_DICT[k].get('set'), Set_Type):
+            return (1, 0, k)
+        return (2, 0, k)
+    return sorted(prop_list, key=rank)
 
-# Classes implementing get and set methods for tc3625 device interface
-class Get_Type:
+def method_stub(meth_str):
+    """
+    Convert a METHOD_DICT key to the stub used in the names of the
+    generated methods, e.g. 'power output' -> '_power_output' for
+    get_power_output.
+    """
+    meth_stub = ''
+    for s in meth_str.split():
+        meth_stub += '_%s'%(s,)
+    return meth_stub
+
+
+# Classes implementing get and set methods for tc3625 device interface.
+# The instances in METHOD_DICT are shared by all TC3625 objects and are
+# called with the TC3625 object as their first argument, see the
+# get_*/set_* methods generated at the end of this file. The conversion
+# between raw integer values and python values is kept in decode/encode
+# so that it can also be used by the asyncio interface (see
+# tc3625_async.py).
+class Method:
+
+    """
+    Base of the get and set method classes. A call prints the method's
+    warning, if any, and is reported to the tracing hooks of the TC3625
+    object (see tc3625_trace.py).
+    """
+
+    def __call__(self,parent,*args):
+        if self.warning != None:
+            warnings.warn(self.warning)
+        hooks = parent.hooks
+        if not hooks:
+            return self.call(parent,*args)
+        t = monotonic()
+        for hook in hooks:
+            hook.on_call(self.call_name,t)
+        try:
+            val = self.call(parent,*args)
+        except Exception, err:
+            t = monotonic()
+            for hook in hooks:
+                hook.on_return(self.call_name,t,err)
+            raise
+        t = monotonic()
+        for hook in hooks:
+            hook.on_return(self.call_name,t,None)
+        return val
+
+class Get_Type(Method):
     def __init__(self,type,doc_str=None,warning=None):
         self.type=type
         self.itype=dict([[v,k] for k,v in type.items()])
@@ -574,31 +680,40 @@ class Get_Type:
         self.warning=warning
         self.cmd=None
         self.call_name=None
-        self.parent=None
 
-    def __call__(self):
-        if self.warning != None:
-            print self.warning
-        val =self.parent._get_value(self.cmd)
+    def call(self,parent):
+        val =parent._get_value(self.cmd)
+        return self.decode(val)
+
+    def decode(self,val):
         try:
             val_str = self.itype[val]
         except KeyError:
             raise IOError, 'unknown type %d from %s'%(val, self.call_name,)       
         return val_str
 
-class Get_Mask:
+class Get_Mask(Method):
     def __init__(self,maskdict,doc_str=None,warning=None):
         self.maskdict=maskdict
         self.__doc__=doc_str
         self.warning=warning
         self.cmd=None
         self.call_name=None
-        self.parent=None
+        # Decoded values for every mask made of the known bits
+        nbits = max(maskdict.values()) + 1
+        self.table=[self._decode(val) for val in range(1<<nbits)]
         
-    def __call__(self):
-        if self.warning != None:
-            print self.warning
-        val =self.parent._get_value(self.cmd)
+    def call(self,parent):
+        val =parent._get_value(self.cmd)
+        return self.decode(val)
+
+    def decode(self,val):
+        if 0 <= val < len(self.table):
+            flag, val_list = self.table[val]
+            return flag, list(val_list)
+        return self._decode(val)
+
+    def _decode(self,val):
         flag, val_list = False, []
         for k in self.maskdict:
             bit = self.maskdict[k]
@@ -607,20 +722,20 @@ class Get_Mask:
                 val_list.append(k)
         return flag,val_list
             
-class Get_Num:
+class Get_Num(Method):
     def __init__(self,convert=None,range=None,doc_str=None,warning=None):
         self.convert=convert
         self.range=range
-        self.__doc=doc_str
+        self.__doc__=doc_str
         self.warning=warning
         self.cmd=None
         self.call_name=None
-        self.parent=None
 
-    def __call__(self):
-        if self.warning != None:
-            print self.warning
-        val =self.parent._get_value(self.cmd)
+    def call(self,parent):
+        val =parent._get_value(self.cmd)
+        return self.decode(val)
+
+    def decode(self,val):
         if self.convert != None:
             val = self.convert(val)
         if self.range!=None:
@@ -629,27 +744,25 @@ class Get_Num:
                 raise IOError, 'value %s out of range from %s'%(str(val),self.call_name,)
         return val
               
-class Set_Type:
+class Set_Type(Method):
     def __init__(self,type,doc_str=None,warning=None):
         self.type=type
         self.__doc__=doc_str
         self.warning=warning
         self.cmd=None
         self.call_name=None
-        self.parent=None
 
-    def __call__(self,val):
-        if self.warning != None:
-            print self.warning
+    def call(self,parent,val):
+        parent._set_value(self.cmd,self.encode(val))
 
+    def encode(self,val):
         try:
             val_int = self.type[val]
         except KeyError:
             raise ValueError, 'unknown type %s for %s'%(str(val), self.call_name,)
-        
-        self.parent._set_value(self.cmd,val_int)
+        return val_int
 
-class Set_Num:
+class Set_Num(Method):
     def __init__(self,convert=None,range=None,doc_str=None,warning=None):
         self.convert=convert
         self.range=range
@@ -657,31 +770,31 @@ class Set_Num:
         self.warning=warning
         self.cmd=None
         self.call_name=None
-        self.parent=None
 
-    def __call__(self,val):
-         if self.warning != None:
-            print self.warning
+    def call(self,parent,val):
+         parent._set_value(self.cmd,self.encode(val))
+
+    def encode(self,val):
          if self.range!=None:
              minval, maxval = self.range
              if val < minval or val > maxval:
                  raise IOError, 'value %s out of range from %s'%(str(val),self.call_name,)
          if self.convert!=None:
              val = self.convert(val)
-         self.parent._set_value(self.cmd,val)
+         return val
 
-class Set_NoArg:
+class Set_NoArg(Method):
     def __init__(self,doc_str=None,warning=None):
         self.__doc__=doc_str
         self.warning=warning
         self.cmd=None
         self.call_name=None
-        self.parent=None
 
-    def __call__(self):
-        if self.warning != None:
-            print self.warning
-        self.parent._set_value(self.cmd,0)
+    def call(self,parent):
+        parent._set_value(self.cmd,self.encode())
+
+    def encode(self):
+        return 0
         
        
 METHOD_DICT = {
@@ -1080,10 +1193,95 @@ METHOD_DICT = {
         },    
 }
 
+class _Flight:
+
+    """ A read in progress, shared by concurrent readers """
+
+    def __init__(self):
+        self.t_start=time.time()
+        self.done=threading.Event()
+        self.value=None
+        self.error=None
+
+class _NoLock:
+
+    """ Stands in for the command lock when a queue serializes commands """
+
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
 class TC3625:
     """
     High level python API for the TC-36-25 thermoelectric cooler
     temperature contollers.
+
+    Several controllers with different addresses can share one serial
+    line by passing the same TC3625_Bus as the bus argument.
+
+    With cache=True the raw values of the configuration registers are
+    cached. The first read of a configuration register goes to the
+    device, later reads are served from the cache until the entry is
+    older than its time to live (cache_ttl, None means no expiry) or is
+    invalidated. Writes update the cache with the value echoed by the
+    device. The registers in VOLATILE_CMDS are always read from the
+    device.
+
+    start_polling starts a TC3625_Poller which samples a scan list of
+    properties at per property rates from a background thread, the
+    latest samples are returned by get_latest. Commands are serialized
+    by a lock so the get_*/set_* methods can be used while polling.
+
+    TC3625 is thread safe. Reads of a register by several threads at
+    the same time share a single transaction (single-flight) - a read
+    started while a read of the same register is in progress, or
+    within coalesce_window seconds of its start, waits for and returns
+    its result. Writes are always sent and strictly serialized, and a
+    write ends the sharing of earlier reads of its register.
+
+    timeout is the longest time to wait for a response. With
+    adaptive_timeout the wait is cut to a few standard deviations above
+    the observed response time of the link, see TC3625_Serial.get_timeout.
+
+    port is a serial device name or a transport URL such as
+    tcp://host:port (see tc3625_transport.py), or a serial port like
+    object such as a TC3625_Replay of a capture. With capture set to a
+    file name all the serial traffic, from the opening of the port, is
+    recorded to that capture file.
+
+    With queue set to a TC3625_CommandQueue (or True for a queue of
+    its own) each transaction waits in the prioritized command queue
+    instead of behind the command lock, so safety commands overtake
+    telemetry and configuration reads of the same or other controllers
+    on the line (see tc3625_queue.py).
+
+    With metrics set to a TC3625_Metrics (or True for one of its own,
+    labelled with the port and address) the transactions, retries and
+    failures are counted and timed, see stats and tc3625_metrics.py.
+    Failed attempts are logged at debug level to the 'tc3625' logger.
+
+    Tracing hooks registered with add_hook are called on entry and exit
+    of the get_*/set_* calls and around every frame on the serial line,
+    see tc3625_trace.py.
+
+    Failed reads and writes are retried as allowed by retry_policy, a
+    TC3625_RetryPolicy (by default max_attempt attempts whatever the
+    error, without waiting in between). breaker is a
+    TC3625_CircuitBreaker (True for a default one, False for none, the
+    default) which fails requests fast with TC3625_CircuitOpenError
+    while the device is down, see tc3625_retry.py.
+
+    With reconnect=True (the default) a failure of the serial port
+    itself, e.g. a USB serial adapter which has been unplugged or
+    re-enumerated, closes the port and reopens it, at most every
+    reconnect_interval seconds, on the next read or write. Use a usb://
+    port URL to find the adapter by its serial number. The values
+    written while eeprom write was off, which the controller may have
+    lost, are then written again in their original order. Outages are
+    recorded in metrics. A controller on a shared TC3625_Bus or
+    TC3625_CommandQueue is not reconnected.
     """
     def __init__(self, 
                  port=DFLT_PORT, 
@@ -1092,59 +1290,168 @@ class TC3625:
                  max_attempt=DFLT_MAX_ATTEMPT,
                  open=True,
                  eeprom='off',
+                 address=DFLT_ADDRESS,
+                 bus=None,
+                 cache=False,
+                 cache_ttl=DFLT_CACHE_TTL,
+                 capture=None,
+                 coalesce_window=DFLT_COALESCE_WINDOW,
+                 queue=None,
+                 metrics=None,
+                 retry_policy=None,
+                 breaker=False,
+                 adaptive_timeout=DFLT_ADAPTIVE_TIMEOUT,
+                 reconnect=True,
+                 reconnect_interval=DFLT_RECONNECT_INTERVAL,
                  ):
-        self.port=port
-        self.timeout=timeout
-        self.baudrate=baudrate
-        self.max_attempt=max_attempt 
+        self._setup(
+            port=port,
+            timeout=timeout,
+            baudrate=baudrate,
+            max_attempt=max_attempt,
+            address=address,
+            bus=bus,
+            cache=cache,
+            cache_ttl=cache_ttl,
+            capture=capture,
+            coalesce_window=coalesce_window,
+            queue=queue,
+            metrics=metrics,
+            retry_policy=retry_policy,
+            breaker=breaker,
+            adaptive_timeout=adaptive_timeout,
+            reconnect=reconnect,
+            reconnect_interval=reconnect_interval,
+            )
         # Open serial connection
         if open==True:
             flag = self.open()
             if flag==False:
                 raise IOError, 'unable to open device'
       
-        # Generate methods
-        self.method_dict=METHOD_DICT
-        for meth_str in self.method_dict:
-            meth_stub = ''
-            for s in meth_str.split():
-                meth_stub += '_%s'%(s,)
-            cmd = self.method_dict[meth_str]['cmd']
-            get_str = 'get' + meth_stub
-            set_str = 'set' + meth_stub 
-            try:
-                get_method = self.method_dict[meth_str]['get']
-                get_method.cmd = cmd
-                get_method.call_name = get_str
-                get_method.parent = self
-                setattr(self,get_str,get_method)
-            except:
-                pass
-            try: 
-                set_method = self.method_dict[meth_str]['set']
-                set_method.cmd = cmd
-                set_method.parent = self
-                set_method.call_name = set_str
-                setattr(self,set_str,set_method)
-            except:
-                pass
-
         if eeprom=='off':
             self.set_eeprom_write('off')
 
-    def set_by_dict(self,prop_new):
+    def _setup(self,
+               port=DFLT_PORT,
+               timeout=DFLT_TIMEOUT,
+               baudrate=DFLT_BAUDRATE,
+               max_attempt=DFLT_MAX_ATTEMPT,
+               address=DFLT_ADDRESS,
+               bus=None,
+               cache=False,
+               cache_ttl=DFLT_CACHE_TTL,
+               capture=None,
+               coalesce_window=DFLT_COALESCE_WINDOW,
+               queue=None,
+               metrics=None,
+               retry_policy=None,
+               breaker=False,
+               adaptive_timeout=DFLT_ADAPTIVE_TIMEOUT,
+               reconnect=True,
+               reconnect_interval=DFLT_RECONNECT_INTERVAL,
+               ):
         """
-        Set deivce properties using dictionary
+        Set up the attributes of the object without opening the serial
+        connection, see __init__. Also used by subclasses which do not
+        talk to the device themselves (TC3625_Client).
+        """
+        self.port=port
+        self.timeout=timeout
+        self.baudrate=baudrate
+        self.max_attempt=max_attempt 
+        self.adaptive_timeout=adaptive_timeout
+        if retry_policy == None:
+            retry_policy = TC3625_RetryPolicy(
+                max_attempt=max_attempt,
+                timeout_attempt=max_attempt,
+                backoff=0.0,
+                )
+        self.retry_policy=retry_policy
+        if breaker == True:
+            breaker = TC3625_CircuitBreaker()
+        elif breaker == False:
+            breaker = None
+        self.breaker=breaker
+        self.address=address
+        self.bus=bus
+        self.capture=capture
+        self.cache_enabled=cache
+        self.cache_ttl=cache_ttl
+        self.cache_ttls={}
+        self.cache={}
+        if bus != None and queue != None:
+            raise ValueError, 'bus and queue can not both be given, queue the bus instead'
+        if metrics == True:
+            metrics = TC3625_Metrics(labels={'port': port, 'address': address})
+        self.metrics=metrics
+        self.hooks=[]
+        self.own_queue=queue==True
+        self.queue=queue
+        if queue != None:
+            self.lock=_NoLock()
+        else:
+            self.lock=threading.RLock()
+        self.coalesce_window=coalesce_window
+        self.inflight={}
+        self.inflight_lock=threading.Lock()
+        self.coalesced_reads=0
+        self.poller=None
+        # Reconnection is done by the owner of the serial line
+        self.reconnect=reconnect and bus == None and (queue == None or queue == True)
+        self.reconnect_interval=reconnect_interval
+        self.reconnect_lock=threading.Lock()
+        self.link_down=None
+        self.t_reconnect=0.0
+        self.restoring=False
+        self.eeprom_raw=None
+        self.ram_config=OrderedDict()
+        self.method_dict=METHOD_DICT
+
+    def set_by_dict(self,prop_new,diff=False):
+        """
+        Set deivce properties using dictionary. 
+
+        Properties are written in a dependency safe order, see
+        set_order. If diff is True the current value of each property
+        is read first (from the cache if it is enabled) and the property
+        is only written if its value, after conversion to the device's
+        integer representation, differs from the new value. Actions
+        such as alarm latch reset take no value (use None) and are
+        always sent.
+
+        Returns a list of (property, old value, new value) tuples for
+        the properties written, in the order they were written. The old
+        value is None if it was not read.
         """
         method_keys = self.method_dict.keys()
         for k in prop_new.keys():
             if not k in method_keys:
                 raise ValueError, 'unknown property %s'%(k,)
-            self.set(k,prop_new[k])
+            if not 'set' in self.method_dict[k]:
+                raise ValueError, 'unsettable property %s'%(k,)
+        changed = []
+        for k in set_order(prop_new.keys()):
+            val = prop_new[k]
+            old_val = None
+            set_method = self.method_dict[k]['set']
+            if diff and 'get' in self.method_dict[k] and not isinstance(set_method, Set_NoArg):
+                get_method = self.method_dict[k]['get']
+                cur = self._get_value(self.method_dict[k]['cmd'])
+                if int(set_method.encode(val)) == cur:
+                    continue
+                try:
+                    old_val = get_method.decode(cur)
+                except IOError:
+                    old_val = cur
+            self.set(k,val)
+            changed.append((k,old_val,val))
+        return changed
 
-    def set(self,prop_str,val):
+    def set(self,prop_str,val=None):
         """
-        Set device property by name value pair
+        Set device property by name value pair. Actions such as alarm
+        latch reset take no value, val is ignored.
         """
         if not prop_str in self.method_dict.keys():
             raise ValueError, 'unknown property %s'%(str(prop_str),)
@@ -1152,7 +1459,10 @@ class TC3625:
             set_method = self.method_dict[prop_str]['set']
         except KeyError:
             raise ValueError, 'unsettable property %s'%(str(prop_str,))
-        set_method(val)
+        if isinstance(set_method, Set_NoArg):
+            set_method(self)
+        else:
+            set_method(self,val)
             
     def get_all(self):
         """
@@ -1164,9 +1474,38 @@ class TC3625:
                 get_method = self.method_dict[k]['get']
             except:
                 continue
-            prop[k]=get_method()
+            prop[k]=get_method(self)
         return prop
 
+    def start_polling(self,scan_list=DFLT_SCAN_LIST,listeners=()):
+        """
+        Start polling the properties in scan_list, a dictionary of
+        property names and rates in Hz, from a background thread.
+        listeners are added to the poller (see TC3625_Poller.add_listener)
+        before it starts, so they see the first samples.
+        """
+        self.stop_polling()
+        self.poller = TC3625_Poller(self,scan_list)
+        for func in listeners:
+            self.poller.add_listener(func)
+        self.poller.start()
+        return self.poller
+
+    def stop_polling(self):
+        """ Stop background polling """
+        if self.poller != None:
+            self.poller.stop()
+            self.poller = None
+
+    def get_latest(self,prop_str):
+        """
+        Return (timestamp, value) of the latest polled sample of the
+        given property, or None if it has not been sampled yet.
+        """
+        if self.poller == None:
+            raise ValueError, 'polling not started'
+        return self.poller.get_latest(prop_str)
+
     def print_all(self):
         """
         Print all device properties
@@ -1177,58 +1516,375 @@ class TC3625:
         for k in prop_keys:
             print '%s: %s'%(k, prop[k])
 
+    def invalidate(self,prop_str=None):
+        """
+        Invalidate the cached value of the given property, or of all
+        properties if prop_str is None.
+        """
+        if prop_str == None:
+            self.cache.clear()
+            return
+        if not prop_str in self.method_dict.keys():
+            raise ValueError, 'unknown property %s'%(str(prop_str),)
+        self.cache.pop(self.method_dict[prop_str]['cmd'],None)
+
+    def set_cache_ttl(self,prop_str,ttl):
+        """
+        Set the time to live, in seconds, of the cached value of the
+        given property. None means the value does not expire.
+        """
+        if not prop_str in self.method_dict.keys():
+            raise ValueError, 'unknown property %s'%(str(prop_str),)
+        self.cache_ttls[self.method_dict[prop_str]['cmd']] = ttl
+
     def open(self):
         """ 
         Open serial connection to device. Note, by defualt the serial
         connection to the device is automatically open on
         initialization.
+
+        If the controller is on a shared TC3625_Bus or
+        TC3625_CommandQueue the bus or queue owns the serial connection
+        and must already be open.
         """
-        self.dev = TC3625_Serial(port=self.port)
+        if self.breaker != None:
+            self.breaker.reset()
+        if self.own_queue:
+            self.queue = TC3625_CommandQueue(TC3625_Serial(
+                port=self.port,
+                timeout=self.timeout,
+                baud_rate=self.baudrate,
+                address=self.address,
+                capture=self.capture,
+                metrics=self.metrics,
+                adaptive_timeout=self.adaptive_timeout,
+                ))
+            self.queue.dev.hooks = self.hooks
+            flag = self.queue.open()
+            self.dev = self.queue.device(self.address)
+            return flag
+        if self.queue != None:
+            self.dev = self.queue.device(self.address)
+            return self.dev.open()
+        if self.bus != None:
+            self.dev = self.bus.device(self.address)
+            return self.dev.open()
+        self.dev = TC3625_Serial(
+            port=self.port,
+            timeout=self.timeout,
+            baud_rate=self.baudrate,
+            address=self.address,
+            capture=self.capture,
+            metrics=self.metrics,
+            adaptive_timeout=self.adaptive_timeout,
+            )
+        self.dev.hooks = self.hooks
         flag = self.dev.open()
         return flag
         
     def close(self):
         """ Close serial conection to device """
+        self.stop_polling()
         self.dev.close()
+        if self.own_queue:
+            self.queue.close()
 
 
-    def _get_value(self,cmd): 
+    def _get_value(self,cmd,fresh=False): 
         """ 
-        Generic get commmand - tries max_attempt times to read value
-        from device using low level serial protocol.
+        Generic get commmand - reads value from device using low level
+        serial protocol, retrying as allowed by the retry policy. Values of
+        configuration registers are served from the cache if it is
+        enabled, unless fresh is True. Concurrent reads of the same
+        register share a single read, see the class documentation.
         """
-        cnt=0
-        while cnt < self.max_attempt:
+        if self.cache_enabled and not fresh and not cmd in VOLATILE_CMDS:
             try:
-                val = self.dev.read(cmd)
-                break
-            except IOError:
-                print '** warning IOError on read'
+                val, t = self.cache[cmd]
+                ttl = self.cache_ttls.get(cmd,self.cache_ttl)
+                if ttl == None or time.time() - t < ttl:
+                    return val
+            except KeyError:
                 pass
-            cnt+=1
-        if cnt==self.max_attempt:
-            raise IOError, 'max attempts reached for read'
+        self.inflight_lock.acquire()
+        try:
+            flight = self.inflight.get(cmd)
+            if flight != None and (not flight.done.isSet() or 
+                    time.time() - flight.t_start < self.coalesce_window):
+                self.coalesced_reads += 1
+                leader = False
+            else:
+                flight = _Flight()
+                self.inflight[cmd] = flight
+                leader = True
+        finally:
+            self.inflight_lock.release()
+        if not leader:
+            flight.done.wait()
+            if flight.error != None:
+                raise flight.error
+            return flight.value
+        try:
+            val = self._read_value(cmd)
+        except IOError, err:
+            flight.error = err
+            self._end_flight(cmd, flight)
+            raise
+        flight.value = val
+        if self.coalesce_window <= 0:
+            self._end_flight(cmd, flight)
+        else:
+            flight.done.set()
+        if self.cache_enabled and not cmd in VOLATILE_CMDS:
+            self.cache[cmd] = (val, time.time())
         return val
+
+    def _read_value(self,cmd):
+        """ Read the value of cmd from the device, retrying on errors """
+        self.lock.acquire()
+        try:
+            return self._attempt(cmd, 'read', cmd)
+        finally:
+            self.lock.release()
+
+    def _end_flight(self,cmd,flight):
+        """ Stop sharing the result of flight and wake its waiters """
+        self.inflight_lock.acquire()
+        try:
+            if self.inflight.get(cmd) is flight:
+                del self.inflight[cmd]
+        finally:
+            self.inflight_lock.release()
+        flight.done.set()
                 
     def _set_value(self,cmd,val):
         """
-        Generic set command - tries max_attempt times to set device
-        value using low level serial protocol.
+        Generic set command - sets device value using low level serial
+        protocol, retrying as allowed by the retry policy. The cache is updated
+        with the value echoed by the device.
         """
-        cnt=0
-        while cnt < self.max_attempt:
+        self.lock.acquire()
+        try:
+            # Later reads must not share a read from before the write
+            flight = self.inflight.get(cmd)
+            if flight != None and flight.done.isSet():
+                self._end_flight(cmd, flight)
             try:
-                val = self.dev.write(cmd,val)
-                break
+                val = self._attempt(cmd, 'write', cmd, val)
             except IOError:
-                print '** warning IOError on write'
-                pass
-            cnt+=1
-        if cnt==self.max_attempt:
-            raise IOError, 'max attempts reached for write'
+                # The write may still have reached the device
+                self.cache.pop(cmd,None)
+                raise
+            self._track_ram(cmd, val)
+        finally:
+            self.lock.release()
+        if self.cache_enabled:
+            if cmd in UNIT_CMDS:
+                self.cache.clear()
+            self.cache[cmd] = (val, time.time())
+        return val
+
+    def _attempt(self,cmd,kind,*args):
+        """
+        Call the read or write method (kind) of the device with args,
+        retrying on IOError as allowed by the retry policy and waiting
+        its backoff time between attempts. A lost connection is
+        reopened at the start of an attempt, a failure to reopen it
+        counts as a failed attempt. Fails fast if the circuit breaker is
+        open. The request is recorded in metrics.
+        """
+        metrics = self.metrics
+        if metrics != None:
+            t_start = time.time()
+        breaker = self.breaker
+        probe = False
+        if breaker != None:
+            try:
+                probe = breaker.allow()
+            except TC3625_CircuitOpenError:
+                if metrics != None:
+                    metrics.count('rejected', cmd)
+                raise
+        cnt=0
+        try:
+            while True:
+                try:
+                    if self.link_down != None and not self.restoring:
+                        self._reconnect()
+                    val = getattr(self.dev, kind)(*args)
+                    break
+                except IOError, err:
+                    log.debug('%s on %s of %s: %s', err.__class__.__name__, kind, cmd, err)
+                    cnt+=1
+                    if (isinstance(err, TC3625_LinkError) and self.reconnect and
+                            not self.restoring and self.link_down == None):
+                        log.warning('connection to %s lost: %s', self.port, err)
+                        self.link_down = time.time()
+                    delay = self.retry_policy.delay(err, cnt)
+                    if delay == None or probe:
+                        raise IOError, 'max attempts reached for %s (%s: %s)'%(
+                                kind, err.__class__.__name__, err)
+                    if delay > 0:
+                        time.sleep(delay)
+        except IOError:
+            if breaker != None:
+                breaker.failure()
+            if metrics != None:
+                if cnt > 1:
+                    metrics.count('retries', cmd, cnt - 1)
+                metrics.count('failures', cmd)
+                metrics.observe('request_time', cmd, time.time() - t_start)
+            raise
+        except:
+            # Not a failure of the device, but a probe must be ended
+            if probe:
+                breaker.failure()
+            raise
+        if breaker != None:
+            breaker.success()
+        if metrics != None:
+            if cnt > 0:
+                metrics.count('retries', cmd, cnt)
+            metrics.observe('request_time', cmd, time.time() - t_start)
         return val
 
+    def _reconnect(self):
+        """
+        Reopen the connection after a link error and restore the values
+        written while eeprom write was off. Raises TC3625_LinkError if
+        it can not be reopened, or if the last attempt was less than
+        reconnect_interval seconds ago.
+        """
+        self.reconnect_lock.acquire()
+        try:
+            t_down = self.link_down
+            if t_down == None:
+                # Reconnected by another thread
+                return
+            now = time.time()
+            if now - self.t_reconnect < self.reconnect_interval:
+                raise TC3625_LinkError, 'connection to %s lost'%(self.port,)
+            self.t_reconnect = now
+            self._close_dev()
+            try:
+                if self.open() == False:
+                    raise TC3625_LinkError, 'unable to open device'
+                self.link_down = None
+                self.restoring = True
+                try:
+                    self._restore()
+                finally:
+                    self.restoring = False
+            except LINK_EXCEPTIONS, err:
+                self.link_down = t_down
+                self._close_dev()
+                raise TC3625_LinkError, 'reconnect to %s failed: %s'%(self.port, err)
+        finally:
+            self.reconnect_lock.release()
+        outage = time.time() - t_down
+        log.warning('reconnected to %s after %.1f s', self.port, outage)
+        if self.metrics != None:
+            self.metrics.count('reconnects', '')
+            self.metrics.observe('outage_time', '', outage)
+
+    def _close_dev(self):
+        """ Close a connection which may have failed, ignoring errors """
+        try:
+            self.dev.close()
+            if self.own_queue:
+                self.queue.close()
+        except LINK_EXCEPTIONS:
+            pass
+
+    def _restore(self):
+        """
+        Write again the values written while eeprom write was off, in
+        the order they were written, with eeprom write off.
+        """
+        eeprom_raw = self.eeprom_raw
+        if eeprom_raw == None or (eeprom_raw != ON_OFF_TYPES['off'] and not self.ram_config):
+            return
+        self._set_value(EEPROM_CMD, ON_OFF_TYPES['off'])
+        for cmd, val in self.ram_config.items():
+            self._set_value(cmd, val)
+        if eeprom_raw != ON_OFF_TYPES['off']:
+            self._set_value(EEPROM_CMD, eeprom_raw)
+
+    def _track_ram(self,cmd,val):
+        """
+        Remember the values written while eeprom write is off, which the
+        controller loses when it is reset, so that they can be restored.
+        """
+        if cmd == EEPROM_CMD:
+            self.eeprom_raw = val
+        elif cmd in ACTION_CMDS:
+            pass
+        elif self.eeprom_raw == ON_OFF_TYPES['off']:
+            self.ram_config.pop(cmd, None)
+            self.ram_config[cmd] = val
+        else:
+            # Stored in eeprom as well
+            self.ram_config.pop(cmd, None)
+
+    def add_hook(self, hook):
+        """
+        Register a tracing hook, a TC3625_TraceHook. It is called on
+        entry and exit of the get_*/set_* methods and, unless the
+        controller is on a shared bus or queue, around every frame.
+        For a shared line register the hook with the TC3625_Serial of
+        the bus as well.
+        """
+        if not hook in self.hooks:
+            self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """ Unregister a tracing hook """
+        self.hooks.remove(hook)
+
+    def stats(self):
+        """
+        Returns the counters and latency histograms of the traffic with
+        the device (see TC3625_Metrics.stats), or None if metrics is not
+        set.
+        """
+        if self.metrics == None:
+            return None
+        return self.metrics.stats()
+
 # --------------------------------------------------------------------
 
+# Generate the get_*/set_* methods of TC3625 from METHOD_DICT. This is
+# done once for the class, the methods are plain python methods which
+# pass the TC3625 object to the shared Get_*/Set_* objects.
+
+def _make_get_method(get_method):
+    def method(self):
+        return get_method(self)
+    return method
+
+def _make_set_method(set_method):
+    if isinstance(set_method, Set_NoArg):
+        def method(self):
+            return set_method(self)
+    else:
+        def method(self,val):
+            return set_method(self,val)
+    return method
 
+for _meth_str in METHOD_DICT:
+    _cmd = METHOD_DICT[_meth_str]['cmd']
+    for _kind, _make in (('get',_make_get_method), ('set',_make_set_method)):
+        if _kind in METHOD_DICT[_meth_str]:
+            _obj = METHOD_DICT[_meth_str][_kind]
+            _obj.cmd = _cmd
+            _obj.call_name = _kind + method_stub(_meth_str)
+            _method = _make(_obj)
+            _method.__name__ = _obj.call_name
+            _method.__doc__ = _obj.__doc__
+            setattr(TC3625, _method.__name__, _method)
+del _meth_str, _cmd, _kind, _make, _obj, _method
 
+# Serial commands of actions rather than settings, these are not
+# restored after reconnecting
+ACTION_CMDS=[METHOD_DICT[k]['cmd'] for k in METHOD_DICT 
+             if isinstance(METHOD_DICT[k].get('set'), Set_NoArg)]
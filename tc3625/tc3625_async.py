@@ -0,0 +1,490 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: asyncio interface for the TC-36-25 thermoelectric cooler
+temperature controllers.
+
+TC3625_AsyncSerial is the asyncio counterpart of TC3625_Serial. The
+port, a serial device name or a transport URL (see tc3625_transport.py),
+is opened non-blocking and its file descriptor is watched by the event
+loop, so no thread is blocked while waiting for a response. Transports
+without a file descriptor (loop://, replay://) are polled while a
+response is awaited. Commands are queued per port and sent one at a
+time, the response is assembled with TC3625_Parser as bytes arrive.
+If the port fails or is hung up (e.g. a USB serial adapter has been
+unplugged) it is closed and the commands in progress and queued fail
+with TC3625_LinkError. There is no automatic reconnection - open the
+controller again.
+
+AsyncTC3625 is the asyncio counterpart of TC3625. It has the same
+get_*/set_* methods generated from METHOD_DICT, but each one returns an
+asyncio Future instead of blocking. The futures can be awaited (or
+yielded from) in a coroutine, so one event loop can drive many
+controllers concurrently.
+
+Requires asyncio, or trollius on python 2.
+
+Classes:
+  TC3625_AsyncSerial
+  AsyncTC3625
+
+Usage:
+
+  ctlr = AsyncTC3625(port='/dev/ttyUSB0')
+
+  # In a coroutine
+  yield From(ctlr.ready)
+  temp = yield From(ctlr.get_input1())
+  yield From(ctlr.set_setpt(25.0))
+  prop = yield From(ctlr.get_all())
+
+  ctlr.close()
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import warnings
+import serial
+from collections import deque
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+from tc3625_serial import SERIAL_CMDS
+from tc3625_codec import TC3625_Codec, TC3625_Parser
+from tc3625_codec import TC3625_TimeoutError, TC3625_LinkError
+from tc3625_transport import open_transport, LINK_EXCEPTIONS
+from tc3625 import METHOD_DICT, Set_NoArg, method_stub, log
+from tc3625 import DFLT_PORT, DFLT_TIMEOUT, DFLT_BAUDRATE
+from tc3625 import DFLT_MAX_ATTEMPT, DFLT_ADDRESS
+
+READ_CHUNK_SIZE=256
+
+# Seconds between reads of a transport without a file descriptor while
+# a response is awaited
+POLL_INTERVAL=0.002
+
+
+class TC3625_AsyncSerial:
+
+    """
+    Implementation of the low level serial protocol for TC3625 on an
+    asyncio event loop.
+    """
+
+    def __init__(self,
+                 port=DFLT_PORT,
+                 timeout=DFLT_TIMEOUT,
+                 baud_rate=DFLT_BAUDRATE,
+                 address=DFLT_ADDRESS,
+                 loop=None,
+                 ):
+        self.port=port
+        self.timeout=timeout
+        self.baud_rate=baud_rate
+        self.address=address
+        if loop == None:
+            loop = asyncio.get_event_loop()
+        self.loop=loop
+        self.serial_cmds=SERIAL_CMDS
+        self.codec=TC3625_Codec(self.address,self.serial_cmds)
+        self.codecs={self.address: self.codec}
+        self.parser=TC3625_Parser(self.codec)
+        self.queue=deque()
+        self.current=None
+        self.timer=None
+        self.poll_timer=None
+        self.serial=None
+        self.fd=None
+
+    def get_codec(self, address=None):
+        """ Get the frame codec for the given controller address """
+        if address == None:
+            return self.codec
+        try:
+            return self.codecs[address]
+        except KeyError:
+            codec = TC3625_Codec(address,self.serial_cmds)
+            self.codecs[address] = codec
+            return codec
+
+    def open(self):
+        """
+        Open the port in non-blocking mode and register it with the
+        event loop. port is a device name or a transport URL.
+        """
+        self.serial = open_transport(self.port, self.timeout, self.baud_rate)
+        self.serial.timeout = 0
+        try:
+            self.fd = self.serial.fileno()
+        except (AttributeError, NotImplementedError, serial.SerialException):
+            # Polled instead
+            self.fd = None
+        if self.fd != None:
+            self.loop.add_reader(self.fd, self._on_readable)
+        return self.serial.isOpen()
+
+    def close(self, error=None):
+        """
+        Close serial port. Commands which have not completed fail with
+        error, by default IOError.
+        """
+        if self.serial == None:
+            return
+        if error == None:
+            error = IOError('serial port closed')
+        if self.fd != None:
+            self.loop.remove_reader(self.fd)
+            self.fd = None
+        try:
+            self.serial.close()
+        except LINK_EXCEPTIONS:
+            # Already failed
+            pass
+        self.serial = None
+        pending = list(self.queue)
+        self.queue.clear()
+        if self.current != None:
+            pending.insert(0, self.current)
+            self.current = None
+        if self.timer != None:
+            self.timer.cancel()
+            self.timer = None
+        if self.poll_timer != None:
+            self.poll_timer.cancel()
+            self.poll_timer = None
+        for frame, future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def write(self, cmd, val, address=None):
+        """
+        Generic write command, see TC3625_Serial.write. Returns a
+        Future for the value echoed by the controller.
+        """
+        if self.serial_cmds[cmd]['write']==None:
+            raise ValueError, 'write unsupported for command %s'%(cmd,)
+        frame = self.get_codec(address).write_frame(cmd,val)
+        return self._submit(frame)
+
+    def read(self, cmd, address=None):
+        """
+        Generic read command, see TC3625_Serial.read. Returns a Future
+        for the value read from the controller.
+        """
+        if self.serial_cmds[cmd]['read']==None:
+            raise ValueError, 'read unsupported for command %s'%(cmd,)
+        frame = self.get_codec(address).read_frames[cmd]
+        return self._submit(frame)
+
+    def _submit(self, frame):
+        """ Queue command frame, returns Future for the response value """
+        future = asyncio.Future(loop=self.loop)
+        if self.serial == None:
+            future.set_exception(IOError('serial port not open'))
+            return future
+        self.queue.append((frame, future))
+        if self.current == None:
+            self._send_next()
+        return future
+
+    def _send_next(self):
+        """ Send the next queued command frame """
+        while self.queue:
+            frame, future = self.queue.popleft()
+            if future.cancelled():
+                continue
+            self.current = (frame, future)
+            self.parser.reset()
+            try:
+                self.serial.flushInput()
+                self.serial.write(frame)
+            except LINK_EXCEPTIONS, e:
+                self._link_failed(e)
+                return
+            self.timer = self.loop.call_later(self.timeout, self._on_timeout)
+            if self.fd == None:
+                self.poll_timer = self.loop.call_later(POLL_INTERVAL, self._poll)
+            return
+
+    def _on_readable(self):
+        """ Event loop callback - data is available on the serial port """
+        try:
+            data = self.serial.read(READ_CHUNK_SIZE)
+        except LINK_EXCEPTIONS, e:
+            self._link_failed(e)
+            return
+        if not data:
+            # Readable without data - end of file or hang up
+            self._link_failed(IOError('port closed by the other end'))
+            return
+        self._on_data(data)
+
+    def _poll(self):
+        """ Event loop callback - read a transport without a file descriptor """
+        self.poll_timer = None
+        if self.current == None:
+            return
+        try:
+            data = self.serial.read(READ_CHUNK_SIZE)
+        except LINK_EXCEPTIONS, e:
+            self._link_failed(e)
+            return
+        if data:
+            self._on_data(data)
+        if self.current != None and self.poll_timer == None:
+            self.poll_timer = self.loop.call_later(POLL_INTERVAL, self._poll)
+
+    def _link_failed(self, err):
+        """
+        The port has failed - stop watching it, close it and fail the
+        current and queued commands with TC3625_LinkError.
+        """
+        log.warning('serial port %s failed: %s', self.port, err)
+        self.close(TC3625_LinkError('%s: %s'%(err.__class__.__name__, err)))
+
+    def _on_data(self, data):
+        """ Feed received data to the parser and complete the current command """
+        if self.current == None:
+            return
+        self.parser.feed(data)
+        try:
+            val = self.parser.next_value()
+        except IOError, e:
+            self._finish(exception=e)
+            return
+        if val != None:
+            self._finish(result=val)
+
+    def _on_timeout(self):
+        """ Event loop callback - no response within timeout """
+        self.timer = None
+        self._finish(exception=TC3625_TimeoutError('timeout waiting for response'))
+
+    def _finish(self, result=None, exception=None):
+        """ Complete the current command and send the next one """
+        if self.timer != None:
+            self.timer.cancel()
+            self.timer = None
+        if self.poll_timer != None:
+            self.poll_timer.cancel()
+            self.poll_timer = None
+        frame, future = self.current
+        self.current = None
+        if not future.done():
+            if exception != None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        self._send_next()
+
+
+class AsyncTC3625:
+
+    """
+    asyncio version of the high level python API for the TC-36-25
+    thermoelectric cooler temperature controllers. The get_*/set_*
+    methods are the same as for TC3625 but return Futures.
+    """
+
+    def __init__(self,
+                 port=DFLT_PORT,
+                 timeout=DFLT_TIMEOUT,
+                 baudrate=DFLT_BAUDRATE,
+                 max_attempt=DFLT_MAX_ATTEMPT,
+                 open=True,
+                 eeprom='off',
+                 address=DFLT_ADDRESS,
+                 loop=None,
+                 ):
+        self.port=port
+        self.timeout=timeout
+        self.baudrate=baudrate
+        self.max_attempt=max_attempt
+        self.address=address
+        if loop == None:
+            loop = asyncio.get_event_loop()
+        self.loop=loop
+        self.method_dict=METHOD_DICT
+        # Future which completes once the initial settings have been sent
+        self.ready=asyncio.Future(loop=self.loop)
+        self.ready.set_result(None)
+        if open==True:
+            flag = self.open()
+            if flag==False:
+                raise IOError, 'unable to open device'
+            if eeprom=='off':
+                self.ready = self.set_eeprom_write('off')
+
+    def open(self):
+        """ Open serial connection to device """
+        self.dev = TC3625_AsyncSerial(
+            port=self.port,
+            timeout=self.timeout,
+            baud_rate=self.baudrate,
+            address=self.address,
+            loop=self.loop,
+            )
+        return self.dev.open()
+
+    def close(self):
+        """ Close serial conection to device """
+        self.dev.close()
+
+    def set(self,prop_str,val=None):
+        """
+        Set device property by name value pair. Returns a Future.
+        Actions such as alarm latch reset take no value, val is ignored.
+        """
+        if not prop_str in self.method_dict.keys():
+            raise ValueError, 'unknown property %s'%(str(prop_str),)
+        if not 'set' in self.method_dict[prop_str]:
+            raise ValueError, 'unsettable property %s'%(str(prop_str,))
+        method = getattr(self,'set' + method_stub(prop_str))
+        if isinstance(self.method_dict[prop_str]['set'], Set_NoArg):
+            return method()
+        return method(val)
+
+    def get_all(self):
+        """
+        Get all device properties. Returns a Future for a dictionary of
+        property values.
+        """
+        prop = {}
+        result = asyncio.Future(loop=self.loop)
+        keys = [k for k in self.method_dict if 'get' in self.method_dict[k]]
+        def on_done(k, future):
+            if result.done():
+                return
+            if future.cancelled():
+                result.cancel()
+                return
+            if future.exception() != None:
+                result.set_exception(future.exception())
+                return
+            prop[k] = future.result()
+            if len(prop) == len(keys):
+                result.set_result(prop)
+        for k in keys:
+            future = getattr(self,'get' + method_stub(k))()
+            future.add_done_callback(lambda f, k=k: on_done(k, f))
+        return result
+
+    def _get_value(self,cmd):
+        """
+        Generic get command - tries max_attempt times to read value
+        from device. Returns a Future.
+        """
+        return self._attempt(lambda: self.dev.read(cmd), 'read')
+
+    def _set_value(self,cmd,val):
+        """
+        Generic set command - tries max_attempt times to set device
+        value. Returns a Future.
+        """
+        return self._attempt(lambda: self.dev.write(cmd,val), 'write')
+
+    def _attempt(self, request, kind):
+        """
+        Issue request, retrying on IOError up to max_attempt times.
+        """
+        result = asyncio.Future(loop=self.loop)
+        state = {'cnt': 0}
+        def on_done(future):
+            if result.cancelled():
+                return
+            if future.cancelled():
+                result.cancel()
+                return
+            if future.exception() == None:
+                result.set_result(future.result())
+                return
+            if not isinstance(future.exception(), IOError):
+                result.set_exception(future.exception())
+                return
+            if isinstance(future.exception(), TC3625_LinkError):
+                # The port has been closed, retrying can not succeed
+                result.set_exception(future.exception())
+                return
+            err = future.exception()
+            log.debug('%s on %s: %s', err.__class__.__name__, kind, err)
+            state['cnt'] += 1
+            if state['cnt'] == self.max_attempt:
+                result.set_exception(IOError('max attempts reached for %s'%(kind,)))
+                return
+            request().add_done_callback(on_done)
+        request().add_done_callback(on_done)
+        return result
+
+    def _then(self, future, func):
+        """
+        Returns a Future for func applied to the result of future.
+        """
+        result = asyncio.Future(loop=self.loop)
+        def on_done(future):
+            if result.cancelled():
+                return
+            if future.cancelled():
+                result.cancel()
+                return
+            if future.exception() != None:
+                result.set_exception(future.exception())
+                return
+            try:
+                result.set_result(func(future.result()))
+            except Exception, e:
+                result.set_exception(e)
+        future.add_done_callback(on_done)
+        return result
+
+# --------------------------------------------------------------------
+# Generate get/set methods from METHOD_DICT
+
+def _make_get_method(get_method, cmd):
+    def method(self):
+        if get_method.warning != None:
+            warnings.warn(get_method.warning)
+        return self._then(self._get_value(cmd), get_method.decode)
+    return method
+
+def _make_set_method(set_method, cmd):
+    def method(self, *args):
+        if set_method.warning != None:
+            warnings.warn(set_method.warning)
+        return self._set_value(cmd, set_method.encode(*args))
+    return method
+
+for _meth_str in METHOD_DICT:
+    _cmd = METHOD_DICT[_meth_str]['cmd']
+    for _kind, _make in (('get',_make_get_method), ('set',_make_set_method)):
+        if _kind in METHOD_DICT[_meth_str]:
+            _method = _make(METHOD_DICT[_meth_str][_kind], _cmd)
+            _method.__name__ = _kind + method_stub(_meth_str)
+            _method.__doc__ = METHOD_DICT[_meth_str][_kind].__doc__
+            setattr(AsyncTC3625, _method.__name__, _method)
+del _meth_str, _cmd, _kind, _make, _method
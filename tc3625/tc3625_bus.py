@@ -0,0 +1,213 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Shared multi-drop bus for several TC-36-25 controllers on one
+serial line (e.g. RS-485).
+
+The bus owns a single TC3625_Serial connection and serializes
+transactions from any number of addressed controllers. Only one
+transaction is on the line at a time. When several controllers are
+waiting, the line is granted to them in round-robin order, so a
+controller issuing a long sequence of commands (e.g. get_all) can not
+starve the others - their commands are interleaved one transaction at
+a time.
+
+Classes:
+  TC3625_Bus
+  TC3625_BusDevice
+
+Usage:
+
+  # Open the shared line
+  bus = TC3625_Bus(port='/dev/ttyUSB0')
+  bus.open()
+
+  # High level controllers on the bus
+  ctlr1 = TC3625(address='01', bus=bus)
+  ctlr2 = TC3625(address='02', bus=bus)
+
+  # Low level access to a controller on the bus
+  val = bus.read(cmd_str, '01')
+  val = bus.write(cmd_str, val, '02')
+
+  bus.close()
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import threading
+from collections import deque
+from tc3625_serial import TC3625_Serial
+from tc3625_serial import DFLT_PORT, DFLT_TIMEOUT, DFLT_BAUDRATE, DFLT_ADAPTIVE_TIMEOUT
+
+
+class TC3625_Bus:
+
+    """
+    Serial line shared by several addressed TC-36-25 controllers.
+    """
+
+    def __init__(self,
+                 port=DFLT_PORT,
+                 timeout=DFLT_TIMEOUT,
+                 baud_rate=DFLT_BAUDRATE,
+                 metrics=None,
+                 adaptive_timeout=DFLT_ADAPTIVE_TIMEOUT,
+                 ):
+        self.serial=TC3625_Serial(port=port,timeout=timeout,baud_rate=baud_rate,metrics=metrics,
+                                  adaptive_timeout=adaptive_timeout)
+        self.cond=threading.Condition()
+        self.pending={}
+        self.rr_order=deque()
+        self.busy=False
+        self.granted=None
+        # Running pollers of the controllers on the bus, which share
+        # its wire time, see TC3625_Poller
+        self.pollers=[]
+
+    def open(self):
+        """ Open the serial line """
+        return self.serial.open()
+
+    def close(self):
+        """ Close the serial line """
+        self.serial.close()
+
+    def isOpen(self):
+        """ Returns True if the serial line is open """
+        try:
+            return self.serial.serial.isOpen()
+        except AttributeError:
+            return False
+
+    def device(self, address):
+        """
+        Returns a TC3625_BusDevice for the controller with the given
+        address. This has the same read/write interface as
+        TC3625_Serial.
+        """
+        return TC3625_BusDevice(self, address)
+
+    def read(self, cmd, address):
+        """
+        Read value for command string from the controller with the
+        given address.
+        """
+        self._acquire(address)
+        try:
+            return self.serial.read(cmd,address)
+        finally:
+            self._release()
+
+    def write(self, cmd, val, address):
+        """
+        Write value for command string to the controller with the given
+        address.
+        """
+        self._acquire(address)
+        try:
+            return self.serial.write(cmd,val,address)
+        finally:
+            self._release()
+
+    def _acquire(self, address):
+        """
+        Wait until the line is granted to this request. Requests are
+        queued per address and the addresses are served round-robin.
+        """
+        ticket = object()
+        self.cond.acquire()
+        try:
+            try:
+                queue = self.pending[address]
+            except KeyError:
+                queue = deque()
+                self.pending[address] = queue
+                self.rr_order.append(address)
+            queue.append(ticket)
+            self._grant()
+            while self.granted is not ticket:
+                self.cond.wait()
+        finally:
+            self.cond.release()
+
+    def _release(self):
+        """ Release the line and grant it to the next request """
+        self.cond.acquire()
+        try:
+            self.busy = False
+            self.granted = None
+            self._grant()
+        finally:
+            self.cond.release()
+
+    def _grant(self):
+        """
+        Grant the line to the first waiting request of the next address
+        in round-robin order. Must be called with self.cond held.
+        """
+        if self.busy or not self.rr_order:
+            return
+        address = self.rr_order.popleft()
+        queue = self.pending[address]
+        self.granted = queue.popleft()
+        if queue:
+            self.rr_order.append(address)
+        else:
+            del self.pending[address]
+        self.busy = True
+        self.cond.notifyAll()
+
+
+class TC3625_BusDevice:
+
+    """
+    A single addressed controller on a TC3625_Bus. Provides the same
+    read/write interface as TC3625_Serial so it can be used by TC3625
+    in its place.
+    """
+
+    def __init__(self, bus, address):
+        self.bus=bus
+        self.address=address
+
+    def open(self):
+        """ The line is opened by the bus - returns True if it is open """
+        return self.bus.isOpen()
+
+    def close(self):
+        """ The line is closed by the bus - nothing to do """
+        pass
+
+    def read(self, cmd):
+        """ Read value for command string from this controller """
+        return self.bus.read(cmd,self.address)
+
+    def write(self, cmd, val):
+        """ Write value for command string to this controller """
+        return self.bus.write(cmd,val,self.address)
@@ -0,0 +1,293 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Capture of the raw serial traffic of a TC3625_Serial
+connection and replay of captured sessions.
+
+A capture file is a short header followed by one record per chunk of
+data sent or received. Each record holds a monotonic timestamp
+(seconds since the start of the capture), the direction and the
+length of the data, followed by the data itself. Stale input discarded
+by flushInput before a command is sent is recorded too, so that a
+session can be replayed exactly.
+
+TC3625_Replay is a serial port like object which plays a capture back.
+Written frames are checked against the captured ones and the captured
+responses are returned at the recorded times (scaled by speed) or, if
+speed is None, as fast as they are read. Responses which timed out in
+the captured session time out again, so the retry and error handling
+paths see the same sequence of events.
+
+Classes:
+  TC3625_CaptureWriter
+  TC3625_CaptureSerial
+  TC3625_Replay
+
+Functions:
+  read_capture
+
+Usage:
+
+  # Capture the traffic of a controller
+  ctlr = TC3625(port='/dev/ttyUSB0')
+  ctlr.dev.start_capture('session.cap')
+  ...
+  ctlr.dev.stop_capture()
+
+  # Replay it at maximum speed
+  ctlr = TC3625(port=TC3625_Replay('session.cap', speed=None))
+
+  # Print it
+  for t, direction, data in read_capture('session.cap'):
+      print '%10.6f %s %r'%(t, direction, data)
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import time
+import struct
+from tc3625_clock import monotonic
+
+MAGIC='TC3625CP'
+VERSION=1
+HEADER_STRUCT=struct.Struct('<8sHd')
+RECORD_STRUCT=struct.Struct('<dBH')
+
+# Record directions
+SENT='>'
+RECEIVED='<'
+FLUSHED='x'
+DIRECTION_CODES={SENT: 0, RECEIVED: 1, FLUSHED: 2}
+DIRECTION_NAMES=dict([(v, k) for k, v in DIRECTION_CODES.items()])
+
+DFLT_REPLAY_TIMEOUT=2.0
+
+
+class TC3625_CaptureWriter:
+
+    """
+    Writes records of serial traffic to a capture file.
+    """
+
+    def __init__(self, filename):
+        self.filename=filename
+        self.fid=open(filename, 'wb')
+        self.start=monotonic()
+        self.fid.write(HEADER_STRUCT.pack(MAGIC, VERSION, time.time()))
+
+    def record(self, direction, data):
+        """ Record data sent, received or flushed, see DIRECTION_CODES """
+        if not data or self.fid == None:
+            return
+        t = monotonic() - self.start
+        self.fid.write(RECORD_STRUCT.pack(t, DIRECTION_CODES[direction], len(data)))
+        self.fid.write(data)
+
+    def flush(self):
+        if self.fid != None:
+            self.fid.flush()
+
+    def close(self):
+        if self.fid != None:
+            self.fid.close()
+            self.fid = None
+
+
+class TC3625_CaptureSerial:
+
+    """
+    Wraps a serial port object and records all the data written to and
+    read from it. Other attributes are passed through to the port.
+    """
+
+    def __init__(self, serial, capture):
+        self.serial=serial
+        self.capture=capture
+
+    def write(self, data):
+        self.capture.record(SENT, data)
+        return self.serial.write(data)
+
+    def read(self, size=1):
+        data = self.serial.read(size)
+        self.capture.record(RECEIVED, data)
+        return data
+
+    def flushInput(self):
+        waiting = self.serial.inWaiting()
+        if waiting:
+            self.capture.record(FLUSHED, self.serial.read(waiting))
+        self.serial.flushInput()
+
+    def __getattr__(self, name):
+        return getattr(self.serial, name)
+
+    def __setattr__(self, name, value):
+        if name == 'timeout':
+            self.serial.timeout = value
+        else:
+            self.__dict__[name] = value
+
+
+class TC3625_Replay:
+
+    """
+    Serial port like object replaying a capture file. speed scales the
+    recorded response times, speed=None replays as fast as possible.
+    """
+
+    def __init__(self, filename, speed=1.0, timeout=DFLT_REPLAY_TIMEOUT):
+        if speed != None and speed <= 0:
+            raise ValueError, 'speed must be positive or None'
+        self.filename=filename
+        self.speed=speed
+        self.timeout=timeout
+        self.records=list(read_capture(filename))
+        self.pos=0
+        self.pending=''
+        self.base=None
+        self.is_open=True
+
+    def isOpen(self):
+        return self.is_open
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def rewind(self):
+        """ Restart the replay from the beginning of the capture """
+        self.pos = 0
+        self.pending = ''
+        self.base = None
+
+    def write(self, data):
+        """
+        Consume the next captured frame, which must match data, and
+        make the responses which followed it available for reading.
+        """
+        # Drop the parts of the previous response which were not read
+        while self.pos < len(self.records) and self.records[self.pos][1] != SENT:
+            self.pos += 1
+        if self.pos == len(self.records):
+            raise IOError, 'end of capture'
+        t, direction, sent = self.records[self.pos]
+        if data != sent:
+            raise IOError, 'replay diverged at record %d: sent %r, captured %r'%(self.pos, data, sent)
+        self.pos += 1
+        self.pending = ''
+        self._set_base(t)
+        return len(data)
+
+    def read(self, size=1):
+        """
+        Read up to size bytes of captured response. Blocks until the
+        recorded (scaled) arrival time of the next chunk, or returns ''
+        after the timeout if the captured session timed out here.
+        """
+        if not self.pending:
+            if self.pos < len(self.records) and self.records[self.pos][1] == RECEIVED:
+                t, direction, data = self.records[self.pos]
+                wait = self._release_time(t) - time.time()
+                if self.timeout != None and wait > self.timeout:
+                    time.sleep(self.timeout)
+                    return ''
+                if wait > 0:
+                    time.sleep(wait)
+                self.pending = data
+                self.pos += 1
+            else:
+                # Nothing more was received before the next command
+                if self.speed != None and self.timeout != None:
+                    time.sleep(self.timeout)
+                return ''
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    def inWaiting(self):
+        cnt = len(self.pending)
+        i = self.pos
+        while i < len(self.records) and self.records[i][1] == RECEIVED:
+            if self._release_time(self.records[i][0]) > time.time():
+                break
+            cnt += len(self.records[i][2])
+            i += 1
+        return cnt
+
+    def flushInput(self):
+        """ Discard unread input, including the captured stale input """
+        self.pending = ''
+        if self.pos < len(self.records) and self.records[self.pos][1] == FLUSHED:
+            self.pos += 1
+
+    def flush(self):
+        pass
+
+    def _set_base(self, t):
+        """ Map capture time t to now """
+        if self.speed == None:
+            self.base = None
+        else:
+            self.base = time.time() - t/self.speed
+
+    def _release_time(self, t):
+        """ Replay time at which data captured at time t is available """
+        if self.base == None:
+            return 0.0
+        return self.base + t/self.speed
+
+
+def read_capture(filename):
+    """
+    Generator of the (timestamp, direction, data) records of a capture
+    file. direction is SENT, RECEIVED or FLUSHED.
+    """
+    fid = open(filename, 'rb')
+    try:
+        header = fid.read(HEADER_STRUCT.size)
+        if len(header) < HEADER_STRUCT.size:
+            raise IOError, '%s: short capture header'%(filename,)
+        magic, version, start_time = HEADER_STRUCT.unpack(header)
+        if magic != MAGIC:
+            raise IOError, '%s is not a tc3625 capture file'%(filename,)
+        if version != VERSION:
+            raise IOError, '%s: unsupported capture version %d'%(filename, version)
+        while True:
+            rec = fid.read(RECORD_STRUCT.size)
+            if len(rec) < RECORD_STRUCT.size:
+                # End of file, or a record cut short by a crash
+                break
+            t, code, length = RECORD_STRUCT.unpack(rec)
+            data = fid.read(length)
+            if len(data) < length:
+                break
+            yield t, DIRECTION_NAMES[code], data
+    finally:
+        fid.close()
@@ -0,0 +1,79 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Monotonic clock for timestamps and time intervals.
+
+Used for time intervals and the timestamps of captures and traces,
+which must not jump when the system clock is set. time.time() remains
+the clock of wall clock timestamps, e.g. of samples and log records.
+
+Functions:
+  monotonic
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import time
+
+
+def _clock_monotonic():
+    """
+    Return a function reading CLOCK_MONOTONIC through librt, or None
+    if it is not available.
+    """
+    try:
+        import ctypes
+        import ctypes.util
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+        clock_gettime = librt.clock_gettime
+    except (ImportError, OSError, AttributeError):
+        return None
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+    CLOCK_MONOTONIC = 1
+    def clock():
+        ts = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            raise OSError, 'clock_gettime failed'
+        return ts.tv_sec + 1e-9*ts.tv_nsec
+    return clock
+
+_monotonic_clock=getattr(time, 'monotonic', None) or _clock_monotonic()
+_last_time=[0.0]
+
+def monotonic():
+    """
+    Monotonic clock in seconds. Uses time.monotonic or CLOCK_MONOTONIC
+    where available, otherwise time.time() prevented from going
+    backwards.
+    """
+    if _monotonic_clock != None:
+        return _monotonic_clock()
+    t = max(time.time(), _last_time[0])
+    _last_time[0] = t
+    return t
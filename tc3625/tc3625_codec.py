@@ -0,0 +1,306 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Frame encoding and decoding for the TC-36-25 serial protocol.
+
+The codec does the byte level work of the low level serial protocol
+so that TC3625_Serial only has to move frames to and from the port.
+Read frames depend only on the address and the command code, so they
+are built once per address and looked up on every read. Write frames
+are assembled from precomputed per command prefixes and lookup tables
+for the hex digits and their checksum contributions. Responses are
+decoded in place from any buffer (str, bytearray or memoryview) with
+struct.unpack_from, so no intermediate slices are created.
+
+TC3625_Parser assembles responses from a byte stream. It scans for the
+(stx) character, checks that the frame is terminated by the (ack)
+character, and drops any garbage in between, so a stray or dropped
+byte costs one frame rather than misaligning every later response.
+
+Errors in a response raise subclasses of IOError, so that callers can
+tell them apart - TC3625_ChecksumError for a response whose checksum
+does not match, TC3625_NakError for the controller's reply that the
+checksum of the sent command was wrong and TC3625_FrameError for a
+malformed response. TC3625_TimeoutError is raised by TC3625_Serial
+when no response arrives and TC3625_LinkError when the port itself has
+failed, e.g. a USB serial adapter has been unplugged.
+
+Classes:
+  TC3625_Codec
+  TC3625_Parser
+  TC3625_ChecksumError
+  TC3625_NakError
+  TC3625_FrameError
+  TC3625_TimeoutError
+  TC3625_LinkError
+
+Usage:
+
+  codec = TC3625_Codec(address, serial_cmds)
+
+  # Precomputed read frame for a command string
+  frame = codec.read_frame(cmd)
+
+  # Write frame for a command string and signed integer value
+  frame = codec.write_frame(cmd, val)
+
+  # Decode the 12 byte response starting at offset in buf
+  val = codec.decode(buf, offset)
+
+  # Incremental parsing of a response stream
+  parser = TC3625_Parser(codec)
+  parser.feed(data)
+  val = parser.next_value() # None until a complete frame has arrived
+  n = parser.needed()       # bytes still needed to complete a frame
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import struct
+
+# Serial protocol constants
+ADDRESS='00'
+STX=chr(0x2a)
+ETX=chr(0x0d)
+ACK=chr(0x5e)
+
+SEND_SIZE_WRITE=16
+SEND_SIZE_READ=8
+RETURN_SIZE=12
+
+# Reply sent by the controller when the checksum of a command is wrong
+NAK_VALUE='X'*8
+
+# Lookup tables - two character lower case hex string for each byte
+# value and the sum of the character codes of that string. For decoding,
+# the value of each hex digit character code and, indexed by a pair of
+# character codes read as a big endian 16 bit integer, the byte value
+# of the pair and the sum of its character codes. Entries for non hex
+# characters are -1.
+HEX_BYTE=['%02x'%(_b,) for _b in range(256)]
+HEX_BYTE_SUM=[ord(_s[0])+ord(_s[1]) for _s in HEX_BYTE]
+HEX_DIGIT_VALUE=[-1]*256
+for _i, _c in enumerate('0123456789abcdef'):
+    HEX_DIGIT_VALUE[ord(_c)]=_i
+    HEX_DIGIT_VALUE[ord(_c.upper())]=_i
+del _i, _c
+HEX_PAIR_VALUE=[-1]*65536
+for _hi in range(256):
+    for _lo in range(256):
+        if HEX_DIGIT_VALUE[_hi] >= 0 and HEX_DIGIT_VALUE[_lo] >= 0:
+            HEX_PAIR_VALUE[(_hi<<8)|_lo]=(HEX_DIGIT_VALUE[_hi]<<4)|HEX_DIGIT_VALUE[_lo]
+HEX_PAIR_SUM=[(_p>>8)+(_p&0xff) for _p in range(65536)]
+del _b, _s, _hi, _lo, _p
+
+_STX_CODE=ord(STX)
+_ACK_CODE=ord(ACK)
+_NAK_PAIR=(ord(NAK_VALUE[0])<<8)|ord(NAK_VALUE[1])
+# stx, 4 value character pairs, checksum character pair, ack
+_RETURN_STRUCT=struct.Struct('>B5HB')
+
+
+class TC3625_ChecksumError(IOError):
+    """ Checksum of a response does not match its value """
+
+class TC3625_NakError(IOError):
+    """ The controller reports that the sent checksum was incorrect """
+
+class TC3625_FrameError(IOError):
+    """ Short response or invalid characters in a response """
+
+class TC3625_TimeoutError(IOError):
+    """ No complete response within the timeout """
+
+class TC3625_LinkError(IOError):
+    """ The serial port or connection has gone away """
+
+
+class TC3625_Codec:
+
+    """
+    Encodes command frames and decodes response frames for a single
+    controller address.
+    """
+
+    def __init__(self, address, serial_cmds):
+        if len(address) != 2:
+            raise ValueError, 'address must be a 2 character string'
+        self.address=address
+        self.serial_cmds=serial_cmds
+        self.read_frames={}
+        self.write_prefixes={}
+        for cmd, cmd_dict in serial_cmds.items():
+            if cmd_dict['read'] != None:
+                body = address + cmd_dict['read']
+                self.read_frames[cmd] = STX + body + _checksum(body) + ETX
+            if cmd_dict['write'] != None:
+                body = address + cmd_dict['write']
+                self.write_prefixes[cmd] = (STX + body, _char_sum(body))
+
+    def read_frame(self, cmd):
+        """
+        Return the precomputed read frame for the given command string.
+        """
+        try:
+            return self.read_frames[cmd]
+        except KeyError:
+            raise ValueError, 'read unsupported for command %s'%(cmd,)
+
+    def write_frame(self, cmd, val):
+        """
+        Return the write frame for the given command string and signed
+        integer value. The value is sent as 8 hex characters in twos
+        complement. Raises ValueError if it does not fit in 32 bits.
+        """
+        try:
+            prefix, cs = self.write_prefixes[cmd]
+        except KeyError:
+            raise ValueError, 'write unsupported for command %s'%(cmd,)
+        x = int(val)
+        if x < -0x80000000 or x > 0xffffffff:
+            raise ValueError, 'value %s out of 32 bit range for %s'%(val, cmd)
+        x &= 0xffffffff
+        b3 = x >> 24
+        b2 = (x >> 16) & 0xff
+        b1 = (x >> 8) & 0xff
+        b0 = x & 0xff
+        cs += HEX_BYTE_SUM[b3] + HEX_BYTE_SUM[b2] + HEX_BYTE_SUM[b1] + HEX_BYTE_SUM[b0]
+        return ''.join((
+            prefix,
+            HEX_BYTE[b3], HEX_BYTE[b2], HEX_BYTE[b1], HEX_BYTE[b0],
+            HEX_BYTE[cs & 0xff],
+            ETX,
+            ))
+
+    def decode(self, buf, offset=0):
+        """
+        Decode the RETURN_SIZE byte response which starts at offset in
+        buf and return the signed integer value. Raises IOError if the
+        response is short, if its checksum does not match, or if the
+        controller reports that the checksum of the sent command was
+        incorrect.
+        """
+        if len(buf) - offset < RETURN_SIZE:
+            raise TC3625_FrameError, 'short response, %d bytes'%(len(buf)-offset,)
+        stx, p0, p1, p2, p3, p_cs, ack = _RETURN_STRUCT.unpack_from(buf, offset)
+        cs = (HEX_PAIR_SUM[p0] + HEX_PAIR_SUM[p1] + HEX_PAIR_SUM[p2] + HEX_PAIR_SUM[p3]) & 0xff
+        if HEX_PAIR_VALUE[p_cs] != cs:
+            raise TC3625_ChecksumError, 'return checksum %s does not match calculated %s'%(
+                    chr(p_cs>>8) + chr(p_cs&0xff), HEX_BYTE[cs])
+        v3 = HEX_PAIR_VALUE[p0]
+        v2 = HEX_PAIR_VALUE[p1]
+        v1 = HEX_PAIR_VALUE[p2]
+        v0 = HEX_PAIR_VALUE[p3]
+        if v3 < 0 or v2 < 0 or v1 < 0 or v0 < 0:
+            if p0 == p1 == p2 == p3 == _NAK_PAIR:
+                raise TC3625_NakError, 'sent checksum incorrect'
+            raise TC3625_FrameError, 'invalid hex characters in response'
+        x = (v3 << 24) | (v2 << 16) | (v1 << 8) | v0
+        if x >= 0x80000000:
+            x -= 0x100000000
+        return x
+
+
+class TC3625_Parser:
+
+    """
+    Incremental parser for the response stream from the controller.
+    """
+
+    def __init__(self, codec):
+        self.codec=codec
+        self.buf=bytearray()
+        self.dropped=0
+
+    def reset(self):
+        """ Discard any buffered bytes """
+        del self.buf[:]
+
+    def feed(self, data):
+        """ Add received bytes to the parse buffer """
+        self.buf.extend(data)
+
+    def needed(self):
+        """
+        Return the number of bytes needed to complete the frame
+        currently being received.
+        """
+        self._sync()
+        return RETURN_SIZE - len(self.buf) if self.buf else RETURN_SIZE
+
+    def next_value(self):
+        """
+        Return the value of the next complete frame in the buffer, or
+        None if no complete frame has been received yet. Bytes which do
+        not belong to a frame are dropped. A complete frame with a bad
+        checksum, or the controller's bad checksum reply, is consumed
+        and raises IOError straight away.
+        """
+        buf = self.buf
+        while True:
+            self._sync()
+            if len(buf) < RETURN_SIZE:
+                return None
+            if buf[RETURN_SIZE-1] != _ACK_CODE:
+                # Not a frame boundary - resync on the next stx
+                del buf[:1]
+                self.dropped+=1
+                continue
+            try:
+                val = self.codec.decode(buf)
+            finally:
+                del buf[:RETURN_SIZE]
+            return val
+
+    def _sync(self):
+        """
+        Drop bytes preceeding the first stx in the buffer.
+        """
+        buf = self.buf
+        if buf and buf[0] != _STX_CODE:
+            n = buf.find(STX)
+            if n < 0:
+                n = len(buf)
+            del buf[:n]
+            self.dropped+=n
+
+# ------------------------------------------------------------------------------------
+# Utility functions
+
+def _char_sum(val):
+    """
+    Sum of the character codes of the given string
+    """
+    return sum(bytearray(val))
+
+def _checksum(val):
+    """
+    Two character hex checksum of the given string - same as
+    tc3625_serial.get_checksum.
+    """
+    return HEX_BYTE[_char_sum(val) & 0xff]
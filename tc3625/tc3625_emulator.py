@@ -0,0 +1,468 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Emulator for the TC-36-25 serial protocol on a pseudo-terminal.
+
+The emulator implements the full SERIAL_CMDS register map so that
+TC3625 and TC3625_Serial can be pointed at it, unchanged, instead of
+real hardware. Command checksums are checked and the controller's
+XXXXXXXX reply is sent for bad ones. Write registers are held in RAM
+and, when 'eeprom write enable' is set, in EEPROM as well. A power
+cycle reloads RAM from EEPROM. A simple first-order thermal plant,
+driven by the control settings, provides input1, input2, power output,
+output current and alarm status. Replies are delayed by the time the
+command and the reply would take on the wire at the configured baud
+rate. For testing error handling, a given fraction of the commands can
+be answered with a bad checksum reply or a corrupted response.
+
+Several emulated devices with different addresses can share one
+pseudo-terminal to emulate a multi-drop line.
+
+Classes:
+  TC3625_EmulatedDevice
+  TC3625_Emulator
+
+Usage:
+
+  emu = TC3625_Emulator()
+  emu.start()
+
+  # emu.port is the pseudo-terminal device name
+  ctlr = TC3625(port=emu.port)
+  print ctlr.get_input1()
+  ctlr.close()
+
+  emu.stop()
+
+  # Two controllers on one line
+  emu = TC3625_Emulator(devices=['01','02'])
+
+  # Inject errors in 5% of the transactions
+  emu = TC3625_Emulator(error_rate=0.05)
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import os
+import tty
+import time
+import random
+import select
+import threading
+from tc3625_serial import SERIAL_CMDS
+from tc3625_codec import STX, ETX, ACK, NAK_VALUE, ADDRESS
+from tc3625_codec import SEND_SIZE_READ, SEND_SIZE_WRITE
+from tc3625_codec import HEX_BYTE, HEX_PAIR_VALUE
+
+# Bits per character on the wire - start bit, 8 data bits, stop bit
+BITS_PER_CHAR=10
+
+# Plant defaults
+DFLT_AMBIENT=25.0        # deg C
+DFLT_TIME_CONSTANT=60.0  # seconds
+DFLT_PLANT_GAIN=40.0     # deg C above ambient at 100% heating
+DFLT_MAX_CURRENT=10.0    # Amps at 100% output
+MAX_STEP=0.1             # seconds, plant integration step
+
+POWER_MAX_INT=511
+AMPS_PER_COUNT=2.5
+
+# Power-up (EEPROM) values of the write registers
+DFLT_REGISTERS = {
+    'alarm type': 0,
+    'set type define': 0,
+    'sensor type': 0,
+    'control type': 1,
+    'control output polarity': 0,
+    'power on/off': 0,
+    'output shutdown if alarm': 0,
+    'fixed desired control setting': 2500,
+    'proportional bandwidth': 500,
+    'integral gain': 0,
+    'derivative gain': 0,
+    'low external set range': 0,
+    'high external set range': 10000,
+    'alarm deadband': 100,
+    'high alarm setting': 5000,
+    'low alarm setting': 0,
+    'control deadband setting': 100,
+    'input1 offset': 0,
+    'input2 offset': 0,
+    'heat multiplier': 100,
+    'cool multiplier': 100,
+    'over current count compare value': 8,
+    'alarm latch enable': 0,
+    'alarm latch request': 0,
+    'choose sensor for alarm function': 0,
+    'temperature working units': 1,
+    'eeprom write enable': 1,
+    'over current continuous': 1,
+    'over current restart attempts': 300,
+    'JP3 display enable': 0,
+    }
+
+# Alarm status bits
+ALARM_HIGH_BIT=0
+ALARM_LOW_BIT=1
+ALARM_COMPUTER_BIT=2
+ALARM_CURRENT_BIT=3
+
+# Command code lookup tables
+READ_CODES=dict([(v['read'],k) for k,v in SERIAL_CMDS.items() if v['read'] != None])
+WRITE_CODES=dict([(v['write'],k) for k,v in SERIAL_CMDS.items() if v['write'] != None])
+
+
+class TC3625_EmulatedDevice:
+
+    """
+    Register map and thermal plant of a single emulated TC-36-25
+    controller.
+    """
+
+    def __init__(self,
+                 address=ADDRESS,
+                 ambient=DFLT_AMBIENT,
+                 time_constant=DFLT_TIME_CONSTANT,
+                 plant_gain=DFLT_PLANT_GAIN,
+                 max_current=DFLT_MAX_CURRENT,
+                 ):
+        self.address=address
+        self.ambient=ambient
+        self.time_constant=time_constant
+        self.plant_gain=plant_gain
+        self.max_current=max_current
+        self.eeprom=dict(DFLT_REGISTERS)
+        self.eeprom_writes=0
+        self.temp=ambient
+        self.power_on_reset()
+
+    def power_on_reset(self):
+        """
+        Emulate a power cycle - RAM values are reloaded from EEPROM and
+        the controller state is reset.
+        """
+        self.ram=dict(self.eeprom)
+        self.power=0.0
+        self.integral=0.0
+        self.last_error=None
+        self.alarm_latched=0
+        self.last_update=time.time()
+
+    def read(self, cmd):
+        """ Return the integer value of a register """
+        self.update()
+        if cmd == 'input1':
+            return self._temp_int(self.temp) + self.ram['input1 offset']
+        elif cmd == 'input2':
+            return self._temp_int(self.ambient) + self.ram['input2 offset']
+        elif cmd == 'desired control value':
+            return self.ram['fixed desired control setting']
+        elif cmd == 'power output':
+            return int(round(POWER_MAX_INT*self.power))
+        elif cmd == 'output current counts':
+            return self._current_counts()
+        elif cmd == 'alarm status':
+            return self._alarm_status()
+        return self.ram[cmd]
+
+    def write(self, cmd, val):
+        """ Write the integer value of a register, returns the value """
+        self.update()
+        if cmd == 'alarm latch request':
+            self.alarm_latched = 0
+            return val
+        self.ram[cmd] = val
+        if self.ram['eeprom write enable'] == 1:
+            self.eeprom[cmd] = val
+            self.eeprom_writes += 1
+        return val
+
+    def update(self, t=None):
+        """ Advance the thermal plant and controller to time t """
+        if t == None:
+            t = time.time()
+        while self.last_update < t:
+            dt = min(MAX_STEP, t - self.last_update)
+            self._step(dt)
+            self.last_update += dt
+
+    def _step(self, dt):
+        """ Single integration step of controller and plant """
+        ram = self.ram
+        setpt = self._temp_dec(ram['fixed desired control setting'])
+        if ram['power on/off'] == 0:
+            power = 0.0
+        elif ram['control type'] == 2:
+            power = ram['fixed desired control setting']/float(POWER_MAX_INT)
+        elif ram['control type'] == 0:
+            error = setpt - self.temp
+            deadband = self._temp_span(ram['control deadband setting'])
+            if error > deadband:
+                power = 1.0
+            elif error < -deadband:
+                power = -1.0
+            else:
+                power = self.power
+        else:
+            error = setpt - self.temp
+            bandwidth = max(self._temp_span(ram['proportional bandwidth']), 1.0e-3)
+            # Integral gain in repeats/min, derivative gain in min
+            self.integral += error*dt*ram['integral gain']/(100.0*60.0)
+            derivative = 0.0
+            if self.last_error != None and dt > 0:
+                derivative = (error - self.last_error)/dt*ram['derivative gain']*60.0/100.0
+            self.last_error = error
+            power = 2.0*(error + self.integral + derivative)/bandwidth
+        if power > 0:
+            power *= ram['heat multiplier']/100.0
+        else:
+            power *= ram['cool multiplier']/100.0
+        power = max(-1.0, min(1.0, power))
+        if ram['output shutdown if alarm'] == 1 and self._alarm_status() != 0:
+            power = 0.0
+        if self._current_counts(power) > ram['over current count compare value'] > 0:
+            self.alarm_latched |= 1<<ALARM_CURRENT_BIT
+            power = 0.0
+        self.power = power
+        rate = (self.plant_gain*power - (self.temp - self.ambient))/self.time_constant
+        self.temp += rate*dt
+
+    def _alarm_status(self):
+        """ Alarm status bit mask """
+        ram = self.ram
+        status = self.alarm_latched
+        if ram['choose sensor for alarm function'] == 0:
+            temp = self._temp_units(self.temp) + ram['input1 offset']/100.0
+        else:
+            temp = self._temp_units(self.ambient) + ram['input2 offset']/100.0
+        high = ram['high alarm setting']/100.0
+        low = ram['low alarm setting']/100.0
+        if ram['alarm type'] == 1:
+            setpt = ram['fixed desired control setting']/100.0
+            high, low = setpt + high, setpt - low
+        if ram['alarm type'] in (1,2):
+            if temp > high:
+                status |= 1<<ALARM_HIGH_BIT
+            if temp < low:
+                status |= 1<<ALARM_LOW_BIT
+        elif ram['alarm type'] == 3 and ram['alarm latch enable'] == 1:
+            status |= 1<<ALARM_COMPUTER_BIT
+        if ram['alarm latch enable'] == 1 and ram['alarm type'] != 3:
+            self.alarm_latched |= status
+        return status
+
+    def _current_counts(self, power=None):
+        """ Output current in A/D counts """
+        if power == None:
+            power = self.power
+        return int(round(abs(power)*self.max_current/AMPS_PER_COUNT))
+
+    def _temp_units(self, temp):
+        """ Convert deg C to working units """
+        if self.ram['temperature working units'] == 0:
+            return temp*9.0/5.0 + 32.0
+        return temp
+
+    def _temp_int(self, temp):
+        """ Convert deg C to fixed point temperature in working units """
+        return int(round(100*self._temp_units(temp)))
+
+    def _temp_dec(self, val):
+        """ Convert fixed point temperature in working units to deg C """
+        temp = val/100.0
+        if self.ram['temperature working units'] == 0:
+            return (temp - 32.0)*5.0/9.0
+        return temp
+
+    def _temp_span(self, val):
+        """ Convert fixed point temperature span in working units to deg C """
+        if self.ram['temperature working units'] == 0:
+            return val/100.0*5.0/9.0
+        return val/100.0
+
+
+class TC3625_Emulator:
+
+    """
+    Emulated TC-36-25 controllers on a pseudo-terminal.
+    """
+
+    def __init__(self,
+                 devices=None,
+                 baud_rate=9600,
+                 response_delay=0.0,
+                 error_rate=0.0,
+                 seed=None,
+                 ):
+        if devices == None:
+            devices = [ADDRESS]
+        self.devices = {}
+        for dev in devices:
+            if isinstance(dev, str):
+                dev = TC3625_EmulatedDevice(address=dev)
+            self.devices[dev.address] = dev
+        self.baud_rate=baud_rate
+        self.response_delay=response_delay
+        self.error_rate=error_rate
+        self.random=random.Random(seed)
+        self.rx_buf=''
+        self.frames_received=0
+        self.checksum_errors=0
+        self.errors_injected=0
+        self.port=None
+        self.thread=None
+        self.running=False
+
+    def device(self, address=ADDRESS):
+        """ Return the emulated device with the given address """
+        return self.devices[address]
+
+    def start(self):
+        """
+        Create the pseudo-terminal and start serving it from a
+        background thread. Returns the name of the device to open.
+        """
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        return self.port
+
+    def stop(self):
+        """ Stop serving and close the pseudo-terminal """
+        self.running = False
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+        os.close(self.master)
+        os.close(self.slave)
+
+    def wire_time(self, nchars):
+        """ Time to send nchars at the configured baud rate """
+        return nchars*BITS_PER_CHAR/float(self.baud_rate)
+
+    def process(self, data):
+        """
+        Process received bytes. Returns a list of (reply, delay) pairs
+        for the complete command frames found, where delay is the wire
+        and processing time before the reply would be complete.
+        """
+        self.rx_buf += data
+        replies = []
+        while True:
+            n = self.rx_buf.find(STX)
+            if n < 0:
+                self.rx_buf = ''
+                break
+            self.rx_buf = self.rx_buf[n:]
+            if len(self.rx_buf) < 5:
+                break
+            cc = self.rx_buf[3:5]
+            if cc in READ_CODES:
+                size = SEND_SIZE_READ
+            elif cc in WRITE_CODES:
+                size = SEND_SIZE_WRITE
+            else:
+                self.rx_buf = self.rx_buf[1:]
+                continue
+            if len(self.rx_buf) < size:
+                break
+            frame, self.rx_buf = self.rx_buf[:size], self.rx_buf[size:]
+            if frame[-1] != ETX:
+                self.rx_buf = frame[1:] + self.rx_buf
+                continue
+            reply = self.handle_frame(frame)
+            if reply != None:
+                delay = self.wire_time(len(frame)+len(reply)) + self.response_delay
+                replies.append((reply, delay))
+        return replies
+
+    def handle_frame(self, frame):
+        """
+        Handle a single command frame and return the reply, or None if
+        no emulated device has the frame's address.
+        """
+        self.frames_received += 1
+        address, cc, body = frame[1:3], frame[3:5], frame[1:-3]
+        try:
+            dev = self.devices[address]
+        except KeyError:
+            return None
+        corrupt_reply = False
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            self.errors_injected += 1
+            # Either the command or the reply is corrupted on the wire
+            if self.random.random() < 0.5:
+                return self._reply(NAK_VALUE)
+            corrupt_reply = True
+        if HEX_PAIR_VALUE[(ord(frame[-3])<<8)|ord(frame[-2])] != sum(bytearray(body)) & 0xff:
+            self.checksum_errors += 1
+            return self._reply(NAK_VALUE)
+        if cc in READ_CODES:
+            val = dev.read(READ_CODES[cc])
+        else:
+            val_hex = body[4:]
+            try:
+                val = int(val_hex, 16)
+            except ValueError:
+                return self._reply(NAK_VALUE)
+            if val >= 0x80000000:
+                val -= 0x100000000
+            val = dev.write(WRITE_CODES[cc], val)
+        reply = self._reply('%08x'%(val & 0xffffffff,))
+        if corrupt_reply:
+            reply = reply[:-3] + HEX_BYTE[(int(reply[-3:-1],16) + 1) & 0xff] + ACK
+        return reply
+
+    def _reply(self, val_str):
+        """ Reply frame for 8 character value string """
+        return STX + val_str + HEX_BYTE[sum(bytearray(val_str)) & 0xff] + ACK
+
+    def _run(self):
+        """ Serve the pseudo-terminal """
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 256)
+            except OSError:
+                # No process has the slave side open
+                time.sleep(0.01)
+                continue
+            t_start = time.time()
+            for reply, delay in self.process(data):
+                t_start += delay
+                t_wait = t_start - time.time()
+                if t_wait > 0:
+                    time.sleep(t_wait)
+                os.write(self.master, reply)
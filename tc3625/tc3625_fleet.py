@@ -0,0 +1,352 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Fleet of TC-36-25 controllers on many serial ports, operated
+in parallel.
+
+The fleet opens a TC3625 for every controller in a list of ports (and
+addresses) and runs reads, writes and get_all snapshots on all of them
+at once. Each serial port is served by its own worker from a thread
+pool, so a sweep of the fleet takes about as long as the slowest port
+rather than the sum over all controllers. Controllers sharing a port
+(different addresses on a multi-drop line) share a TC3625_Bus and are
+handled one after the other by the worker of that port.
+
+Results are returned as dictionaries keyed by controller, together
+with a dictionary of the errors of the controllers which failed.
+Failures are isolated - an exception from one controller is recorded
+for it alone, and with a sweep timeout a port which does not finish in
+time is reported as failed without delaying the rest of the sweep.
+Such a port is skipped by later sweeps until its worker is free again.
+
+Controllers are given as a list of port names or (port, address)
+tuples, which are also the keys of the results, or as a dictionary of
+controller names and ports or (port, address) tuples, in which case the
+names are the keys.
+
+Classes:
+  TC3625Fleet
+
+Usage:
+
+  fleet = TC3625Fleet(['/dev/ttyUSB0', '/dev/ttyUSB1', ('/dev/ttyUSB2', '01')])
+
+  temps, errors = fleet.read('input1')
+  snapshot, errors = fleet.get_all()
+  results, errors = fleet.write('fixed control setting', 25.0)
+
+  # Arbitrary calls, func is called with the TC3625 of each controller
+  results, errors = fleet.call(lambda ctlr: ctlr.get_alarm_status())
+
+  fleet.close()
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+from tc3625 import TC3625, METHOD_DICT
+from tc3625 import DFLT_TIMEOUT, DFLT_BAUDRATE, DFLT_MAX_ATTEMPT, DFLT_ADDRESS
+from tc3625_bus import TC3625_Bus
+
+
+class TC3625Fleet:
+
+    """
+    Set of TC3625 controllers on many serial ports, operated in
+    parallel with a worker per port.
+    """
+
+    def __init__(self,
+                 controllers,
+                 timeout=DFLT_TIMEOUT,
+                 baudrate=DFLT_BAUDRATE,
+                 max_attempt=DFLT_MAX_ATTEMPT,
+                 eeprom='off',
+                 cache=False,
+                 sweep_timeout=None,
+                 open=True,
+                 ):
+        self.timeout=timeout
+        self.baudrate=baudrate
+        self.max_attempt=max_attempt
+        self.eeprom=eeprom
+        self.cache=cache
+        self.sweep_timeout=sweep_timeout
+        self.specs={}
+        self.port_keys={}
+        if isinstance(controllers, dict):
+            items = controllers.items()
+        else:
+            items = [(spec, spec) for spec in controllers]
+        for key, spec in items:
+            if isinstance(spec, basestring):
+                port, address = spec, DFLT_ADDRESS
+            else:
+                port, address = spec
+            self.specs[key] = (port, address)
+            self.port_keys.setdefault(port, []).append(key)
+        for keys in self.port_keys.values():
+            keys.sort()
+        self.ctlrs={}
+        self.buses={}
+        self.open_errors={}
+        self.running={}
+        self.lock=threading.Lock()
+        # At least one worker, ThreadPool refuses none
+        self.pool=ThreadPool(max(1, len(self.port_keys)))
+        if open:
+            self.open()
+
+    def keys(self):
+        """ Keys of all the controllers in the fleet """
+        return sorted(self.specs.keys())
+
+    def controller(self, key):
+        """ The TC3625 of the given controller, if it is open """
+        return self.ctlrs[key]
+
+    def open(self):
+        """
+        Open all controllers which are not open yet. Returns a
+        dictionary of the errors of the controllers which failed to
+        open, these are also kept in open_errors.
+        """
+        results, errors = self._sweep(self._open_port, self.sweep_timeout)
+        self.open_errors = errors
+        return errors
+
+    def close(self):
+        """ Close all controllers and stop the workers """
+        self._sweep(self._close_port, self.sweep_timeout)
+        self.pool.close()
+        self.pool.join()
+
+    def call(self, func, timeout=None):
+        """
+        Call func(ctlr) for the TC3625 of every controller, in parallel
+        over the ports. Returns a dictionary of the return values and a
+        dictionary of the exceptions raised, both keyed by controller.
+        timeout overrides the sweep timeout of the fleet.
+        """
+        return self._call(lambda key, ctlr: func(ctlr), timeout)
+
+    def read(self, prop, timeout=None):
+        """ Read property prop (e.g. 'input1') of every controller """
+        get_method = self._method(prop, 'get')
+        return self.call(get_method, timeout)
+
+    def write(self, prop, val, timeout=None):
+        """
+        Set property prop of every controller to val, or, if val is a
+        dictionary keyed by controller, of the controllers in val to
+        their values.
+        """
+        set_method = self._method(prop, 'set')
+        if isinstance(val, dict):
+            for key in val:
+                if not key in self.specs:
+                    raise ValueError, 'unknown controller %s'%(key,)
+            func = lambda key, ctlr: set_method(ctlr, val[key])
+            return self._call(func, timeout, val.keys())
+        return self._call(lambda key, ctlr: set_method(ctlr, val), timeout)
+
+    def set_by_dict(self, prop_new, diff=False, timeout=None):
+        """ TC3625.set_by_dict on every controller """
+        return self.call(lambda ctlr: ctlr.set_by_dict(prop_new, diff), timeout)
+
+    def get_all(self, timeout=None):
+        """ Snapshot of all the properties of every controller """
+        return self.call(lambda ctlr: ctlr.get_all(), timeout)
+
+    def _method(self, prop, kind):
+        try:
+            return METHOD_DICT[prop][kind]
+        except KeyError:
+            raise ValueError, 'unknown or un%sable property %s'%(kind, prop)
+
+    def _call(self, func, timeout, keys=None):
+        """
+        Call func(key, ctlr) for the controllers in keys (all if None),
+        see call.
+        """
+        def port_func(port, port_keys, sweep):
+            for key in port_keys:
+                try:
+                    ctlr = self.ctlrs[key]
+                except KeyError:
+                    sweep.error(key, IOError('controller not open'))
+                    continue
+                try:
+                    sweep.result(key, func(key, ctlr))
+                except Exception, err:
+                    sweep.error(key, err)
+        if timeout == None:
+            timeout = self.sweep_timeout
+        return self._sweep(port_func, timeout, keys)
+
+    def _open_port(self, port, keys, sweep):
+        """ Open the controllers on one port """
+        bus = None
+        if len(keys) > 1:
+            bus = self.buses.get(port)
+            if bus == None:
+                try:
+                    bus = TC3625_Bus(port=port, timeout=self.timeout, baud_rate=self.baudrate)
+                    bus.open()
+                except Exception, err:
+                    for key in keys:
+                        sweep.error(key, err)
+                    return
+                self.buses[port] = bus
+        for key in keys:
+            if key in self.ctlrs:
+                continue
+            address = self.specs[key][1]
+            try:
+                ctlr = TC3625(port=port,
+                              timeout=self.timeout,
+                              baudrate=self.baudrate,
+                              max_attempt=self.max_attempt,
+                              eeprom=self.eeprom,
+                              address=address,
+                              bus=bus,
+                              cache=self.cache)
+            except Exception, err:
+                sweep.error(key, err)
+                continue
+            self.ctlrs[key] = ctlr
+            sweep.result(key, True)
+
+    def _close_port(self, port, keys, sweep):
+        """ Close the controllers on one port """
+        for key in keys:
+            ctlr = self.ctlrs.pop(key, None)
+            if ctlr == None:
+                continue
+            try:
+                ctlr.close()
+                sweep.result(key, True)
+            except Exception, err:
+                sweep.error(key, err)
+        bus = self.buses.pop(port, None)
+        if bus != None:
+            try:
+                bus.close()
+            except Exception:
+                pass
+
+    def _sweep(self, port_func, timeout, keys=None):
+        """
+        Run port_func(port, port_keys, sweep) for every port with a
+        controller in keys (all if None) on the workers, and collect the
+        results. Ports whose worker is still busy with an earlier sweep
+        are skipped and ports which do not finish within timeout are
+        reported as failed.
+        """
+        sweep = _Sweep()
+        jobs = []
+        for port, port_keys in self.port_keys.items():
+            if keys != None:
+                port_keys = [k for k in port_keys if k in keys]
+                if not port_keys:
+                    continue
+            self.lock.acquire()
+            try:
+                job = self.running.get(port)
+                if job != None and not job.ready():
+                    busy = True
+                else:
+                    busy = False
+                    job = self.pool.apply_async(port_func, (port, port_keys, sweep))
+                    self.running[port] = job
+            finally:
+                self.lock.release()
+            if busy:
+                for key in port_keys:
+                    sweep.error(key, IOError('port %s busy'%(port,)))
+                continue
+            jobs.append((port_keys, job))
+        if timeout != None:
+            deadline = time.time() + timeout
+        for port_keys, job in jobs:
+            if timeout == None:
+                # AsyncResult.get without a timeout can not be interrupted
+                while not job.ready():
+                    job.wait(1.0)
+            else:
+                job.wait(max(deadline - time.time(), 0))
+            if not job.ready():
+                for key in port_keys:
+                    sweep.error(key, IOError('timeout waiting for controller'))
+                continue
+            try:
+                job.get()
+            except Exception, err:
+                for key in port_keys:
+                    sweep.error(key, err)
+        return sweep.finish()
+
+
+class _Sweep:
+
+    """
+    Results and errors of one sweep, written by the workers. Results
+    arriving after the sweep has finished are dropped.
+    """
+
+    def __init__(self):
+        self.lock=threading.Lock()
+        self.results={}
+        self.errors={}
+        self.done=False
+
+    def result(self, key, value):
+        self.lock.acquire()
+        try:
+            if not self.done and not key in self.errors:
+                self.results[key] = value
+        finally:
+            self.lock.release()
+
+    def error(self, key, err):
+        self.lock.acquire()
+        try:
+            if not self.done and not key in self.results:
+                self.errors[key] = err
+        finally:
+            self.lock.release()
+
+    def finish(self):
+        self.lock.acquire()
+        try:
+            self.done = True
+            return self.results, self.errors
+        finally:
+            self.lock.release()
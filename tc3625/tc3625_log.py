@@ -0,0 +1,368 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Append-only, memory mapped telemetry log.
+
+A log is a directory of segment files. Each segment is a 64 byte
+header followed by a fixed number of fixed size records, with the same
+layout as the records of TC3625_RingBuffer (RECORD_DTYPE). Segments are
+created at their full size, so the writer only stores into an existing
+mapping and there is no allocation per sample. When a segment is full
+the writer moves on to the next one.
+
+The header holds the number of valid records. The writer stores a
+record before it increments the count, so a reader always sees a
+complete prefix of the segment and can open the log while the writer
+is still appending. New segments are created under a temporary name
+and renamed once the header is written.
+
+Timestamps must be non-decreasing. Readers find a time range by binary
+searching first the segment start times and then the time column of
+each segment.
+
+Requires numpy.
+
+Classes:
+  TC3625_LogWriter
+  TC3625_LogReader
+
+Usage:
+
+  log = TC3625_LogWriter('/data/tc3625/ctlr0')
+  log.attach(ctlr.start_polling())
+  ...
+  log.close()
+
+  reader = TC3625_LogReader('/data/tc3625/ctlr0')
+  data = reader.range(t0, t1)
+  temp = reader.convert(data)['input1']
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import os
+import bisect
+import threading
+import numpy
+from tc3625_telemetry import RECORD_DTYPE, COLUMN_PROPS, COLUMN_CONVERT
+
+MAGIC='TC3625LG'
+VERSION=1
+HEADER_SIZE=64
+HEADER_DTYPE=numpy.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('record_size', '<u4'),
+    ('capacity', '<u8'),
+    ('count', '<u8'),
+    ('pad', 'V%d'%(HEADER_SIZE - 32,)),
+    ])
+
+SEGMENT_PREFIX='segment_'
+SEGMENT_SUFFIX='.tlog'
+
+# One day of 10 Hz records, 24 MB per segment (28 byte records)
+DFLT_SEGMENT_RECORDS=864000
+
+
+class TC3625_LogWriter:
+
+    """
+    Appends telemetry records to a segmented, memory mapped log.
+    """
+
+    def __init__(self, path, segment_records=DFLT_SEGMENT_RECORDS, trigger='input1'):
+        if segment_records <= 0:
+            raise ValueError, 'segment_records must be positive'
+        self.path=path
+        self.segment_records=segment_records
+        self.trigger=trigger
+        self.lock=threading.Lock()
+        self.current=dict([(col, 0) for col, prop in COLUMN_PROPS])
+        self.prop_column=dict([(prop, col) for col, prop in COLUMN_PROPS])
+        self.header=None
+        self.records=None
+        self.columns=None
+        self.index=None
+        self.count=0
+        self.last_time=None
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._open_last()
+
+    def append(self, t, input1=0, input2=0, power_output=0,
+               output_current_counts=0, alarm_status=0):
+        """ Append a record, t must not be earlier than the last record """
+        self.lock.acquire()
+        try:
+            if self.records is None:
+                raise IOError, 'log is closed'
+            if self.last_time != None and t < self.last_time:
+                raise ValueError, 'timestamp earlier than last record'
+            if self.count == len(self.records):
+                self._open_segment(self.index + 1)
+            i = self.count
+            time_col, input1_col, input2_col, power_col, current_col, alarm_col = self.columns
+            time_col[i] = t
+            input1_col[i] = input1
+            input2_col[i] = input2
+            power_col[i] = power_output
+            current_col[i] = output_current_counts
+            alarm_col[i] = alarm_status
+            # Publish the record to readers
+            self.count = i + 1
+            self.header['count'] = self.count
+            self.last_time = t
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        """ Write the current segment to disk """
+        self.lock.acquire()
+        try:
+            if self.records is not None:
+                self.records.flush()
+                self.header.flush()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """ Flush and unmap the current segment """
+        self.flush()
+        self.lock.acquire()
+        try:
+            self._close_segment()
+        finally:
+            self.lock.release()
+
+    def attach(self, poller):
+        """ Append records from the samples of a TC3625_Poller """
+        poller.add_listener(self.on_sample)
+
+    def detach(self, poller):
+        """ Stop appending records from a TC3625_Poller """
+        poller.remove_listener(self.on_sample)
+
+    def on_sample(self, prop, t, raw, value):
+        """
+        Poller listener - update the latest raw value of the property
+        and append a record when the trigger property is sampled.
+        """
+        try:
+            self.current[self.prop_column[prop]] = raw
+        except KeyError:
+            return
+        if prop == self.trigger:
+            self.append(t, **self.current)
+
+    def _open_last(self):
+        """ Continue the last segment of an existing log, or start one """
+        segments = list_segments(self.path)
+        if not segments:
+            self._open_segment(0)
+            return
+        index, filename = segments[-1]
+        self.index = index
+        self._map_segment(filename)
+        if self.count > 0:
+            self.last_time = float(self.records['time'][self.count - 1])
+
+    def _open_segment(self, index):
+        """ Create segment index and make it the current segment """
+        self._close_segment()
+        filename = segment_name(self.path, index)
+        tmpname = filename + '.tmp'
+        fid = open(tmpname, 'wb')
+        try:
+            header = numpy.zeros(1, dtype=HEADER_DTYPE)
+            header['magic'] = MAGIC
+            header['version'] = VERSION
+            header['record_size'] = RECORD_DTYPE.itemsize
+            header['capacity'] = self.segment_records
+            fid.write(header.tostring())
+            fid.truncate(HEADER_SIZE + self.segment_records*RECORD_DTYPE.itemsize)
+        finally:
+            fid.close()
+        os.rename(tmpname, filename)
+        self.index = index
+        self._map_segment(filename)
+
+    def _map_segment(self, filename):
+        """ Memory map the header and records of a segment for writing """
+        header = numpy.memmap(filename, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+        check_header(header, filename)
+        capacity = int(header['capacity'][0])
+        self.records = numpy.memmap(filename, dtype=RECORD_DTYPE, mode='r+',
+                                    offset=HEADER_SIZE, shape=(capacity,))
+        self.header = header
+        self.count = int(header['count'][0])
+        self.columns = tuple([self.records[name] for name in RECORD_DTYPE.names])
+
+    def _close_segment(self):
+        if self.records is None:
+            return
+        self.records.flush()
+        self.header.flush()
+        self.header = None
+        self.records = None
+        self.columns = None
+
+
+class TC3625_LogReader:
+
+    """
+    Reads time ranges of records from a telemetry log. The log may be
+    open for writing at the same time.
+    """
+
+    def __init__(self, path):
+        self.path=path
+        self.segments=[]
+        self.start_times=[]
+        self.refresh()
+
+    def refresh(self):
+        """ Map segments created since the last refresh """
+        known = len(self.segments)
+        for index, filename in list_segments(self.path)[known:]:
+            header = numpy.memmap(filename, dtype=HEADER_DTYPE, mode='r', shape=(1,))
+            check_header(header, filename)
+            capacity = int(header['capacity'][0])
+            records = numpy.memmap(filename, dtype=RECORD_DTYPE, mode='r',
+                                   offset=HEADER_SIZE, shape=(capacity,))
+            self.segments.append((header, records))
+        # Start times of segments which were empty at the last refresh
+        for header, records in self.segments[len(self.start_times):]:
+            if header['count'][0] == 0:
+                break
+            self.start_times.append(float(records['time'][0]))
+
+    def __len__(self):
+        self.refresh()
+        return sum([int(header['count'][0]) for header, records in self.segments])
+
+    def segment(self, i):
+        """ Read-only view of the valid records of segment i """
+        header, records = self.segments[i]
+        return records[:int(header['count'][0])]
+
+    def range(self, t0=None, t1=None):
+        """
+        Return the records with t0 <= time < t1, oldest first. None
+        means no limit. The result is a read-only view of the mapped
+        segment if the range lies in a single segment, otherwise the
+        records are copied into a new array.
+        """
+        self.refresh()
+        if not self.start_times:
+            return numpy.zeros(0, dtype=RECORD_DTYPE)
+        if t0 == None:
+            first = 0
+        else:
+            first = max(bisect.bisect_right(self.start_times, t0) - 1, 0)
+        if t1 == None:
+            last = len(self.start_times) - 1
+        else:
+            last = max(bisect.bisect_left(self.start_times, t1) - 1, first)
+        parts = []
+        for i in range(first, last + 1):
+            data = self.segment(i)
+            times = data['time']
+            lo, hi = 0, len(data)
+            if t0 != None:
+                lo = numpy.searchsorted(times, t0, side='left')
+            if t1 != None:
+                hi = numpy.searchsorted(times, t1, side='left')
+            if hi > lo:
+                parts.append(data[lo:hi])
+        if not parts:
+            return numpy.zeros(0, dtype=RECORD_DTYPE)
+        if len(parts) == 1:
+            return parts[0]
+        return numpy.concatenate(parts)
+
+    def latest(self, n):
+        """ The most recent n records """
+        self.refresh()
+        parts = []
+        for i in range(len(self.segments) - 1, -1, -1):
+            data = self.segment(i)
+            if len(data) >= n:
+                parts.insert(0, data[len(data) - n:])
+                break
+            parts.insert(0, data)
+            n -= len(data)
+        if not parts:
+            return numpy.zeros(0, dtype=RECORD_DTYPE)
+        if len(parts) == 1:
+            return parts[0]
+        return numpy.concatenate(parts)
+
+    def convert(self, records):
+        """
+        Convert the columns of the given records to engineering units,
+        see TC3625_RingBuffer.convert.
+        """
+        values = {'time': records['time'], 'alarm_status': records['alarm_status']}
+        for col, func in COLUMN_CONVERT.items():
+            values[col] = func(records[col])
+        return values
+
+    def close(self):
+        """ Unmap all segments """
+        self.segments = []
+        self.start_times = []
+
+
+def segment_name(path, index):
+    """ File name of segment index of the log in path """
+    return os.path.join(path, '%s%08d%s'%(SEGMENT_PREFIX, index, SEGMENT_SUFFIX))
+
+def list_segments(path):
+    """ Sorted list of (index, filename) of the segments of a log """
+    segments = []
+    for name in os.listdir(path):
+        if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+            continue
+        try:
+            index = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+        except ValueError:
+            continue
+        segments.append((index, os.path.join(path, name)))
+    segments.sort()
+    return segments
+
+def check_header(header, filename):
+    """ Raise IOError if header is not a valid segment header """
+    header = header[0]
+    if header['magic'] != MAGIC:
+        raise IOError, '%s is not a tc3625 log segment'%(filename,)
+    if header['version'] != VERSION:
+        raise IOError, '%s: unsupported log version %d'%(filename, header['version'])
+    if header['record_size'] != RECORD_DTYPE.itemsize:
+        raise IOError, '%s: record size mismatch'%(filename,)
@@ -0,0 +1,305 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Per command counters and latency histograms of the traffic
+with TC-36-25 controllers.
+
+A TC3625_Metrics object is given to TC3625_Serial, TC3625_Bus or
+TC3625 (metrics argument). Recording is off unless one is given - the
+cost is then one test per transaction.
+
+Counters, per serial command string:
+
+  transactions       transactions with a valid response
+  bytes_sent         bytes written to the line
+  bytes_received     bytes read from the line
+  timeouts           no complete response within the timeout
+  link_errors        failures of the port itself, e.g. an unplugged adapter
+  checksum_errors    response checksum did not match
+  nak_errors         controller replied that the sent checksum was wrong
+  frame_errors       malformed response
+  io_errors          other errors of the port or transport
+  retries            failed attempts which were retried (TC3625)
+  failures           reads and writes given up after retries (TC3625)
+  rejected           reads and writes failed fast by the circuit breaker (TC3625)
+  reconnects         connections reopened after a link error (TC3625)
+
+Histograms, per serial command string, in seconds:
+
+  rtt                round trip time of a transaction
+  request_time       time of a TC3625 read or write including retries
+  outage_time        time from a link error to the reconnection (TC3625)
+
+The link counters and histograms of TC3625 (reconnects, outage_time)
+are recorded with the command string ''.
+
+stats returns all of these as dictionaries and prometheus returns
+them in the Prometheus text exposition format.
+
+Classes:
+  TC3625_Metrics
+
+Functions:
+  prometheus
+
+Usage:
+
+  metrics = TC3625_Metrics()
+  ctlr = TC3625(port='/dev/ttyUSB0', metrics=metrics)
+  ...
+  print metrics.stats()['counters']['timeouts']
+  print metrics.prometheus()
+
+  # Several controllers, told apart by their labels
+  ctlr1 = TC3625(port='/dev/ttyUSB0', metrics=True)
+  ctlr2 = TC3625(port='/dev/ttyUSB1', metrics=True)
+  print prometheus([ctlr1.metrics, ctlr2.metrics])
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import bisect
+import threading
+from tc3625_codec import TC3625_ChecksumError, TC3625_NakError
+from tc3625_codec import TC3625_FrameError, TC3625_TimeoutError, TC3625_LinkError
+
+# Upper bounds, in seconds, of the latency histogram buckets. A frame
+# takes about 20ms on the wire at 9600 baud.
+LATENCY_BUCKETS=[
+    0.005, 0.01, 0.02, 0.03, 0.05, 0.075,
+    0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0,
+    ]
+
+COUNTERS={
+    'transactions': 'Transactions with a valid response',
+    'bytes_sent': 'Bytes written to the serial line',
+    'bytes_received': 'Bytes read from the serial line',
+    'timeouts': 'Transactions without a complete response within the timeout',
+    'link_errors': 'Failures of the serial port or connection itself',
+    'checksum_errors': 'Responses whose checksum did not match',
+    'nak_errors': 'Replies from the controller that the sent checksum was incorrect',
+    'frame_errors': 'Malformed responses',
+    'io_errors': 'Other errors of the serial port or transport',
+    'retries': 'Failed attempts which were retried',
+    'failures': 'Reads and writes given up after retries',
+    'rejected': 'Reads and writes failed fast by the circuit breaker',
+    'reconnects': 'Connections reopened after a link error',
+    }
+
+HISTOGRAMS={
+    'rtt': 'Round trip time of a transaction in seconds',
+    'request_time': 'Time of a read or write including retries in seconds',
+    'outage_time': 'Time from a link error to the reconnection in seconds',
+    }
+
+# Counter for each class of transaction error, most specific first
+ERROR_COUNTERS=[
+    (TC3625_TimeoutError, 'timeouts'),
+    (TC3625_LinkError, 'link_errors'),
+    (TC3625_ChecksumError, 'checksum_errors'),
+    (TC3625_NakError, 'nak_errors'),
+    (TC3625_FrameError, 'frame_errors'),
+    ]
+
+
+def error_counter(err):
+    """ Name of the counter for a transaction error """
+    for cls, name in ERROR_COUNTERS:
+        if isinstance(err, cls):
+            return name
+    return 'io_errors'
+
+def prometheus(metrics, prefix='tc3625'):
+    """
+    Prometheus text exposition of a list of TC3625_Metrics, which
+    should have different labels.
+    """
+    lines = []
+    for name in sorted(COUNTERS):
+        family = '%s_%s_total'%(prefix, name)
+        samples = []
+        for m in metrics:
+            for cmd, n in sorted(m.snapshot_counter(name).items()):
+                samples.append('%s{%s} %d'%(family, m.label_str(cmd), n))
+        if samples:
+            lines.append('# HELP %s %s'%(family, COUNTERS[name]))
+            lines.append('# TYPE %s counter'%(family,))
+            lines.extend(samples)
+    for name in sorted(HISTOGRAMS):
+        family = '%s_%s_seconds'%(prefix, name)
+        samples = []
+        for m in metrics:
+            for cmd, hist in sorted(m.snapshot_histogram(name).items()):
+                labels = m.label_str(cmd)
+                cnt = 0
+                for le, n in zip(m.buckets, hist[:-2]):
+                    cnt += n
+                    samples.append('%s_bucket{%s,le="%s"} %d'%(family, labels, _num(le), cnt))
+                samples.append('%s_bucket{%s,le="+Inf"} %d'%(family, labels, hist[-1]))
+                samples.append('%s_sum{%s} %s'%(family, labels, _num(hist[-2])))
+                samples.append('%s_count{%s} %d'%(family, labels, hist[-1]))
+        if samples:
+            lines.append('# HELP %s %s'%(family, HISTOGRAMS[name]))
+            lines.append('# TYPE %s histogram'%(family,))
+            lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+def _num(x):
+    return repr(float(x))
+
+def _escape(val):
+    return str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class TC3625_Metrics:
+
+    """
+    Thread safe counters and latency histograms keyed by serial
+    command string. labels is a dictionary of constant labels (e.g.
+    port and address) added to the Prometheus exposition.
+    """
+
+    def __init__(self, labels=None, buckets=LATENCY_BUCKETS):
+        if labels == None:
+            labels = {}
+        self.labels=dict(labels)
+        self.buckets=list(buckets)
+        self.lock=threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Clear all counters and histograms """
+        self.lock.acquire()
+        try:
+            self.counters = dict([(name, {}) for name in COUNTERS])
+            # Per command - count of each bucket, count above the last
+            # bucket, sum and total count
+            self.histograms = dict([(name, {}) for name in HISTOGRAMS])
+        finally:
+            self.lock.release()
+
+    def count(self, name, cmd, n=1):
+        """ Add n to the counter name of cmd """
+        self.lock.acquire()
+        try:
+            self._count(name, cmd, n)
+        finally:
+            self.lock.release()
+
+    def observe(self, name, cmd, value):
+        """ Add a value, in seconds, to the histogram name of cmd """
+        self.lock.acquire()
+        try:
+            self._observe(name, cmd, value)
+        finally:
+            self.lock.release()
+
+    def transaction(self, cmd, sent, received, rtt, error=None):
+        """
+        Record a transaction of cmd - the numbers of bytes sent and
+        received and either its round trip time or the error raised.
+        """
+        self.lock.acquire()
+        try:
+            self._count('bytes_sent', cmd, sent)
+            self._count('bytes_received', cmd, received)
+            if error == None:
+                self._count('transactions', cmd, 1)
+                self._observe('rtt', cmd, rtt)
+            else:
+                self._count(error_counter(error), cmd, 1)
+        finally:
+            self.lock.release()
+
+    def _count(self, name, cmd, n):
+        counter = self.counters[name]
+        counter[cmd] = counter.get(cmd, 0) + n
+
+    def _observe(self, name, cmd, value):
+        try:
+            hist = self.histograms[name][cmd]
+        except KeyError:
+            hist = [0]*(len(self.buckets) + 1) + [0.0, 0]
+            self.histograms[name][cmd] = hist
+        hist[bisect.bisect_left(self.buckets, value)] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+    def snapshot_counter(self, name):
+        """ Copy of the counter name, a dictionary of command and count """
+        self.lock.acquire()
+        try:
+            return dict(self.counters[name])
+        finally:
+            self.lock.release()
+
+    def snapshot_histogram(self, name):
+        """ Copy of the raw histogram name of each command """
+        self.lock.acquire()
+        try:
+            return dict([(cmd, list(hist)) for cmd, hist in self.histograms[name].items()])
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        """
+        Returns {'counters': {name: {cmd: count}}, 'histograms': {name:
+        {cmd: summary}}} where each summary is a dictionary of count,
+        sum, mean and buckets - a list of (upper bound, count) pairs,
+        the last with upper bound None for the values above the last
+        bucket.
+        """
+        stats = {'counters': {}, 'histograms': {}}
+        for name in COUNTERS:
+            stats['counters'][name] = self.snapshot_counter(name)
+        for name in HISTOGRAMS:
+            summaries = {}
+            for cmd, hist in self.snapshot_histogram(name).items():
+                n = hist[-1]
+                if n > 0:
+                    mean = hist[-2]/n
+                else:
+                    mean = 0.0
+                summaries[cmd] = {
+                    'count': n,
+                    'sum': hist[-2],
+                    'mean': mean,
+                    'buckets': zip(self.buckets + [None], hist[:-2]),
+                    }
+            stats['histograms'][name] = summaries
+        return stats
+
+    def prometheus(self, prefix='tc3625'):
+        """ Prometheus text exposition of the metrics """
+        return prometheus([self], prefix)
+
+    def label_str(self, cmd):
+        """ Prometheus label string for cmd and the constant labels """
+        labels = [(k, self.labels[k]) for k in sorted(self.labels)]
+        labels.append(('cmd', cmd))
+        return ','.join(['%s="%s"'%(k, _escape(v)) for k, v in labels])
@@ -0,0 +1,161 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Array versions of the conversion and decode functions for
+post-processing bulk data.
+
+Each function takes a NumPy array (or anything numpy.asarray accepts)
+and returns the same values as the scalar function it is named after,
+applied element by element. The temperature, power and current
+conversions use the same arithmetic as the scalar functions, so the
+results are identical. The hex decoding works directly on buffers of
+raw 8 character hex fields, as sent by the controller, through a
+lookup table of hex digit values. Alarm bit masks are decoded through
+the 128 entry table of the 'alarm status' Get_Mask.
+
+Requires numpy.
+
+Functions:
+  int2dec_array
+  dec2int_array
+  int2perc_array
+  amp2cnt_array
+  cnt2amp_array
+  from_twoscomp_array
+  to_twoscomp_array
+  alarm_status_array
+  alarm_bits_array
+
+Usage:
+
+  raw = from_twoscomp_array(buf)    # buf holds N 8 character hex fields
+  temp = int2dec_array(raw)
+  flags, alarms = alarm_status_array(status)
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import numpy
+from tc3625 import int2dec, int2perc, amp2cnt, cnt2amp
+from tc3625 import METHOD_DICT, ALARM_VALUES
+from tc3625_codec import HEX_DIGIT_VALUE
+
+HEX_CHARS=numpy.frombuffer('0123456789abcdef', dtype=numpy.uint8)
+HEX_DIGIT_TABLE=numpy.array(HEX_DIGIT_VALUE, dtype=numpy.int64)
+NIBBLE_SHIFTS=numpy.arange(28, -1, -4, dtype=numpy.int64)
+
+# Alarm status decode table, split into flag and alarm list columns
+ALARM_MASK=METHOD_DICT['alarm status']['get']
+ALARM_FLAG_TABLE=numpy.empty(len(ALARM_MASK.table), dtype=bool)
+ALARM_LIST_TABLE=numpy.empty(len(ALARM_MASK.table), dtype=object)
+for _i, (_flag, _val_list) in enumerate(ALARM_MASK.table):
+    ALARM_FLAG_TABLE[_i] = _flag
+    ALARM_LIST_TABLE[_i] = _val_list
+del _i, _flag, _val_list
+
+
+def int2dec_array(x):
+    """ Array version of int2dec """
+    return int2dec(numpy.asarray(x))
+
+def dec2int_array(x):
+    """
+    Array version of dec2int - the result is truncated towards zero
+    like int().
+    """
+    return (100*numpy.asarray(x)).astype(numpy.int64)
+
+def int2perc_array(x):
+    """ Array version of int2perc """
+    return int2perc(numpy.asarray(x))
+
+def amp2cnt_array(x):
+    """ Array version of amp2cnt """
+    return amp2cnt(numpy.asarray(x))
+
+def cnt2amp_array(x):
+    """ Array version of cnt2amp """
+    return cnt2amp(numpy.asarray(x))
+
+def from_twoscomp_array(x):
+    """
+    Array version of from_twoscomp. x is a buffer (e.g. str or bytes
+    read from a capture) of concatenated 8 character hex fields, or an
+    array or list of 8 character hex strings. Returns an int64 array of
+    signed values. Raises ValueError if any field has a non hex
+    character.
+    """
+    if isinstance(x, (list, tuple)):
+        x = numpy.array(x, dtype='S8')
+    if isinstance(x, numpy.ndarray):
+        if x.dtype != numpy.dtype('S8'):
+            raise ValueError, 'expected 8 character hex strings'
+        x = numpy.ascontiguousarray(x)
+    codes = numpy.frombuffer(x, dtype=numpy.uint8)
+    if codes.size % 8 != 0:
+        raise ValueError, 'buffer length must be a multiple of 8'
+    digits = HEX_DIGIT_TABLE[codes.reshape(-1, 8)]
+    if (digits < 0).any():
+        raise ValueError, 'invalid hex character'
+    x2c = (digits << NIBBLE_SHIFTS).sum(axis=1)
+    return numpy.where(x2c >= 0x80000000, x2c - 0x100000000, x2c)
+
+def to_twoscomp_array(x):
+    """
+    Array version of to_twoscomp. Returns an array of 8 character hex
+    strings (dtype S8) for an array of integers in the 32 bit range.
+    """
+    x = numpy.asarray(x, dtype=numpy.int64) & 0xffffffff
+    nibbles = (x[..., numpy.newaxis] >> NIBBLE_SHIFTS) & 0xf
+    chars = numpy.ascontiguousarray(HEX_CHARS[nibbles])
+    return chars.view('S8').reshape(x.shape)
+
+def alarm_status_array(x):
+    """
+    Array version of get_alarm_status decoding. Returns a boolean array
+    of alarm flags and an object array of lists of active alarms, both
+    with the shape of x. The lists for masks of the known alarm bits
+    are shared with the decode table and must not be modified.
+    """
+    x = numpy.asarray(x, dtype=numpy.int64)
+    if ((x >= 0) & (x < len(ALARM_LIST_TABLE))).all():
+        return ALARM_FLAG_TABLE[x], ALARM_LIST_TABLE[x]
+    # Unknown bits set - decode element by element
+    flags = numpy.empty(x.shape, dtype=bool)
+    lists = numpy.empty(x.shape, dtype=object)
+    for i, val in numpy.ndenumerate(x):
+        flags[i], lists[i] = ALARM_MASK.decode(int(val))
+    return flags, lists
+
+def alarm_bits_array(x):
+    """
+    Returns a dictionary of boolean arrays, one for each alarm in
+    ALARM_VALUES, which are True where that alarm is active.
+    """
+    x = numpy.asarray(x, dtype=numpy.int64)
+    return dict([(k, (x >> bit) & 1 == 1) for k, bit in ALARM_VALUES.items()])
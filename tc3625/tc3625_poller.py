@@ -0,0 +1,272 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Background polling of TC-36-25 properties at per property
+rates.
+
+The poller reads the properties in a scan list, each at its own rate,
+from a dedicated thread. Every sample is timestamped and the latest
+value of each property is kept so that application code can read it
+without touching the serial port. Listeners can be registered to
+receive every sample, e.g. to log it.
+
+Polls are scheduled earliest deadline first. The time taken by each
+transaction is tracked and, if the requested rates need more than the
+available wire time, all rates are scaled down by the same factor so
+that the scan list still fits. The pollers of the controllers on a
+shared TC3625_Bus or TC3625_CommandQueue share its wire time - the
+rates of all of them are scaled by the total load of the line.
+
+The polled values are read from the device, not from the register
+cache of the controller. A failed read is counted in errors and logged
+and an exception raised by a listener is counted in listener_errors
+and logged, polling carries on.
+
+Classes:
+  TC3625_Poller
+
+Usage:
+
+  scan_list = {
+      'input1': 10.0,         # Hz
+      'alarm status': 2.0,
+      'integral gain': 0.1,
+      }
+  ctlr.start_polling(scan_list)
+
+  t, temp = ctlr.get_latest('input1')
+
+  ctlr.stop_polling()
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import time
+import heapq
+import logging
+import threading
+
+DFLT_SCAN_LIST={
+    'input1': 10.0,
+    'power output': 2.0,
+    'output current': 2.0,
+    'alarm status': 2.0,
+    }
+
+# Fraction of the wire time the poller may use, the rest is left for
+# application commands.
+DFLT_MAX_UTILIZATION=0.8
+
+# Characters per read transaction (command + response) and bits per
+# character on the wire.
+READ_CHARS=8+12
+BITS_PER_CHAR=10
+
+# Weight of each new transaction time in the moving average
+TRANSACTION_TIME_GAIN=0.1
+
+log = logging.getLogger('tc3625')
+
+
+class TC3625_Poller:
+
+    """
+    Polls a scan list of TC3625 properties from a background thread.
+    """
+
+    def __init__(self,
+                 ctlr,
+                 scan_list=DFLT_SCAN_LIST,
+                 max_utilization=DFLT_MAX_UTILIZATION,
+                 ):
+        self.ctlr=ctlr
+        self.scan_list=dict(scan_list)
+        for prop in self.scan_list:
+            if not prop in ctlr.method_dict:
+                raise ValueError, 'unknown property %s'%(prop,)
+            if not 'get' in ctlr.method_dict[prop]:
+                raise ValueError, 'ungettable property %s'%(prop,)
+            if self.scan_list[prop] <= 0:
+                raise ValueError, 'rate for %s must be positive'%(prop,)
+        self.max_utilization=max_utilization
+        self.transaction_time=READ_CHARS*BITS_PER_CHAR/float(ctlr.baudrate)
+        self.scale=1.0
+        self.latest={}
+        self.errors={}
+        self.listeners=[]
+        self.listener_errors=0
+        self.line=_shared_line(ctlr)
+        self.lock=threading.Lock()
+        self.stop_event=threading.Event()
+        self.thread=None
+        self._update_scale()
+
+    def add_listener(self, func):
+        """
+        Register func to be called with (prop, timestamp, raw, value)
+        for every sample, from the polling thread. Exceptions raised by
+        func are logged and counted in listener_errors.
+        """
+        self.listeners.append(func)
+
+    def remove_listener(self, func):
+        """ Unregister a listener """
+        self.listeners.remove(func)
+
+    def start(self):
+        """ Start the polling thread """
+        if self.thread != None:
+            return
+        self.stop_event.clear()
+        if self.line != None:
+            self.line.pollers.append(self)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        """ Stop the polling thread """
+        if self.thread == None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        if self.line != None:
+            self.line.pollers.remove(self)
+
+    def get_latest(self, prop):
+        """
+        Return (timestamp, value) of the latest sample of the given
+        property, or None if it has not been sampled yet.
+        """
+        self.lock.acquire()
+        try:
+            sample = self.latest.get(prop)
+        finally:
+            self.lock.release()
+        if sample == None:
+            return None
+        return sample[0], sample[1]
+
+    def get_latest_raw(self, prop):
+        """
+        Return (timestamp, raw integer value) of the latest sample of
+        the given property, or None if it has not been sampled yet.
+        """
+        self.lock.acquire()
+        try:
+            sample = self.latest.get(prop)
+        finally:
+            self.lock.release()
+        if sample == None:
+            return None
+        return sample[0], sample[2]
+
+    def effective_rates(self):
+        """ Polling rate of each property after bandwidth scaling """
+        return dict([(k, v*self.scale) for k, v in self.scan_list.items()])
+
+    def load(self):
+        """ Fraction of the wire time needed by the unscaled scan list """
+        return sum(self.scan_list.values())*self.transaction_time
+
+    def _update_scale(self):
+        """
+        Scale the rates down if the scan lists of this and the other
+        pollers on a shared line do not fit into the available wire
+        time.
+        """
+        load = self.load()
+        if self.line != None:
+            for poller in list(self.line.pollers):
+                if not poller is self:
+                    load += poller.load()
+        if load > self.max_utilization:
+            self.scale = self.max_utilization/load
+        else:
+            self.scale = 1.0
+
+    def _poll(self, prop):
+        """ Read one property and record the sample """
+        method = self.ctlr.method_dict[prop]
+        t0 = time.time()
+        try:
+            raw = self.ctlr._get_value(method['cmd'], fresh=True)
+            value = method['get'].decode(raw)
+        except Exception, err:
+            self.errors[prop] = self.errors.get(prop,0) + 1
+            if isinstance(err, IOError):
+                log.debug('poll of %s failed: %s: %s', prop, err.__class__.__name__, err)
+            else:
+                log.warning('poll of %s failed: %s: %s', prop, err.__class__.__name__, err)
+            return
+        t1 = time.time()
+        self.transaction_time += TRANSACTION_TIME_GAIN*((t1 - t0) - self.transaction_time)
+        self._update_scale()
+        t = 0.5*(t0 + t1)
+        self.lock.acquire()
+        try:
+            self.latest[prop] = (t, value, raw)
+        finally:
+            self.lock.release()
+        for func in self.listeners:
+            try:
+                func(prop, t, raw, value)
+            except Exception, err:
+                self.listener_errors += 1
+                log.warning('poller listener %r failed on %s: %s: %s',
+                        func, prop, err.__class__.__name__, err)
+
+    def _run(self):
+        """ Polling loop - earliest deadline first """
+        now = time.time()
+        queue = [(now, prop) for prop in self.scan_list]
+        heapq.heapify(queue)
+        while not self.stop_event.isSet():
+            due, prop = queue[0]
+            wait = due - time.time()
+            if wait > 0:
+                self.stop_event.wait(wait)
+                continue
+            self._poll(prop)
+            period = 1.0/(self.scan_list[prop]*self.scale)
+            # Don't try to catch up on missed polls
+            due = max(due + period, time.time())
+            heapq.heapreplace(queue, (due, prop))
+
+
+def _shared_line(ctlr):
+    """
+    The TC3625_Bus or shared TC3625_CommandQueue of the controller, or
+    None if it has a serial line of its own.
+    """
+    if getattr(ctlr, 'bus', None) != None:
+        return ctlr.bus
+    if getattr(ctlr, 'queue', None) != None and not getattr(ctlr, 'own_queue', False):
+        return ctlr.queue
+    return None
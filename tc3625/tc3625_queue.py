@@ -0,0 +1,297 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Prioritized command queue in front of a serial line.
+
+Every transaction on the line (one command frame and its response)
+waits in the queue for its turn. When the line becomes free it is
+granted to the waiting transaction with the highest priority class,
+first come first served within a class. So a safety command waits at
+most for the transaction in progress, even behind a long get_all sweep
+or a busy poller, which are made of many single transactions.
+
+Priority classes, highest first:
+
+  PRIORITY_SAFETY     alarm status, power on/off and alarm latch commands
+  PRIORITY_OPERATOR   other writes
+  PRIORITY_TELEMETRY  reads of the registers in VOLATILE_CMDS
+  PRIORITY_CONFIG     other reads (configuration refresh)
+
+The class of a command can be changed with set_priority, or given
+explicitly for a single transaction.
+
+The queue records the depth (number of waiting transactions) and the
+time spent waiting, per priority class, see stats.
+
+Classes:
+  TC3625_CommandQueue
+  TC3625_QueueDevice
+
+Usage:
+
+  # A controller with its own queue
+  ctlr = TC3625(port='/dev/ttyUSB0', queue=True)
+
+  # Controllers on a multi-drop line sharing one queue
+  queue = TC3625_CommandQueue(TC3625_Bus(port='/dev/ttyUSB0'))
+  queue.open()
+  ctlr1 = TC3625(address='01', queue=queue)
+  ctlr2 = TC3625(address='02', queue=queue)
+
+  print queue.stats()
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import heapq
+import threading
+from tc3625_clock import monotonic
+from tc3625_serial import SERIAL_CMDS, VOLATILE_CMDS
+
+PRIORITY_SAFETY=0
+PRIORITY_OPERATOR=1
+PRIORITY_TELEMETRY=2
+PRIORITY_CONFIG=3
+PRIORITY_NAMES={
+    PRIORITY_SAFETY: 'safety',
+    PRIORITY_OPERATOR: 'operator',
+    PRIORITY_TELEMETRY: 'telemetry',
+    PRIORITY_CONFIG: 'config',
+    }
+
+# Serial commands in the safety class, for reads and writes: the alarm
+# status, the power state (set_power_state), the alarm latch reset
+# (set_alarm_latch_reset, write only) and the shutdown of the output on
+# alarm
+SAFETY_CMDS=[
+    'alarm status',
+    'power on/off',
+    'alarm latch request',
+    'output shutdown if alarm',
+    ]
+
+
+class TC3625_CommandQueue:
+
+    """
+    Grants a serial line (a TC3625_Serial or TC3625_Bus) to one
+    transaction at a time, in order of priority class.
+    """
+
+    def __init__(self, dev):
+        self.dev=dev
+        self.cond=threading.Condition()
+        self.waiting=[]
+        self.seq=0
+        self.busy=False
+        self.granted=None
+        # Running pollers of the controllers on the line, see
+        # TC3625_Poller
+        self.pollers=[]
+        self.read_priority={}
+        self.write_priority={}
+        for cmd in SERIAL_CMDS:
+            self.read_priority[cmd] = self._default_priority(cmd, False)
+            self.write_priority[cmd] = self._default_priority(cmd, True)
+        self.reset_stats()
+
+    def open(self):
+        """ Open the serial line """
+        return self.dev.open()
+
+    def close(self):
+        """ Close the serial line """
+        self.dev.close()
+
+    def device(self, address):
+        """
+        Returns a TC3625_QueueDevice for the controller with the given
+        address. This has the same read/write interface as
+        TC3625_Serial.
+        """
+        return TC3625_QueueDevice(self, address)
+
+    def set_priority(self, cmd, priority, write=None):
+        """
+        Set the priority class of a serial command, for reads if write
+        is False, for writes if write is True and for both if None.
+        """
+        if not cmd in SERIAL_CMDS:
+            raise ValueError, 'unknown command %s'%(cmd,)
+        if not priority in PRIORITY_NAMES:
+            raise ValueError, 'unknown priority class %s'%(priority,)
+        if write != True:
+            self.read_priority[cmd] = priority
+        if write != False:
+            self.write_priority[cmd] = priority
+
+    def read(self, cmd, address=None, priority=None):
+        """ Read a register, see TC3625_Serial.read """
+        if priority == None:
+            priority = self.read_priority[cmd]
+        self.acquire(priority)
+        try:
+            return self.dev.read(cmd, address)
+        finally:
+            self.release()
+
+    def write(self, cmd, val, address=None, priority=None):
+        """ Write a register, see TC3625_Serial.write """
+        if priority == None:
+            priority = self.write_priority[cmd]
+        self.acquire(priority)
+        try:
+            return self.dev.write(cmd, val, address)
+        finally:
+            self.release()
+
+    def acquire(self, priority):
+        """ Wait until the line is granted to a transaction """
+        t_start = monotonic()
+        self.cond.acquire()
+        try:
+            self.seq += 1
+            ticket = (priority, self.seq)
+            heapq.heappush(self.waiting, ticket)
+            self.depth[priority] += 1
+            self.max_depth[priority] = max(self.max_depth[priority], self.depth[priority])
+            self._grant()
+            while self.granted != ticket:
+                self.cond.wait()
+            self.depth[priority] -= 1
+            wait = monotonic() - t_start
+            stats = self.wait_stats[priority]
+            stats[0] += 1
+            stats[1] += wait
+            stats[2] = max(stats[2], wait)
+        finally:
+            self.cond.release()
+
+    def release(self):
+        """ Release the line and grant it to the next transaction """
+        self.cond.acquire()
+        try:
+            self.busy = False
+            self.granted = None
+            self._grant()
+        finally:
+            self.cond.release()
+
+    def _grant(self):
+        """
+        Grant the line to the waiting transaction with the highest
+        priority. Must be called with self.cond held.
+        """
+        if self.busy or not self.waiting:
+            return
+        self.granted = heapq.heappop(self.waiting)
+        self.busy = True
+        self.cond.notifyAll()
+
+    def _default_priority(self, cmd, write):
+        if cmd in SAFETY_CMDS:
+            return PRIORITY_SAFETY
+        if write:
+            return PRIORITY_OPERATOR
+        if cmd in VOLATILE_CMDS:
+            return PRIORITY_TELEMETRY
+        return PRIORITY_CONFIG
+
+    def queue_depth(self):
+        """ Number of waiting transactions per priority class name """
+        self.cond.acquire()
+        try:
+            return dict([(PRIORITY_NAMES[p], n) for p, n in self.depth.items()])
+        finally:
+            self.cond.release()
+
+    def stats(self):
+        """
+        Queue statistics per priority class name - the current and
+        maximum queue depth, the number of transactions and their mean
+        and maximum wait times in seconds.
+        """
+        self.cond.acquire()
+        try:
+            stats = {}
+            for p, name in PRIORITY_NAMES.items():
+                n, total, max_wait = self.wait_stats[p]
+                if n > 0:
+                    mean = total/n
+                else:
+                    mean = 0.0
+                stats[name] = {
+                    'depth': self.depth[p],
+                    'max_depth': self.max_depth[p],
+                    'count': n,
+                    'mean_wait': mean,
+                    'max_wait': max_wait,
+                    }
+            return stats
+        finally:
+            self.cond.release()
+
+    def reset_stats(self):
+        """ Clear the wait time and maximum depth statistics """
+        self.cond.acquire()
+        try:
+            if not hasattr(self, 'depth'):
+                self.depth = dict([(p, 0) for p in PRIORITY_NAMES])
+            self.max_depth = dict(self.depth)
+            self.wait_stats = dict([(p, [0, 0.0, 0.0]) for p in PRIORITY_NAMES])
+        finally:
+            self.cond.release()
+
+
+class TC3625_QueueDevice:
+
+    """
+    A single addressed controller behind a TC3625_CommandQueue.
+    Provides the same read/write interface as TC3625_Serial so it can be
+    used by TC3625 in its place.
+    """
+
+    def __init__(self, queue, address):
+        self.queue=queue
+        self.address=address
+
+    def open(self):
+        """ The line is opened by the queue - nothing to do """
+        return True
+
+    def close(self):
+        """ The line is closed by the queue - nothing to do """
+        pass
+
+    def read(self, cmd, priority=None):
+        """ Read value for command string from this controller """
+        return self.queue.read(cmd, self.address, priority)
+
+    def write(self, cmd, val, priority=None):
+        """ Write value for command string to this controller """
+        return self.queue.write(cmd, val, self.address, priority)
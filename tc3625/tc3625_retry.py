@@ -0,0 +1,208 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Retry policy and circuit breaker for the reads and writes of
+TC3625.
+
+TC3625_RetryPolicy decides, after a failed attempt, whether to try
+again and how long to wait first. Each error class has its own limit on
+the number of attempts - a corrupted response (checksum, NAK or frame
+error) is usually line noise and worth retrying many times, while a
+timeout usually means the controller is not there and costs a whole
+timeout per attempt. The wait between attempts grows exponentially
+from backoff up to max_backoff. The stale input is discarded before
+every attempt (TC3625_Serial flushes the input before sending), and
+the wait lets a late response from the failed attempt arrive before
+that flush.
+
+TC3625_CircuitBreaker fails reads and writes fast, with
+TC3625_CircuitOpenError, once a controller has failed threshold
+requests in a row. Every probe_interval seconds one request is let
+through, with a single attempt, to find out whether the controller is
+back. So a dead controller costs one timeout per probe_interval rather
+than max_attempt timeouts per request, and does not hold up the other
+controllers on a shared line.
+
+Classes:
+  TC3625_RetryPolicy
+  TC3625_CircuitBreaker
+  TC3625_CircuitOpenError
+
+Usage:
+
+  policy = TC3625_RetryPolicy(max_attempt=10, backoff=0.02)
+  policy.set_limit(TC3625_TimeoutError, 2)
+  breaker = TC3625_CircuitBreaker(threshold=3, probe_interval=10.0)
+  ctlr = TC3625(port='/dev/ttyUSB0', retry_policy=policy, breaker=breaker)
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import time
+import threading
+from tc3625_codec import TC3625_TimeoutError
+
+DFLT_MAX_ATTEMPT=10
+DFLT_TIMEOUT_ATTEMPT=3
+DFLT_BACKOFF=0.01
+DFLT_BACKOFF_FACTOR=2.0
+DFLT_MAX_BACKOFF=0.5
+DFLT_BREAKER_THRESHOLD=3
+DFLT_PROBE_INTERVAL=5.0
+
+# Circuit breaker states
+CLOSED='closed'
+OPEN='open'
+PROBING='probing'
+
+
+class TC3625_CircuitOpenError(IOError):
+    """ Request failed fast as the controller is known to be down """
+
+
+class TC3625_RetryPolicy:
+
+    """
+    Number of attempts per error class and bounded exponential backoff
+    between attempts.
+    """
+
+    def __init__(self,
+                 max_attempt=DFLT_MAX_ATTEMPT,
+                 timeout_attempt=DFLT_TIMEOUT_ATTEMPT,
+                 backoff=DFLT_BACKOFF,
+                 backoff_factor=DFLT_BACKOFF_FACTOR,
+                 max_backoff=DFLT_MAX_BACKOFF,
+                 ):
+        """
+        max_attempt is the number of attempts for errors without their
+        own limit, timeout_attempt the number of attempts when the last
+        attempt timed out. The first retry waits backoff seconds, each
+        later one backoff_factor times longer up to max_backoff.
+        """
+        self.max_attempt=max_attempt
+        self.backoff=backoff
+        self.backoff_factor=backoff_factor
+        self.max_backoff=max_backoff
+        self.limits=[]
+        self.set_limit(TC3625_TimeoutError, min(timeout_attempt, max_attempt))
+
+    def set_limit(self, error_class, max_attempt):
+        """
+        Set the number of attempts after which a request is given up if
+        the last attempt failed with an error of error_class (an IOError
+        subclass). The most recently set matching class is used.
+        """
+        self.limits = [(c, n) for c, n in self.limits if c != error_class]
+        self.limits.insert(0, (error_class, max_attempt))
+
+    def limit(self, err):
+        """ Number of attempts allowed when the last attempt raised err """
+        for error_class, max_attempt in self.limits:
+            if isinstance(err, error_class):
+                return max_attempt
+        return self.max_attempt
+
+    def delay(self, err, cnt):
+        """
+        Returns the time to wait before the next attempt after cnt
+        failed attempts, the last of which raised err, or None to give
+        up.
+        """
+        if cnt >= self.limit(err):
+            return None
+        return min(self.backoff*self.backoff_factor**(cnt - 1), self.max_backoff)
+
+
+class TC3625_CircuitBreaker:
+
+    """
+    Fails requests to a controller fast while it is known to be down,
+    probing it every probe_interval seconds.
+    """
+
+    def __init__(self,
+                 threshold=DFLT_BREAKER_THRESHOLD,
+                 probe_interval=DFLT_PROBE_INTERVAL,
+                 ):
+        self.threshold=threshold
+        self.probe_interval=probe_interval
+        self.lock=threading.Lock()
+        self.state=CLOSED
+        self.failures=0
+        self.t_open=None
+
+    def allow(self):
+        """
+        Called before a request. Returns False for a normal request and
+        True for a probe, which should be tried once only. Raises
+        TC3625_CircuitOpenError if the request must fail fast.
+        """
+        self.lock.acquire()
+        try:
+            if self.state == CLOSED:
+                return False
+            if self.state == OPEN and time.time() - self.t_open >= self.probe_interval:
+                self.state = PROBING
+                return True
+            raise TC3625_CircuitOpenError, 'controller down since %s'%(
+                    time.strftime('%H:%M:%S', time.localtime(self.t_open)),)
+        finally:
+            self.lock.release()
+
+    def success(self):
+        """ Called after a successful request """
+        self.lock.acquire()
+        try:
+            self.state = CLOSED
+            self.failures = 0
+            self.t_open = None
+        finally:
+            self.lock.release()
+
+    def failure(self):
+        """ Called after a failed request (after its retries) """
+        self.lock.acquire()
+        try:
+            self.failures += 1
+            if self.state == PROBING:
+                self.state = OPEN
+                self.t_open = time.time()
+            elif self.state == CLOSED and self.failures >= self.threshold:
+                self.state = OPEN
+                self.t_open = time.time()
+        finally:
+            self.lock.release()
+
+    def reset(self):
+        """ Close the breaker, e.g. after the connection is reopened """
+        self.success()
+
+    def is_open(self):
+        """ Returns True while requests fail fast """
+        return self.state != CLOSED
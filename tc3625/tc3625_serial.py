@@ -35,7 +35,8 @@ The low level protocol packs the given write/read command into an
 appropriate send string bounded by (stx) and (etx) characters. All
 write values (integers) are converted to twos complement. A send and
 recieve is performed for each write/read command and a checksum is
-computed for each send and receive.
+computed for each send and receive. The framing itself is done by
+TC3625_Codec (see tc3625_codec.py).
 
 Note, for a write command, no checking is performed to verify that the
 given integer value is within the ranges allowed by the controller.
@@ -52,6 +53,10 @@ Usage:
 
   # Initialization
   dev = TC3625_Serial()
+
+  # Initialization for a controller at another address on a multi-drop
+  # line, addresses are 2 character hex strings
+  dev = TC3625_Serial(address='01')
     
   # Open serial connection to device
   dev.open() 
@@ -63,6 +68,32 @@ Usage:
   # Read value from controller
   val = dev.read(cmd_str)
 
+  # Read value from the controller with a given address 
+  val = dev.read(cmd_str, address='02')
+
+  # Record the raw traffic to a capture file (see tc3625_capture.py)
+  dev.start_capture('session.cap')
+  dev.stop_capture()
+
+  # Other transports are selected by URL (see tc3625_transport.py)
+  dev = TC3625_Serial(port='tcp://10.0.0.7:4001')
+
+  # Use an already open serial port like object, e.g. a replay
+  dev = TC3625_Serial(port=TC3625_Replay('session.cap'))
+
+  # Round trip time statistics of the transactions on the link
+  n, mean, std = dev.get_rtt_stats('input1')
+
+  # Current adaptive read timeout for reads and writes
+  dev.get_timeout(SEND_SIZE_READ), dev.get_timeout(SEND_SIZE_WRITE)
+
+  # Counters and latency histograms (see tc3625_metrics.py)
+  dev = TC3625_Serial(port='/dev/ttyUSB0', metrics=TC3625_Metrics())
+  print dev.metrics.prometheus()
+
+  # Tracing hooks around every frame (see tc3625_trace.py)
+  dev.add_hook(TC3625_ChromeTrace('trace.json'))
+
   # Close serial connection
   dev.close() 
 
@@ -79,23 +110,34 @@ Usage:
 Author: Will Dickson  
 ----------------------------------------------------------------------------
 """
-import struct
-import serial
+import math
+from tc3625_codec import TC3625_Codec, TC3625_Parser
+from tc3625_codec import ADDRESS, STX, ETX, ACK
+from tc3625_codec import SEND_SIZE_WRITE, SEND_SIZE_READ, RETURN_SIZE
+from tc3625_codec import TC3625_TimeoutError, TC3625_LinkError
+from tc3625_capture import TC3625_CaptureWriter, TC3625_CaptureSerial, TC3625_Replay
+from tc3625_clock import monotonic
+from tc3625_transport import open_transport, link_lost, LINK_EXCEPTIONS
 
 # Defualt Serial Port settings
 DFLT_PORT='/dev/ttyS0'
 DFLT_TIMEOUT=2.0
 DFLT_BAUDRATE=9600
 
-# Seial protocol constants
-ADDRESS='00'
-STX=chr(0x2a)
-ETX=chr(0x0d)
-ACK=chr(0x5e)
-
-SEND_SIZE_WRITE=16
-SEND_SIZE_READ=8
-RETURN_SIZE=12
+# Adaptive read timeout. The response time of each link is tracked per
+# command frame size (reads and writes) as an exponentially weighted
+# mean and variance with weight TIMEOUT_ALPHA. Once TIMEOUT_MIN_SAMPLES
+# responses have been seen the read timeout is the mean plus TIMEOUT_K
+# standard deviations, at least the wire time of the command and reply
+# plus TIMEOUT_MARGIN and at most the configured timeout. It is doubled
+# after each timeout until a response is received.
+DFLT_ADAPTIVE_TIMEOUT=True
+TIMEOUT_ALPHA=0.05
+TIMEOUT_K=4.0
+TIMEOUT_MIN_SAMPLES=10
+TIMEOUT_MARGIN=0.01
+TIMEOUT_RESOLUTION=0.005
+BITS_PER_BYTE=10
 
 # Low level serial command description strings - these come directly from 
 # the TC3625 serial protocol
@@ -495,6 +537,18 @@ SERIAL_CMDS = {
         },
 }
 
+# Serial commands whose values change without being written. These are
+# never served from the register cache of TC3625 and are read as
+# telemetry by TC3625_CommandQueue.
+VOLATILE_CMDS=[
+    'input1',
+    'input2',
+    'power output',
+    'alarm status',
+    'output current counts',
+    'desired control value',
+    ]
+
 class TC3625_Serial:
 
     """ 
@@ -506,15 +560,48 @@ class TC3625_Serial:
                  port=DFLT_PORT,
                  timeout=DFLT_TIMEOUT,
                  baud_rate=DFLT_BAUDRATE,
+                 address=ADDRESS,
+                 capture=None,
+                 metrics=None,
+                 adaptive_timeout=DFLT_ADAPTIVE_TIMEOUT,
                  ):
         self.port=port
         self.timeout=timeout
         self.baud_rate=baud_rate
-        self.address=ADDRESS
+        self.address=address
+        self.serial=None
+        self.replay=False
+        self.capture=None
+        self.capture_file=capture
+        self.last_rtt=None
+        self.rtt_stats={}
+        self.adaptive_timeout=adaptive_timeout
+        self.link_stats={}
+        self.read_timeout=timeout
+        self.metrics=metrics
+        self.hooks=[]
         self.serial_cmds = SERIAL_CMDS
         self.stx=STX
         self.etx=ETX
         self.ack=ACK
+        self.codec=TC3625_Codec(self.address,self.serial_cmds)
+        self.codecs={self.address: self.codec}
+        self.parser=TC3625_Parser(self.codec)
+
+    def get_codec(self, address=None):
+        """
+        Get the frame codec for the given controller address. Codecs,
+        and so the precomputed read frames, are created once per
+        address.
+        """
+        if address == None:
+            return self.codec
+        try:
+            return self.codecs[address]
+        except KeyError:
+            codec = TC3625_Codec(address,self.serial_cmds)
+            self.codecs[address] = codec
+            return codec
 
     def get_rw_str(self, cmd):
         """
@@ -557,20 +644,41 @@ class TC3625_Serial:
         print 'read: ', self.serial_cmds[cmd]['read']
         
     def open(self):
-        """ Open serial port """
-        self.serial = serial.Serial(
-            self.port,
-            timeout = self.timeout,
-            bytesize=serial.EIGHTBITS,
-            baudrate=self.baud_rate,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            xonxoff=0,
-            rtscts=0,
-            )
+        """ 
+        Open serial port. port is a device name or a transport URL, see
+        tc3625_transport.py, otherwise it is used as an already open
+        serial port like object (e.g. a TC3625_Replay).
+        """
+        if isinstance(self.port, basestring):
+            self.serial = open_transport(self.port, self.timeout, self.baud_rate)
+        else:
+            self.serial = self.port
+        self.read_timeout = getattr(self.serial, 'timeout', self.timeout)
+        # A replay times out where the captured session did, whatever its
+        # speed, so the timeout must not adapt to the replayed responses
+        self.replay = isinstance(self.serial, TC3625_Replay)
+        if self.capture_file != None:
+            self.start_capture(self.capture_file)
         return self.serial.isOpen()
+
+    def start_capture(self, filename):
+        """
+        Record all data sent and received from now on to the given
+        capture file, replacing any capture in progress.
+        """
+        self.stop_capture()
+        self.capture = TC3625_CaptureWriter(filename)
+        self.serial = TC3625_CaptureSerial(self.serial, self.capture)
+
+    def stop_capture(self):
+        """ Stop recording and close the capture file """
+        if self.capture == None:
+            return
+        self.serial = self.serial.serial
+        self.capture.close()
+        self.capture = None
     
-    def write(self, cmd, val):
+    def write(self, cmd, val, address=None):
         """ 
         Generic write command - used to set values in controller. 
 
@@ -583,32 +691,16 @@ class TC3625_Serial:
         specified as signed integer and not as twos complement as the
         twos complement required for the send string is computed by
         this function. 
+
+        The command is sent to the controller with the given address,
+        or to self.address if address is None.
         """
         if self.serial_cmds[cmd]['write']==None:
             raise ValueError, 'write unsupported for command %s'%(cmd,)
-        # Create sereial command
-        cc=self.serial_cmds[cmd]['write']
-        val = int(val)
-        val_2c = to_twoscomp(val)
-        cs=get_checksum(self.address+cc+val_2c)
-        cmd_list = [self.stx,self.address[0],self.address[1],cc[0],cc[1]]
-        for x in val_2c:
-            cmd_list.append(x)
-        cmd_list.extend([cs[0],cs[1],self.etx])
-        cmd = struct.pack('c'*SEND_SIZE_WRITE,*cmd_list)
-        # Send serial command and read response
-        self.serial.write(cmd)
-        self.serial.flush()
-        ret = self.serial.read(RETURN_SIZE)
-        cs = get_checksum(ret[1:-3])
-        cs_ret = ret[-3:-1]
-        if cs != cs_ret:
-            raise IOError, 'return checksum %s does not match calculated %s'%(cs_ret,cs)
-        if ret[1:-3] == 'X'*8:
-            raise IOError, 'sent checksum incorrect'
-        return from_twoscomp(ret[1:-3])
-
-    def read(self, cmd):
+        frame = self.get_codec(address).write_frame(cmd,val)
+        return self._transact(frame, cmd)
+
+    def read(self, cmd, address=None):
         """ 
         Generic read command - used to read values from controller
         
@@ -617,28 +709,200 @@ class TC3625_Serial:
         on particular commands see the TC-36-25 operation manual, use
         dev.print_help(cmd), or see the appropriate _DSCR_STR
         variable.
+
+        The command is sent to the controller with the given address,
+        or to self.address if address is None.
         """
         if self.serial_cmds[cmd]['read']==None:
             raise ValueError, 'read unsupported for command %s'%(cmd,)
-        # Create serial command
-        cc=self.serial_cmds[cmd]['read'] 
-        cs=get_checksum(self.address+cc)
-        cmd_tuple = (self.stx,self.address[0],self.address[1],cc[0],cc[1],cs[0],cs[1],self.etx)
-        cmd = struct.pack('c'*SEND_SIZE_READ,*cmd_tuple)
-        # Send serial command and read response
-        self.serial.write(cmd)
-        self.serial.flush()
-        ret = self.serial.read(RETURN_SIZE)
-        cs = get_checksum(ret[1:-3])
-        cs_ret = ret[-3:-1]
-        if cs != cs_ret:
-            raise IOError, 'return checksum %s does not match calculated %s'%(cs_ret,cs)
-        if ret[1:-3] == 'X'*8:
-            raise IOError, 'sent checksum incorrect'
-        return from_twoscomp(ret[1:-3])
+        frame = self.get_codec(address).read_frames[cmd]
+        return self._transact(frame, cmd)
+
+    def add_hook(self, hook):
+        """
+        Register a tracing hook, a TC3625_TraceHook. Its on_transmit,
+        on_first_byte and on_response methods are called for every
+        transaction with the command string, the raw frame and the
+        monotonic time.
+        """
+        if not hook in self.hooks:
+            self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """ Unregister a tracing hook """
+        self.hooks.remove(hook)
+
+    def get_rtt_stats(self, cmd):
+        """
+        Returns (number, mean, standard deviation) of the round trip
+        times, in seconds, of the successful transactions of the given
+        command string, or None if there have been none.
+        """
+        try:
+            n, mean, m2 = self.rtt_stats[cmd]
+        except KeyError:
+            return None
+        if n > 1:
+            std = (m2/(n - 1))**0.5
+        else:
+            std = 0.0
+        return n, mean, std
+
+    def get_timeout(self, send_size):
+        """
+        Returns the read timeout for a command frame of send_size
+        bytes. This is the configured timeout unless adaptive_timeout is
+        set and enough responses have been seen, see TIMEOUT_K. The
+        timeout of a replay (TC3625_Replay) is fixed.
+        """
+        if not self.adaptive_timeout or self.replay:
+            return self.timeout
+        try:
+            n, mean, var, backoff = self.link_stats[send_size]
+        except KeyError:
+            return self.timeout
+        if n < TIMEOUT_MIN_SAMPLES:
+            return self.timeout
+        timeout = max(mean + TIMEOUT_K*math.sqrt(var), self.wire_time(send_size) + TIMEOUT_MARGIN)
+        timeout = math.ceil(timeout*backoff/TIMEOUT_RESOLUTION)*TIMEOUT_RESOLUTION
+        return min(timeout, self.timeout)
+
+    def wire_time(self, send_size):
+        """
+        Time to send a command frame of send_size bytes and receive the
+        reply at the baud rate.
+        """
+        return (send_size + RETURN_SIZE)*BITS_PER_BYTE/float(self.baud_rate)
+
+    def _transact(self, frame, cmd=None):
+        """
+        Send command frame and return the value from the response. Any
+        stale input is discarded before sending. The response is read
+        incrementally so that garbage is skipped and a bad frame or bad
+        checksum reply raises IOError as soon as it has been received.
+        The round trip time of a successful transaction is added to the
+        statistics of cmd, the transaction is recorded in metrics if it
+        is set and the tracing hooks are called, on_first_byte when the
+        first byte of the response arrives. The response must
+        arrive within the read timeout for the frame size (see
+        get_timeout). A failure of the port itself raises
+        TC3625_LinkError.
+        """
+        metrics = self.metrics
+        hooks = self.hooks
+        received = 0
+        if hooks:
+            response = bytearray()
+        try:
+            self.serial.flushInput()
+            self.parser.reset()
+            timeout = self.get_timeout(len(frame))
+            if timeout != self.read_timeout:
+                self.serial.timeout = timeout
+                self.read_timeout = timeout
+            if hooks:
+                t = monotonic()
+                for hook in hooks:
+                    hook.on_transmit(cmd, frame, t)
+            t_start = monotonic()
+            self.serial.write(frame)
+            self.serial.flush()
+            deadline = t_start + timeout
+            while True:
+                val = self.parser.next_value()
+                if val != None:
+                    self.last_rtt = monotonic() - t_start
+                    if cmd != None:
+                        self._update_rtt(cmd, self.last_rtt)
+                    self._update_link(len(frame), self.last_rtt)
+                    if metrics != None:
+                        metrics.transaction(cmd or '', len(frame), received, self.last_rtt)
+                    if hooks:
+                        t = monotonic()
+                        for hook in hooks:
+                            hook.on_response(cmd, str(response), t, None)
+                    return val
+                if monotonic() > deadline:
+                    raise TC3625_TimeoutError, 'timeout waiting for response'
+                if hooks and received == 0:
+                    # The first byte on its own, as read blocks until
+                    # all the bytes asked for have arrived
+                    data = self.serial.read(1)
+                else:
+                    data = self.serial.read(self.parser.needed())
+                if not data:
+                    raise TC3625_TimeoutError, 'timeout waiting for response'
+                if hooks:
+                    if received == 0:
+                        t = monotonic()
+                        for hook in hooks:
+                            hook.on_first_byte(cmd, data, t)
+                    response.extend(data)
+                received += len(data)
+                self.parser.feed(data)
+        except LINK_EXCEPTIONS, err:
+            if not isinstance(err, IOError) or link_lost(err):
+                err = TC3625_LinkError('%s: %s'%(err.__class__.__name__, err))
+            elif isinstance(err, TC3625_TimeoutError):
+                self._backoff_link(len(frame))
+            if metrics != None:
+                metrics.transaction(cmd or '', len(frame), received, None, err)
+            if hooks:
+                t = monotonic()
+                for hook in hooks:
+                    hook.on_response(cmd, str(response), t, err)
+            if isinstance(err, TC3625_LinkError):
+                raise err
+            raise
+
+    def _update_rtt(self, cmd, rtt):
+        """ Add rtt to the running mean and variance (Welford) of cmd """
+        try:
+            stats = self.rtt_stats[cmd]
+        except KeyError:
+            stats = [0, 0.0, 0.0]
+            self.rtt_stats[cmd] = stats
+        stats[0] += 1
+        delta = rtt - stats[1]
+        stats[1] += delta/stats[0]
+        stats[2] += delta*(rtt - stats[1])
+
+    def _update_link(self, send_size, rtt):
+        """
+        Add rtt to the exponentially weighted mean and variance of the
+        response time of frames of send_size bytes
+        """
+        try:
+            stats = self.link_stats[send_size]
+        except KeyError:
+            self.link_stats[send_size] = [1, rtt, 0.0, 1.0]
+            return
+        delta = rtt - stats[1]
+        if stats[0] < TIMEOUT_MIN_SAMPLES:
+            # Plain mean and variance until the estimate has settled
+            alpha = 1.0/(stats[0] + 1)
+        else:
+            alpha = TIMEOUT_ALPHA
+        stats[0] += 1
+        stats[1] += alpha*delta
+        stats[2] = (1.0 - alpha)*(stats[2] + alpha*delta*delta)
+        stats[3] = 1.0
+
+    def _backoff_link(self, send_size):
+        """ Double the read timeout for frames of send_size bytes """
+        try:
+            stats = self.link_stats[send_size]
+        except KeyError:
+            return
+        if self.get_timeout(send_size) < self.timeout:
+            stats[3] *= 2.0
 
     def close(self):
         """ Close serial port"""
+        if self.serial == None:
+            # Not opened, or reopening it failed
+            return
+        self.stop_capture()
         self.serial.close()
 
 # ------------------------------------------------------------------------------------
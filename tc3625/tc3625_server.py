@@ -0,0 +1,367 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Local server sharing TC3625 controllers between several
+client programs.
+
+A serial port can only be opened by one program. The server owns the
+TC3625 connections and serves the raw register reads and writes of any
+number of clients over a local TCP or UNIX socket. Identical reads
+from several clients at the same time are coalesced into a single
+transaction on the serial line (the single-flight reads of TC3625),
+and the configuration registers are served from the TC3625 register
+cache.
+
+TC3625_Client has the same API as TC3625 (it is a TC3625 whose raw
+reads and writes go to the server), so the conversion of values and
+the range checks are done in the client exactly as in TC3625.
+
+Protocol - one JSON array per line in each direction:
+
+  request                       response
+  [id, 'r', ctlr, cmd, fresh]   [id, 'ok', raw value]
+  [id, 'R', ctlr, [cmd, ...]]   [id, 'ok', [[raw value or null, error or null], ...]]
+  [id, 'w', ctlr, cmd, raw]     [id, 'ok', raw value echoed by the device]
+  [id, 'i', ctlr, cmd or null]  [id, 'ok', null]
+  [id, 'l']                     [id, 'ok', [ctlr, ...]]
+
+A failed request gets [id, 'error', exception name, message]. fresh is
+optional, if it is true the read bypasses the cache of the server.
+
+Classes:
+  TC3625_Server
+  TC3625_Client
+
+Usage:
+
+  # Server
+  ctlrs = {'bath': TC3625(port='/dev/ttyUSB0'), 'stage': TC3625(port='/dev/ttyUSB1')}
+  server = TC3625_Server(ctlrs, address=('127.0.0.1', 3625))
+  server.serve_forever()
+
+  # Clients
+  ctlr = TC3625_Client('bath', address=('127.0.0.1', 3625))
+  print ctlr.get_input1()
+  ctlr.set_fixed_control_setting(20.0)
+  ctlr.close()
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import json
+import time
+import socket
+import threading
+import SocketServer
+from tc3625 import TC3625, METHOD_DICT
+
+DFLT_SERVER_ADDRESS=('127.0.0.1', 3625)
+DFLT_CLIENT_TIMEOUT=30.0
+
+# Raw command strings which may be requested
+CMDS=set([METHOD_DICT[k]['cmd'] for k in METHOD_DICT])
+
+# Exceptions passed from the server to the client, others are raised as
+# IOError in the client.
+CLIENT_EXCEPTIONS={
+    'IOError': IOError,
+    'ValueError': ValueError,
+    }
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+
+    """ Serves the requests of one client connection """
+
+    def handle(self):
+        server = self.server.tc3625_server
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                req_id = request[0]
+            except (ValueError, IndexError, TypeError):
+                break
+            try:
+                response = [req_id, 'ok', server.handle_request(request)]
+            except Exception, err:
+                response = [req_id, 'error', err.__class__.__name__, str(err)]
+            try:
+                self.wfile.write(json.dumps(response, separators=(',',':')) + '\n')
+                self.wfile.flush()
+            except socket.error:
+                # The client has given up on the request and closed
+                # the connection
+                break
+
+
+class _TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class _UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+        daemon_threads = True
+
+
+class TC3625_Server:
+
+    """
+    Serves the raw register reads and writes of a set of TC3625
+    controllers to local clients.
+    """
+
+    def __init__(self, ctlrs, address=DFLT_SERVER_ADDRESS, cache=True):
+        """
+        ctlrs is a dictionary of controller names and TC3625 objects.
+        address is a (host, port) tuple for a TCP socket or a file name
+        for a UNIX socket. With cache=True the register cache of the
+        controllers is enabled.
+        """
+        self.ctlrs=dict(ctlrs)
+        if cache:
+            for ctlr in self.ctlrs.values():
+                ctlr.cache_enabled = True
+        self.address=address
+        if isinstance(address, basestring):
+            self.server = _UnixServer(address, _Handler)
+        else:
+            self.server = _TCPServer(address, _Handler)
+            self.address = self.server.server_address
+        self.server.tc3625_server = self
+        self.thread=None
+
+    def serve_forever(self):
+        """ Serve clients until shutdown is called """
+        self.server.serve_forever()
+
+    def start(self):
+        """ Serve clients from a background thread """
+        if self.thread != None:
+            return
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def shutdown(self):
+        """ Stop serving and close the listening socket """
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+
+    def handle_request(self, request):
+        """ Carry out a decoded request, returns the response value """
+        op = request[1]
+        if op == 'l':
+            return sorted(self.ctlrs.keys())
+        ctlr = self._ctlr(request[2])
+        if op == 'r':
+            fresh = len(request) > 4 and request[4] == True
+            return self.read(ctlr, self._cmd(request[3]), fresh)
+        elif op == 'R':
+            values = []
+            for cmd in request[3]:
+                try:
+                    values.append([self.read(ctlr, self._cmd(cmd)), None])
+                except (IOError, ValueError), err:
+                    values.append([None, [err.__class__.__name__, str(err)]])
+            return values
+        elif op == 'w':
+            raw = request[4]
+            if not isinstance(raw, (int, long, float)) or isinstance(raw, bool):
+                raise ValueError, 'raw value must be a number'
+            return ctlr._set_value(self._cmd(request[3]), raw)
+        elif op == 'i':
+            if request[3] == None:
+                ctlr.cache.clear()
+            else:
+                ctlr.cache.pop(self._cmd(request[3]), None)
+            return None
+        raise ValueError, 'unknown operation %s'%(op,)
+
+    def read(self, ctlr, cmd, fresh=False):
+        """
+        Read a register. Concurrent reads of the same register of a
+        controller share a single read (see TC3625._get_value). With
+        fresh=True the cache is bypassed.
+        """
+        return ctlr._get_value(cmd, fresh)
+
+    def _ctlr(self, name):
+        try:
+            return self.ctlrs[name]
+        except KeyError:
+            raise ValueError, 'unknown controller %s'%(name,)
+
+    def _cmd(self, cmd):
+        if not cmd in CMDS:
+            raise ValueError, 'unknown command %s'%(cmd,)
+        return str(cmd)
+
+
+class TC3625_Client(TC3625):
+
+    """
+    Client of a TC3625_Server with the same API as TC3625. The metrics,
+    circuit breaker and tracing of the serial line are those of the
+    controller in the server - stats returns None.
+    """
+
+    def __init__(self, name, address=DFLT_SERVER_ADDRESS,
+                 timeout=DFLT_CLIENT_TIMEOUT, open=True):
+        self.name=name
+        self.server_address=address
+        self.sock=None
+        self.rfile=None
+        self.req_id=0
+        # Caching, coalescing, retries, metrics and reconnection of the
+        # serial line are done by the server, they are disabled in the
+        # client
+        self._setup(
+            port=None,
+            timeout=timeout,
+            max_attempt=1,
+            coalesce_window=0.0,
+            adaptive_timeout=False,
+            reconnect=False,
+            )
+        if open==True:
+            self.open()
+
+    def open(self):
+        """ Connect to the server """
+        self._connect()
+        if not self.name in self._request('l'):
+            self.close()
+            raise ValueError, 'server has no controller %s'%(self.name,)
+        return True
+
+    def _connect(self):
+        if isinstance(self.server_address, basestring):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.server_address)
+        else:
+            self.sock = socket.create_connection(self.server_address, self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile('rb')
+
+    def _disconnect(self):
+        if self.sock != None:
+            self.rfile.close()
+            self.sock.close()
+            self.sock = None
+            self.rfile = None
+
+    def close(self):
+        """ Disconnect from the server """
+        self.stop_polling()
+        self._disconnect()
+        self.link_down = None
+
+    def get_all(self):
+        """
+        Get all device properties, with a single request to the server
+        """
+        props = [k for k in self.method_dict if 'get' in self.method_dict[k]]
+        cmds = [self.method_dict[k]['cmd'] for k in props]
+        values = self._request('R', self.name, cmds)
+        prop = {}
+        for k, (raw, error) in zip(props, values):
+            if error != None:
+                raise CLIENT_EXCEPTIONS.get(error[0], IOError)(error[1])
+            prop[k] = self.method_dict[k]['get'].decode(raw)
+        return prop
+
+    def invalidate(self, prop_str=None):
+        """ Invalidate the server's cached value of the given property """
+        if prop_str == None:
+            self._request('i', self.name, None)
+            return
+        if not prop_str in self.method_dict.keys():
+            raise ValueError, 'unknown property %s'%(str(prop_str),)
+        self._request('i', self.name, self.method_dict[prop_str]['cmd'])
+
+    def set_cache_ttl(self, prop_str, ttl):
+        raise ValueError, 'cache time to live is set on the server'
+
+    def _get_value(self, cmd, fresh=False):
+        return self._request('r', self.name, cmd, fresh)
+
+    def _set_value(self, cmd, val):
+        return self._request('w', self.name, cmd, val)
+
+    def _request(self, op, *args):
+        """
+        Send a request and wait for its response. After a failed
+        request, e.g. a timeout, the response may still be on its way,
+        so the connection is closed and opened again on the next
+        request.
+        """
+        self.lock.acquire()
+        try:
+            if self.sock == None:
+                if self.link_down == None:
+                    raise IOError, 'not connected'
+                try:
+                    self._connect()
+                except socket.error, err:
+                    self._disconnect()
+                    raise IOError, 'server connection failed: %s'%(err,)
+                self.link_down = None
+            self.req_id += 1
+            request = [self.req_id, op] + list(args)
+            try:
+                self.sock.sendall(json.dumps(request, separators=(',',':')) + '\n')
+                line = self.rfile.readline()
+            except socket.error, err:
+                self._drop()
+                raise IOError, 'server connection failed: %s'%(err,)
+            if not line:
+                self._drop()
+                raise IOError, 'server closed the connection'
+            response = json.loads(line)
+            if response[0] != request[0]:
+                self._drop()
+                raise IOError, 'response out of sequence'
+        finally:
+            self.lock.release()
+        if response[1] == 'error':
+            raise CLIENT_EXCEPTIONS.get(response[2], IOError)(response[3])
+        return response[2]
+
+    def _drop(self):
+        # Close a connection which is out of step with the server, it is
+        # opened again by the next request
+        self._disconnect()
+        self.link_down = time.time()
@@ -0,0 +1,389 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Fleet of TC-36-25 controllers polled by several worker
+processes, with the latest values published in shared memory.
+
+The serial ports of the fleet are sharded over worker processes
+(controllers sharing a port stay in the same shard). Each worker opens
+its controllers with a TC3625Fleet and polls them with a TC3625_Poller
+per controller. Every sample is written to a latest value table in
+shared memory, which has a fixed slot for every controller and
+property in the scan list, so consumers in any local process can read
+the current values directly, without a round trip to the workers and
+without touching the serial ports.
+
+The table is a memory mapped file in /dev/shm (the temp directory if
+there is none), named when it is created and opened by name by the
+consumers. It starts with a header and a JSON directory of the
+controller names and properties, followed by the slots. Each slot holds
+a sequence number, the raw value, the timestamp and the value as a
+float (NaN for non numeric properties). There is one writer per slot,
+which makes the sequence number odd while it updates the slot, so
+readers can detect a torn read and retry (a seqlock).
+
+Requires numpy.
+
+Classes:
+  TC3625_SharedTable
+  TC3625_ShardedFleet
+
+Usage:
+
+  fleet = TC3625_ShardedFleet(ports, shards=4, name='lab')
+  fleet.start()
+  ...
+  fleet.stop()
+
+  # In any local process
+  table = TC3625_SharedTable('lab')
+  t, temp = table.get('/dev/ttyUSB0', 'input1')
+  temps = table.column('input1')     # dictionary of all controllers
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import os
+import json
+import tempfile
+import multiprocessing
+import numpy
+from tc3625 import METHOD_DICT, DFLT_ADDRESS
+from tc3625_fleet import TC3625Fleet
+from tc3625_poller import DFLT_SCAN_LIST
+
+MAGIC='TC3625SM'
+VERSION=1
+HEADER_DTYPE=numpy.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('slots_offset', '<u4'),
+    ('num_ctlrs', '<u4'),
+    ('num_props', '<u4'),
+    ('directory_size', '<u4'),
+    ('pad', 'V4'),
+    ])
+SLOT_DTYPE=numpy.dtype([
+    ('seq', '<u4'),
+    ('raw', '<i4'),
+    ('time', '<f8'),
+    ('value', '<f8'),
+    ])
+SLOT_ALIGN=64
+
+# Attempts at a consistent read of a slot being written
+MAX_READ_ATTEMPT=1000
+
+# Seconds between attempts to open the controllers which failed to open
+REOPEN_INTERVAL=10.0
+
+if os.path.isdir('/dev/shm'):
+    SHM_DIR='/dev/shm'
+else:
+    SHM_DIR=tempfile.gettempdir()
+
+
+class TC3625_SharedTable:
+
+    """
+    Latest value table, with a slot per controller and property, in a
+    named shared memory file.
+    """
+
+    def __init__(self, name, controllers=None, props=None):
+        """
+        Open the table with the given name. If controllers and props,
+        lists of controller names and property names, are given a new
+        table is created, replacing any existing one.
+        """
+        self.name=name
+        self.filename=table_filename(name)
+        if controllers != None:
+            self._create(controllers, props)
+        header = numpy.memmap(self.filename, dtype=HEADER_DTYPE, mode='r', shape=(1,))[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise IOError, '%s is not a tc3625 shared table'%(self.filename,)
+        fid = open(self.filename, 'rb')
+        try:
+            fid.seek(HEADER_DTYPE.itemsize)
+            directory = json.loads(fid.read(int(header['directory_size'])))
+        finally:
+            fid.close()
+        self.controllers=directory['controllers']
+        self.props=directory['props']
+        self.ctlr_index=dict([(k, i) for i, k in enumerate(self.controllers)])
+        self.prop_index=dict([(k, j) for j, k in enumerate(self.props)])
+        self.slots=numpy.memmap(self.filename, dtype=SLOT_DTYPE, mode='r+',
+                                offset=int(header['slots_offset']),
+                                shape=(len(self.controllers), len(self.props)))
+        self.seq=self.slots['seq']
+        self.raw=self.slots['raw']
+        self.time=self.slots['time']
+        self.value=self.slots['value']
+
+    def _create(self, controllers, props):
+        """ Create the table file with empty slots """
+        directory = json.dumps({'controllers': list(controllers), 'props': list(props)})
+        slots_offset = HEADER_DTYPE.itemsize + len(directory)
+        slots_offset += -slots_offset % SLOT_ALIGN
+        header = numpy.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['slots_offset'] = slots_offset
+        header['num_ctlrs'] = len(controllers)
+        header['num_props'] = len(props)
+        header['directory_size'] = len(directory)
+        tmpname = self.filename + '.tmp'
+        fid = open(tmpname, 'wb')
+        try:
+            fid.write(header.tostring())
+            fid.write(directory)
+            fid.truncate(slots_offset + len(controllers)*len(props)*SLOT_DTYPE.itemsize)
+        finally:
+            fid.close()
+        os.rename(tmpname, self.filename)
+
+    def write(self, ctlr, prop, t, raw, value):
+        """
+        Write a sample to the slot of the given controller and
+        property. There must be only one writer per slot.
+        """
+        i = self.ctlr_index[ctlr]
+        j = self.prop_index[prop]
+        seq = int(self.seq[i,j])
+        self.seq[i,j] = (seq + 1) & 0xffffffff
+        self.raw[i,j] = raw
+        self.time[i,j] = t
+        self.value[i,j] = value
+        self.seq[i,j] = (seq + 2) & 0xffffffff
+
+    def get_raw(self, ctlr, prop):
+        """
+        Return (timestamp, raw integer value) of the latest sample of a
+        property of a controller, or None if it has not been sampled.
+        """
+        i = self.ctlr_index[ctlr]
+        j = self.prop_index[prop]
+        for attempt in range(MAX_READ_ATTEMPT):
+            seq = self.seq[i,j]
+            if seq & 1:
+                continue
+            raw = int(self.raw[i,j])
+            t = float(self.time[i,j])
+            if self.seq[i,j] == seq:
+                if seq == 0:
+                    return None
+                return t, raw
+        raise IOError, 'unable to read slot %s %s'%(ctlr, prop)
+
+    def get(self, ctlr, prop):
+        """
+        Return (timestamp, value) of the latest sample of a property of
+        a controller, or None if it has not been sampled. The value is
+        decoded as by the corresponding TC3625 get method.
+        """
+        sample = self.get_raw(ctlr, prop)
+        if sample == None:
+            return None
+        t, raw = sample
+        return t, METHOD_DICT[prop]['get'].decode(raw)
+
+    def column(self, prop):
+        """
+        Dictionary of the latest (timestamp, value) of a property for
+        every controller which has been sampled.
+        """
+        values = {}
+        for ctlr in self.controllers:
+            sample = self.get(ctlr, prop)
+            if sample != None:
+                values[ctlr] = sample
+        return values
+
+    def snapshot(self):
+        """
+        Consistent copy of the slots array, retrying slots which were
+        being written.
+        """
+        for attempt in range(MAX_READ_ATTEMPT):
+            seq = numpy.array(self.seq)
+            slots = numpy.array(self.slots)
+            if not (seq & 1).any() and (seq == self.seq).all():
+                return slots
+        raise IOError, 'unable to read a consistent snapshot'
+
+    def close(self):
+        """ Unmap the table """
+        self.slots = self.seq = self.raw = self.time = self.value = None
+
+    def unlink(self):
+        """ Remove the table file, mapped tables stay valid """
+        try:
+            os.unlink(self.filename)
+        except OSError:
+            pass
+
+
+class TC3625_ShardedFleet:
+
+    """
+    Fleet of TC3625 controllers polled by worker processes which publish
+    the latest values to a TC3625_SharedTable.
+    """
+
+    def __init__(self,
+                 controllers,
+                 shards=None,
+                 scan_list=DFLT_SCAN_LIST,
+                 name=None,
+                 **kwargs):
+        """
+        controllers is a list of ports or (port, address) tuples, or a
+        dictionary of controller names and ports or (port, address)
+        tuples, as for TC3625Fleet. In the table the controllers are
+        named by their dictionary key, their port, or 'port:address'.
+        shards is the number of worker processes, by default the
+        number of CPUs. Other keyword arguments are passed to the
+        TC3625Fleet of each worker.
+        """
+        if isinstance(controllers, dict):
+            items = controllers.items()
+        else:
+            items = [(ctlr_name(spec), spec) for spec in controllers]
+        self.specs={}
+        for key, spec in items:
+            if isinstance(spec, basestring):
+                spec = (spec, DFLT_ADDRESS)
+            self.specs[key] = tuple(spec)
+        for prop in scan_list:
+            if not prop in METHOD_DICT or not 'get' in METHOD_DICT[prop]:
+                raise ValueError, 'unknown or ungettable property %s'%(prop,)
+        if shards == None:
+            shards = multiprocessing.cpu_count()
+        self.scan_list=dict(scan_list)
+        self.kwargs=kwargs
+        if name == None:
+            name = 'tc3625_%d'%(os.getpid(),)
+        self.name=name
+        self.shards=self._shard(shards)
+        self.table=None
+        self.workers=[]
+        self.stop_event=None
+
+    def _shard(self, num):
+        """
+        Split the controllers into num shards, keeping the controllers
+        of a port together.
+        """
+        ports = {}
+        for key, (port, address) in sorted(self.specs.items()):
+            ports.setdefault(port, []).append(key)
+        shards = [{} for i in range(min(num, len(ports)))]
+        for n, port in enumerate(sorted(ports)):
+            for key in ports[port]:
+                shards[n % len(shards)][key] = self.specs[key]
+        return shards
+
+    def start(self):
+        """ Create the shared table and start the worker processes """
+        if self.workers:
+            return
+        self.table = TC3625_SharedTable(self.name, sorted(self.specs), sorted(self.scan_list))
+        self.stop_event = multiprocessing.Event()
+        for specs in self.shards:
+            worker = multiprocessing.Process(
+                target=_shard_main,
+                args=(self.name, specs, self.scan_list, self.kwargs, self.stop_event),
+                )
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout=10.0):
+        """ Stop the workers and remove the shared table file """
+        if not self.workers:
+            return
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        self.table.unlink()
+
+    def is_alive(self):
+        """ List of the worker process states """
+        return [worker.is_alive() for worker in self.workers]
+
+    def get(self, ctlr, prop):
+        """ Latest (timestamp, value), see TC3625_SharedTable.get """
+        return self.table.get(ctlr, prop)
+
+    def column(self, prop):
+        """ Latest values of prop, see TC3625_SharedTable.column """
+        return self.table.column(prop)
+
+
+def _shard_main(name, specs, scan_list, kwargs, stop_event):
+    """ Worker process - poll a shard of controllers into the table """
+    table = TC3625_SharedTable(name)
+    fleet = TC3625Fleet(specs, **kwargs)
+    polling = set()
+    try:
+        while True:
+            for key in set(fleet.ctlrs) - polling:
+                fleet.ctlrs[key].start_polling(scan_list, [_publisher(table, key)])
+                polling.add(key)
+            stop_event.wait(REOPEN_INTERVAL)
+            if stop_event.is_set():
+                break
+            # Retry the controllers which failed to open
+            if fleet.open_errors:
+                fleet.open()
+    finally:
+        fleet.close()
+        table.close()
+
+def _publisher(table, key):
+    """ Poller listener writing the samples of a controller to table """
+    def listener(prop, t, raw, value):
+        if not isinstance(value, (int, long, float)) or isinstance(value, bool):
+            value = numpy.nan
+        table.write(key, prop, t, raw, value)
+    return listener
+
+def table_filename(name):
+    """ Path of the file of the shared table with the given name """
+    return os.path.join(SHM_DIR, name + '.tc3625')
+
+def ctlr_name(spec):
+    """ Table name of a controller given as port or (port, address) """
+    if isinstance(spec, basestring):
+        return spec
+    port, address = spec
+    return '%s:%s'%(port, address)
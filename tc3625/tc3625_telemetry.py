@@ -0,0 +1,180 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Fixed capacity telemetry ring buffer backed by a NumPy
+structured array.
+
+Each record holds a timestamp and the raw integer values of input1,
+input2, power output, output current counts and alarm status. The
+storage is preallocated at twice the capacity and every record is
+written to two slots, i and i + capacity, so the most recent N records
+are always contiguous. Readers therefore get read-only views of the
+buffer without copying, even across the wrap around point.
+
+Conversion to temperatures, percent power and amps is done on whole
+columns with the same int2dec, int2perc and cnt2amp functions used by
+TC3625.
+
+The buffer can be fed by a TC3625_Poller. A record is appended each
+time the trigger property (input1 by default) is sampled, using the
+latest raw values of the other properties.
+
+Requires numpy.
+
+Classes:
+  TC3625_RingBuffer
+
+Usage:
+
+  ring = TC3625_RingBuffer(capacity=100000)
+  poller = ctlr.start_polling()
+  ring.attach(poller)
+
+  data = ring.latest(600)        # read-only view, no copy
+  temp = ring.convert(data)['input1']
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import threading
+import numpy
+from tc3625 import int2dec, int2perc, cnt2amp
+
+DFLT_CAPACITY=100000
+
+# Record layout - column name and the poller property it comes from
+RECORD_DTYPE=numpy.dtype([
+    ('time', numpy.float64),
+    ('input1', numpy.int32),
+    ('input2', numpy.int32),
+    ('power_output', numpy.int32),
+    ('output_current_counts', numpy.int32),
+    ('alarm_status', numpy.int32),
+    ])
+COLUMN_PROPS=[
+    ('input1', 'input1'),
+    ('input2', 'input2'),
+    ('power_output', 'power output'),
+    ('output_current_counts', 'output current'),
+    ('alarm_status', 'alarm status'),
+    ]
+
+# Conversion of columns to engineering units
+COLUMN_CONVERT={
+    'input1': int2dec,
+    'input2': int2dec,
+    'power_output': int2perc,
+    'output_current_counts': cnt2amp,
+    }
+
+
+class TC3625_RingBuffer:
+
+    """
+    Fixed capacity, preallocated ring buffer of raw telemetry records.
+    """
+
+    def __init__(self, capacity=DFLT_CAPACITY, trigger='input1'):
+        if capacity <= 0:
+            raise ValueError, 'capacity must be positive'
+        self.capacity=capacity
+        self.trigger=trigger
+        self.data=numpy.zeros(2*capacity, dtype=RECORD_DTYPE)
+        self.count=0
+        self.lock=threading.Lock()
+        self.current=dict([(col, 0) for col, prop in COLUMN_PROPS])
+        self.prop_column=dict([(prop, col) for col, prop in COLUMN_PROPS])
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, t, input1=0, input2=0, power_output=0,
+               output_current_counts=0, alarm_status=0):
+        """ Append a record """
+        i = self.count % self.capacity
+        rec = (t, input1, input2, power_output, output_current_counts, alarm_status)
+        self.lock.acquire()
+        try:
+            self.data[i] = rec
+            self.data[i + self.capacity] = rec
+            self.count += 1
+        finally:
+            self.lock.release()
+
+    def latest(self, n=None):
+        """
+        Return a read-only view of the most recent n records (all
+        records if n is None), oldest first. The view is not copied, so
+        it will be overwritten once capacity more records have been
+        appended - copy it to keep it longer.
+        """
+        self.lock.acquire()
+        try:
+            size = min(self.count, self.capacity)
+            if n == None or n > size:
+                n = size
+            end = self.count % self.capacity
+            if self.count >= self.capacity:
+                end += self.capacity
+            view = self.data[end - n:end]
+        finally:
+            self.lock.release()
+        view.flags.writeable = False
+        return view
+
+    def convert(self, records):
+        """
+        Convert the columns of the given records to engineering units.
+        Returns a dictionary of arrays - time in seconds, input1 and
+        input2 in working units, power output in percent and output
+        current in Amps. Alarm status is returned as the raw bit mask.
+        """
+        values = {'time': records['time'], 'alarm_status': records['alarm_status']}
+        for col, func in COLUMN_CONVERT.items():
+            values[col] = func(records[col])
+        return values
+
+    def attach(self, poller):
+        """ Append records from the samples of a TC3625_Poller """
+        poller.add_listener(self.on_sample)
+
+    def detach(self, poller):
+        """ Stop appending records from a TC3625_Poller """
+        poller.remove_listener(self.on_sample)
+
+    def on_sample(self, prop, t, raw, value):
+        """
+        Poller listener - update the latest raw value of the property
+        and append a record when the trigger property is sampled.
+        """
+        try:
+            self.current[self.prop_column[prop]] = raw
+        except KeyError:
+            return
+        if prop == self.trigger:
+            self.append(t, **self.current)
@@ -0,0 +1,217 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Tracing hooks around the frames and the high level calls of
+TC3625.
+
+A hook is registered with TC3625.add_hook (or TC3625_Serial.add_hook
+for the frames only). Its methods are called, with the monotonic time
+t in seconds (see tc3625_capture.monotonic), at these points:
+
+  on_call(name, t)                       entry of a get_*/set_* call
+  on_return(name, t, error)              exit of the call
+  on_transmit(cmd, frame, t)             before a frame is sent
+  on_first_byte(cmd, data, t)            first byte of the response
+  on_response(cmd, response, t, error)   complete response, or failure
+
+name is the method name (e.g. get_input1), cmd the serial command
+string, frame the raw command frame, response the raw bytes received
+and error the exception raised or None. The hooks are called from the
+thread making the call, so they must be thread safe if the controller
+is used from several threads, and quick.
+
+TC3625_ChromeTrace writes the events to a file in the Chrome trace
+event format, which can be opened with chrome://tracing or Perfetto.
+The calls are shown on the track of the thread that made them, and
+each transaction on the 'serial line' track, split into the wait for
+the first byte and the reception of the response. So the occupancy of
+the line, the retries within a call and the gaps between calls can be
+seen. Use one trace per serial line.
+
+Classes:
+  TC3625_TraceHook
+  TC3625_ChromeTrace
+
+Usage:
+
+  trace = TC3625_ChromeTrace('trace.json')
+  ctlr = TC3625(port='/dev/ttyUSB0')
+  ctlr.add_hook(trace)
+  for i in range(100):
+      ctlr.get_input1()
+  ctlr.remove_hook(trace)
+  trace.close()
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import os
+import json
+import thread
+import threading
+from tc3625_clock import monotonic
+
+# Chrome trace thread id of the serial line track
+LINE_TID=0
+
+
+class TC3625_TraceHook:
+
+    """
+    Base class of tracing hooks - all events are ignored. Subclasses
+    override the events they are interested in.
+    """
+
+    def on_call(self, name, t):
+        pass
+
+    def on_return(self, name, t, error):
+        pass
+
+    def on_transmit(self, cmd, frame, t):
+        pass
+
+    def on_first_byte(self, cmd, data, t):
+        pass
+
+    def on_response(self, cmd, response, t, error):
+        pass
+
+
+class TC3625_ChromeTrace(TC3625_TraceHook):
+
+    """
+    Tracing hook writing the events to a Chrome trace event (JSON)
+    file. The file is written as the events arrive and is complete
+    when the trace is closed. A trace which has not been closed can
+    still be loaded by chrome://tracing.
+    """
+
+    def __init__(self, filename, process_name='tc3625'):
+        self.filename=filename
+        self.pid=os.getpid()
+        self.lock=threading.Lock()
+        self.t_start=monotonic()
+        self.threads=set()
+        self.frames={}
+        self.fid=open(filename, 'w')
+        self.fid.write('[')
+        self.separator='\n'
+        self._write({'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                     'args': {'name': process_name}})
+        self._write({'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                     'tid': LINE_TID, 'args': {'name': 'serial line'}})
+
+    def close(self):
+        """ Finish and close the trace file """
+        self.lock.acquire()
+        try:
+            if self.fid == None:
+                return
+            self.fid.write('\n]\n')
+            self.fid.close()
+            self.fid = None
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        """ Flush the events written so far to the file """
+        self.lock.acquire()
+        try:
+            if self.fid != None:
+                self.fid.flush()
+        finally:
+            self.lock.release()
+
+    def on_call(self, name, t):
+        self._event({'name': name, 'cat': 'call', 'ph': 'B',
+                     'ts': self._ts(t), 'tid': self._tid()})
+
+    def on_return(self, name, t, error):
+        event = {'name': name, 'cat': 'call', 'ph': 'E',
+                 'ts': self._ts(t), 'tid': self._tid()}
+        if error != None:
+            event['args'] = {'error': '%s: %s'%(error.__class__.__name__, error)}
+        self._event(event)
+
+    def on_transmit(self, cmd, frame, t):
+        self.frames[thread.get_ident()] = [cmd, frame, t, None]
+
+    def on_first_byte(self, cmd, data, t):
+        try:
+            self.frames[thread.get_ident()][3] = t
+        except KeyError:
+            pass
+
+    def on_response(self, cmd, response, t, error):
+        try:
+            cmd, frame, t_tx, t_first = self.frames.pop(thread.get_ident())
+        except KeyError:
+            return
+        args = {'frame': str(frame).decode('latin-1'), 'response': response.decode('latin-1')}
+        if error != None:
+            args['error'] = '%s: %s'%(error.__class__.__name__, error)
+        self._event({'name': str(cmd), 'cat': 'frame', 'ph': 'X', 'tid': LINE_TID,
+                     'ts': self._ts(t_tx), 'dur': self._dur(t_tx, t), 'args': args})
+        if t_first == None:
+            self._event({'name': 'wait', 'cat': 'frame', 'ph': 'X', 'tid': LINE_TID,
+                         'ts': self._ts(t_tx), 'dur': self._dur(t_tx, t)})
+        else:
+            self._event({'name': 'wait', 'cat': 'frame', 'ph': 'X', 'tid': LINE_TID,
+                         'ts': self._ts(t_tx), 'dur': self._dur(t_tx, t_first)})
+            self._event({'name': 'receive', 'cat': 'frame', 'ph': 'X', 'tid': LINE_TID,
+                         'ts': self._ts(t_first), 'dur': self._dur(t_first, t)})
+
+    def _ts(self, t):
+        """ Trace timestamp in microseconds """
+        return round((t - self.t_start)*1.0e6, 1)
+
+    def _dur(self, t0, t1):
+        return round((t1 - t0)*1.0e6, 1)
+
+    def _tid(self):
+        """ Trace thread id of the calling thread, named on first use """
+        tid = thread.get_ident()
+        if not tid in self.threads:
+            self.threads.add(tid)
+            self._event({'name': 'thread_name', 'ph': 'M', 'tid': tid,
+                         'args': {'name': threading.currentThread().getName()}})
+        return tid
+
+    def _event(self, event):
+        event['pid'] = self.pid
+        self.lock.acquire()
+        try:
+            if self.fid != None:
+                self._write(event)
+        finally:
+            self.lock.release()
+
+    def _write(self, event):
+        self.fid.write(self.separator + json.dumps(event, separators=(',',':')))
+        self.separator = ',\n'
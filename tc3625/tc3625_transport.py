@@ -0,0 +1,399 @@
+"""
+-----------------------------------------------------------------------
+tc3625
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+Released under the LGPL Licence, Version 3
+
+This file is part of tc3625.
+
+tc3625 is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+tc3625 is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with tc3625.  If not, see
+<http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------------------
+
+Purpose: Transports for the TC-36-25 serial protocol, selected by URL.
+
+A transport is a serial port like object - it has write, read(size),
+flush, flushInput, inWaiting, close and isOpen methods and a timeout
+attribute, in the style of pyserial. TC3625_Serial opens the transport
+given by its port and does the framing, checksums and timing for all
+of them in the same way.
+
+URLs:
+
+  /dev/ttyUSB0, COM3                  local serial port
+  serial:///dev/ttyUSB0               local serial port
+  tcp://host:port                     raw TCP socket, e.g. a terminal server
+  usb://A6008isP                      USB serial adapter with this serial number
+  pty://                              emulated controller on a new pty
+  loop://                             emulated controller in memory
+  replay:///path/session.cap          replay of a capture file
+
+Other schemes known to pyserial (e.g. rfc2217://, socket://) are
+opened with serial.serial_for_url.
+
+Options are given as a query string. pty:// and loop:// take the
+TC3625_Emulator options devices (comma separated addresses),
+error_rate, response_delay and seed. loop:// also takes realtime=0 to
+answer without the emulated wire delay. replay:// takes speed (a
+number, or max for maximum speed).
+
+A usb:// URL names a USB serial adapter by its serial number (as
+listed by python -m serial.tools.list_ports -v) rather than by its
+device name, which may change when the adapter is re-enumerated. The
+device is looked up every time the URL is opened.
+
+link_lost tells whether an error raised by a transport means that the
+port itself has gone away, so that it must be reopened.
+
+Classes:
+  TC3625_TCPTransport
+  TC3625_LoopTransport
+  TC3625_PtyTransport
+
+Functions:
+  open_transport
+  find_usb_port
+  link_lost
+
+Usage:
+
+  ctlr = TC3625(port='tcp://10.0.0.7:4001')
+  ctlr = TC3625(port='loop://?devices=01,02&error_rate=0.05', address='02')
+  ctlr = TC3625(port='replay:///tmp/session.cap?speed=max')
+
+Author: Will Dickson
+----------------------------------------------------------------------------
+"""
+import math
+import time
+import errno
+import select
+import socket
+import urlparse
+import serial
+import serial.tools.list_ports
+from tc3625_capture import TC3625_Replay
+
+# Exceptions raised by a failed serial port
+try:
+    import termios
+    LINK_EXCEPTIONS=(EnvironmentError, termios.error)
+except ImportError:
+    LINK_EXCEPTIONS=(EnvironmentError,)
+
+# errno values of a port or connection which has gone away
+LINK_ERRNOS=set([
+    errno.EIO,
+    errno.ENXIO,
+    errno.ENODEV,
+    errno.ENOENT,
+    errno.EBADF,
+    errno.EPIPE,
+    errno.ECONNRESET,
+    errno.ECONNREFUSED,
+    ])
+
+# Emulator options allowed in pty:// and loop:// URLs and their types
+EMULATOR_OPTIONS={
+    'error_rate': float,
+    'response_delay': float,
+    'seed': int,
+    }
+
+
+def open_transport(url, timeout, baud_rate):
+    """
+    Open the transport given by url, see the module documentation, and
+    return it. Raises ValueError for a malformed or unknown url.
+    """
+    if not '://' in url:
+        return open_serial(url, timeout, baud_rate)
+    parts = urlparse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    options = dict(urlparse.parse_qsl(parts.query))
+    if scheme == 'serial':
+        return open_serial(parts.netloc + parts.path, timeout, baud_rate)
+    elif scheme == 'usb':
+        return open_serial(find_usb_port(parts.netloc + parts.path), timeout, baud_rate)
+    elif scheme == 'tcp':
+        if parts.hostname == None or parts.port == None:
+            raise ValueError, 'tcp url must be tcp://host:port'
+        return TC3625_TCPTransport(parts.hostname, parts.port, timeout)
+    elif scheme == 'pty':
+        return TC3625_PtyTransport(emulator_options(options, baud_rate), timeout)
+    elif scheme == 'loop':
+        realtime = options.pop('realtime', '1') != '0'
+        return TC3625_LoopTransport(emulator_options(options, baud_rate), timeout, realtime)
+    elif scheme == 'replay':
+        speed = options.get('speed', '1.0')
+        if speed == 'max':
+            speed = None
+        else:
+            speed = float(speed)
+        return TC3625_Replay(parts.netloc + parts.path, speed=speed, timeout=timeout)
+    return serial.serial_for_url(url, timeout=timeout, baudrate=baud_rate)
+
+def open_serial(port, timeout, baud_rate):
+    """ Open a local serial port """
+    return serial.Serial(
+        port,
+        timeout = timeout,
+        bytesize=serial.EIGHTBITS,
+        baudrate=baud_rate,
+        parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE,
+        xonxoff=0,
+        rtscts=0,
+        )
+
+def find_usb_port(serial_number):
+    """
+    Device name of the USB serial adapter with the given serial number.
+    Raises IOError (ENODEV) if it is not connected.
+    """
+    for port in serial.tools.list_ports.comports():
+        if port.serial_number == serial_number:
+            return port.device
+    raise IOError(errno.ENODEV, 'no USB serial port with serial number %s'%(serial_number,))
+
+def link_lost(err):
+    """
+    Returns True if err, raised by a transport, means that the port or
+    connection has gone away rather than that a response was lost.
+    """
+    if isinstance(err, serial.SerialTimeoutException):
+        return False
+    if isinstance(err, serial.SerialException):
+        return True
+    try:
+        return err.args[0] in LINK_ERRNOS
+    except IndexError:
+        return False
+
+def emulator_options(options, baud_rate):
+    """ TC3625_Emulator keyword arguments from url options """
+    kwargs = {'baud_rate': baud_rate}
+    for k, v in options.items():
+        if k == 'devices':
+            kwargs['devices'] = v.split(',')
+        elif k in EMULATOR_OPTIONS:
+            kwargs[k] = EMULATOR_OPTIONS[k](v)
+        else:
+            raise ValueError, 'unknown emulator option %s'%(k,)
+    return kwargs
+
+
+class TC3625_TCPTransport:
+
+    """
+    Raw TCP connection, e.g. to a serial port on a terminal server.
+    """
+
+    def __init__(self, host, port, timeout):
+        self.host=host
+        self.port=port
+        self.timeout=timeout
+        self.rx_buf=''
+        self.sock=socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setblocking(0)
+
+    def isOpen(self):
+        return self.sock != None
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        if self.sock != None:
+            self.sock.close()
+            self.sock = None
+
+    def write(self, data):
+        self.sock.setblocking(1)
+        try:
+            self.sock.sendall(data)
+        finally:
+            self.sock.setblocking(0)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self, size=1):
+        """
+        Read up to size bytes, waiting up to timeout for the first.
+        Returns '' on timeout.
+        """
+        if not self.rx_buf:
+            ready, _, _ = select.select([self.sock], [], [], self.timeout)
+            if not ready:
+                return ''
+            self._receive()
+        data, self.rx_buf = self.rx_buf[:size], self.rx_buf[size:]
+        return data
+
+    def inWaiting(self):
+        while select.select([self.sock], [], [], 0)[0]:
+            if not self._receive():
+                break
+        return len(self.rx_buf)
+
+    def flushInput(self):
+        self.inWaiting()
+        self.rx_buf = ''
+
+    def _receive(self):
+        """ Append the available data to rx_buf, returns its size """
+        try:
+            data = self.sock.recv(4096)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return 0
+            raise IOError(err.args[0], 'connection to %s:%d failed: %s'%(self.host, self.port, err))
+        if not data:
+            raise IOError(errno.ECONNRESET, 'connection to %s:%d closed'%(self.host, self.port))
+        self.rx_buf += data
+        return len(data)
+
+
+class TC3625_LoopTransport:
+
+    """
+    In memory connection to emulated controllers. The bytes of a reply
+    arrive one character time apart, as on the wire, the last one after
+    the emulated wire and response time, unless realtime is False.
+    """
+
+    def __init__(self, emulator_kwargs, timeout, realtime=True):
+        # Imported here as the emulator imports tc3625_serial
+        from tc3625_emulator import TC3625_Emulator
+        self.emulator=TC3625_Emulator(**emulator_kwargs)
+        self.timeout=timeout
+        self.realtime=realtime
+        if realtime:
+            self.char_time=self.emulator.wire_time(1)
+        else:
+            self.char_time=0.0
+        # (time the last byte arrives, bytes not read yet) of each reply
+        self.replies=[]
+        self.is_open=True
+
+    def isOpen(self):
+        return self.is_open
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        t_start = time.time()
+        for reply, delay in self.emulator.process(data):
+            if self.realtime:
+                t_start += delay
+            self.replies.append((t_start, reply))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self, size=1):
+        """
+        Read up to size bytes of the next reply, waiting up to timeout
+        for them to arrive. Returns the bytes arrived by the timeout,
+        '' if none.
+        """
+        if not self.replies:
+            if self.realtime and self.timeout != None:
+                time.sleep(self.timeout)
+            return ''
+        t_ready, reply = self.replies[0]
+        n = min(size, len(reply))
+        wait = t_ready - (len(reply) - n)*self.char_time - time.time()
+        if self.timeout != None and wait > self.timeout:
+            time.sleep(self.timeout)
+            n = min(n, self._arrived(t_ready, reply, time.time()))
+        elif wait > 0:
+            time.sleep(wait)
+        return self._consume(n)
+
+    def inWaiting(self):
+        now = time.time()
+        cnt = 0
+        for t_ready, reply in self.replies:
+            n = self._arrived(t_ready, reply, now)
+            cnt += n
+            if n < len(reply):
+                break
+        return cnt
+
+    def flushInput(self):
+        self._consume(self.inWaiting())
+
+    def _arrived(self, t_ready, reply, t):
+        """ Number of bytes of reply arrived by time t """
+        if t >= t_ready:
+            return len(reply)
+        if self.char_time <= 0:
+            return 0
+        return max(len(reply) - int(math.ceil((t_ready - t)/self.char_time)), 0)
+
+    def _consume(self, n):
+        """ Remove and return the next n bytes received """
+        data = []
+        while n > 0:
+            t_ready, reply = self.replies[0]
+            data.append(reply[:n])
+            if n >= len(reply):
+                del self.replies[0]
+            else:
+                self.replies[0] = (t_ready, reply[n:])
+            n -= len(reply)
+        return ''.join(data)
+
+
+class TC3625_PtyTransport:
+
+    """
+    Serial connection to emulated controllers served on a new pseudo-
+    terminal. The emulator is stopped when the transport is closed.
+    """
+
+    def __init__(self, emulator_kwargs, timeout):
+        from tc3625_emulator import TC3625_Emulator
+        self.emulator=TC3625_Emulator(**emulator_kwargs)
+        self.port=self.emulator.start()
+        try:
+            self.serial=open_serial(self.port, timeout, self.emulator.baud_rate)
+        except:
+            self.emulator.stop()
+            raise
+
+    def close(self):
+        if self.serial.isOpen():
+            self.serial.close()
+            self.emulator.stop()
+
+    def __getattr__(self, name):
+        return getattr(self.serial, name)
+
+    def __setattr__(self, name, value):
+        if name == 'timeout':
+            self.serial.timeout = value
+        else:
+            self.__dict__[name] = value
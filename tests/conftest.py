@@ -0,0 +1,45 @@
+"""
+Shared fixtures of the tc3625 tests. The tests run against the in
+memory emulator (loop:// transport) so no hardware is needed.
+
+Run with python -m pytest from the top directory of the package.
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tc3625 import TC3625, TC3625_RetryPolicy
+from tc3625.tc3625_codec import STX, ACK, HEX_BYTE
+
+# Emulated controller answering without the wire delay
+LOOP_PORT='loop://?realtime=0'
+
+
+def response(val_str):
+    """ Controller response frame for an 8 character value string """
+    return STX + val_str + HEX_BYTE[sum(bytearray(val_str)) & 0xff] + ACK
+
+
+def value_response(val):
+    """ Controller response frame for an integer value """
+    return response('%08x'%(val & 0xffffffff,))
+
+
+def transactions(ctlr, cmd):
+    """ Number of successful transactions of cmd recorded in metrics """
+    return ctlr.stats()['counters']['transactions'].get(cmd, 0)
+
+
+@pytest.fixture
+def ctlr():
+    """ Controller on an emulated line, with metrics and no backoff """
+    ctlr = TC3625(
+        port=LOOP_PORT,
+        timeout=0.05,
+        metrics=True,
+        retry_policy=TC3625_RetryPolicy(backoff=0.0),
+        )
+    yield ctlr
+    ctlr.close()
@@ -0,0 +1,104 @@
+"""
+asyncio interface - TC3625_AsyncSerial and AsyncTC3625 on transport
+URLs and the failure of the port.
+"""
+import time
+import pytest
+
+asyncio = pytest.importorskip('tc3625.tc3625_async').asyncio
+from tc3625.tc3625_async import AsyncTC3625
+from tc3625 import TC3625_LinkError
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def run(loop, future):
+    return loop.run_until_complete(asyncio.wait_for(future, 5.0, loop=loop))
+
+
+def idle(loop, t):
+    """ Run the event loop for t seconds, returns the number of iterations """
+    cnt = [0]
+    t_end = time.time() + t
+    def tick():
+        cnt[0] += 1
+        if time.time() < t_end:
+            loop.call_soon(tick)
+        else:
+            loop.stop()
+    loop.call_soon(tick)
+    loop.run_forever()
+    return cnt[0]
+
+
+@pytest.mark.parametrize('port', ['loop://', 'loop://?realtime=0', 'pty://'])
+def test_read_write(loop, port):
+    ctlr = AsyncTC3625(port=port, loop=loop)
+    try:
+        run(loop, ctlr.ready)
+        assert run(loop, ctlr.get_proportional_bandwidth()) == 5.0
+        run(loop, ctlr.set_proportional_bandwidth(7.5))
+        assert run(loop, ctlr.get_proportional_bandwidth()) == 7.5
+        assert run(loop, ctlr.get_eeprom_write()) == 'off'
+    finally:
+        ctlr.close()
+
+
+def test_hangup_while_idle(loop):
+    ctlr = AsyncTC3625(port='pty://', loop=loop)
+    run(loop, ctlr.ready)
+    dev = ctlr.dev
+    # The other end goes away with no command in flight
+    dev.serial.emulator.stop()
+    idle(loop, 0.1)
+    assert dev.serial == None
+    assert dev.fd == None
+    with pytest.raises(IOError):
+        run(loop, ctlr.get_input1())
+
+
+def test_hangup_fails_pending(loop):
+    ctlr = AsyncTC3625(port='pty://', loop=loop)
+    run(loop, ctlr.ready)
+    dev = ctlr.dev
+    futures = [dev.read('input1') for i in range(3)]
+    dev.serial.emulator.stop()
+    for future in futures:
+        with pytest.raises(TC3625_LinkError):
+            run(loop, future)
+    assert dev.serial == None
+
+
+def test_cancelled_request(loop):
+    ctlr = AsyncTC3625(port='loop://?realtime=0', loop=loop)
+    try:
+        run(loop, ctlr.ready)
+        # Cancel the request on the line, the get and get_all are
+        # cancelled with it
+        requests = []
+        read = ctlr.dev.read
+        def cancelled_read(cmd, address=None):
+            future = read(cmd, address)
+            future.cancel()
+            requests.append(future)
+            return future
+        ctlr.dev.read = cancelled_read
+        future = ctlr.get_input1()
+        with pytest.raises(asyncio.CancelledError):
+            run(loop, future)
+        with pytest.raises(asyncio.CancelledError):
+            run(loop, ctlr.get_all())
+        assert len(requests) > 1
+        # Cancelling the caller's future does not break the callbacks
+        ctlr.dev.read = read
+        future = ctlr.get_proportional_bandwidth()
+        future.cancel()
+        idle(loop, 0.05)
+        assert run(loop, ctlr.get_proportional_bandwidth()) == 5.0
+    finally:
+        ctlr.close()
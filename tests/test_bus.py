@@ -0,0 +1,68 @@
+"""
+Multi-drop bus - addressed controllers and round-robin sharing of the
+line.
+"""
+import time
+import threading
+import pytest
+
+from tc3625 import TC3625, TC3625_Bus, TC3625_TraceHook
+
+BUS_PORT='loop://?devices=01,02&realtime=0'
+
+
+class Addresses(TC3625_TraceHook):
+
+    def __init__(self):
+        self.addresses=[]
+
+    def on_transmit(self, cmd, frame, t):
+        self.addresses.append(frame[1:3])
+
+
+@pytest.fixture
+def bus():
+    bus = TC3625_Bus(port=BUS_PORT)
+    bus.open()
+    yield bus
+    bus.close()
+
+
+def waiting(bus):
+    bus.cond.acquire()
+    try:
+        return sum([len(queue) for queue in bus.pending.values()])
+    finally:
+        bus.cond.release()
+
+
+def test_addressed_controllers(bus):
+    ctlr1 = TC3625(address='01', bus=bus)
+    ctlr2 = TC3625(address='02', bus=bus)
+    ctlr1.set_proportional_bandwidth(7.5)
+    assert ctlr1.get_proportional_bandwidth() == 7.5
+    assert ctlr2.get_proportional_bandwidth() == 5.0
+    assert bus.isOpen()
+    # Closing a controller leaves the bus open
+    ctlr1.close()
+    assert ctlr2.get_proportional_bandwidth() == 5.0
+
+
+def test_round_robin(bus):
+    hook = Addresses()
+    bus.serial.hooks = [hook]
+    # Hold the line while the requests queue up, three for the first
+    # controller and then two for the second
+    bus._acquire('00')
+    threads = []
+    for address in ('01', '01', '01', '02', '02'):
+        thread = threading.Thread(target=bus.read, args=('input1', address))
+        thread.start()
+        threads.append(thread)
+        t_end = time.time() + 2.0
+        while waiting(bus) < len(threads) and time.time() < t_end:
+            time.sleep(0.01)
+    bus._release()
+    for thread in threads:
+        thread.join()
+    assert hook.addresses == ['01', '02', '01', '02', '01']
@@ -0,0 +1,88 @@
+"""
+Register cache of TC3625 - time to live, invalidation and writes.
+"""
+import time
+import pytest
+
+from tc3625 import TC3625
+from conftest import LOOP_PORT, transactions
+
+CMD='proportional bandwidth'
+
+
+@pytest.fixture
+def cached():
+    ctlr = TC3625(port=LOOP_PORT, metrics=True, cache=True)
+    yield ctlr
+    ctlr.close()
+
+
+def test_cache_hit(cached):
+    assert cached.get_proportional_bandwidth() == 5.0
+    assert cached.get_proportional_bandwidth() == 5.0
+    assert transactions(cached, CMD) == 1
+
+
+def test_cache_disabled(ctlr):
+    ctlr.get_proportional_bandwidth()
+    ctlr.get_proportional_bandwidth()
+    assert transactions(ctlr, CMD) == 2
+
+
+def test_volatile_not_cached(cached):
+    cached.get_input1()
+    cached.get_input1()
+    assert transactions(cached, 'input1') == 2
+
+
+def test_cache_ttl(cached):
+    cached.set_cache_ttl('proportional bandwidth', 0.05)
+    cached.get_proportional_bandwidth()
+    cached.get_proportional_bandwidth()
+    assert transactions(cached, CMD) == 1
+    time.sleep(0.06)
+    cached.get_proportional_bandwidth()
+    assert transactions(cached, CMD) == 2
+
+
+def test_default_ttl():
+    ctlr = TC3625(port=LOOP_PORT, metrics=True, cache=True, cache_ttl=0.05)
+    try:
+        ctlr.get_integral_gain()
+        ctlr.get_integral_gain()
+        assert transactions(ctlr, 'integral gain') == 1
+        time.sleep(0.06)
+        ctlr.get_integral_gain()
+        assert transactions(ctlr, 'integral gain') == 2
+    finally:
+        ctlr.close()
+
+
+def test_invalidate(cached):
+    cached.get_proportional_bandwidth()
+    cached.get_integral_gain()
+    cached.invalidate('proportional bandwidth')
+    cached.get_proportional_bandwidth()
+    cached.get_integral_gain()
+    assert transactions(cached, CMD) == 2
+    assert transactions(cached, 'integral gain') == 1
+    cached.invalidate()
+    cached.get_integral_gain()
+    assert transactions(cached, 'integral gain') == 2
+    with pytest.raises(ValueError):
+        cached.invalidate('no such property')
+
+
+def test_write_updates_cache(cached):
+    cached.get_proportional_bandwidth()
+    cached.set_proportional_bandwidth(7.5)
+    assert cached.get_proportional_bandwidth() == 7.5
+    # One read, one write and no second read
+    assert transactions(cached, CMD) == 2
+
+
+def test_units_clear_cache(cached):
+    cached.get_proportional_bandwidth()
+    cached.set_working_units('C')
+    cached.get_proportional_bandwidth()
+    assert transactions(cached, CMD) == 2
@@ -0,0 +1,62 @@
+"""
+Capture of the serial traffic and replay of the captured session.
+"""
+import pytest
+
+from tc3625 import TC3625, TC3625_Replay
+from tc3625.tc3625_serial import TC3625_Serial
+from tc3625.tc3625_capture import read_capture, SENT, RECEIVED
+from conftest import LOOP_PORT
+
+
+def session(ctlr):
+    values = [ctlr.get_input1(), ctlr.get_proportional_bandwidth()]
+    ctlr.set_proportional_bandwidth(6.5)
+    values.append(ctlr.get_proportional_bandwidth())
+    return values
+
+
+@pytest.fixture
+def capture(tmpdir):
+    filename = str(tmpdir.join('session.cap'))
+    ctlr = TC3625(port=LOOP_PORT, capture=filename)
+    values = session(ctlr)
+    ctlr.close()
+    return filename, values
+
+
+def test_capture_records(capture):
+    filename, values = capture
+    records = list(read_capture(filename))
+    directions = [direction for t, direction, data in records]
+    # eeprom write off, the three reads and the write
+    assert directions.count(SENT) == 5
+    assert ''.join([data for t, direction, data in records if direction == RECEIVED])
+    times = [t for t, direction, data in records]
+    assert times == sorted(times)
+
+
+def test_replay(capture):
+    filename, values = capture
+    ctlr = TC3625(port='replay://%s?speed=max'%(filename,))
+    assert session(ctlr) == values
+    assert values[-1] == 6.5
+    ctlr.close()
+
+
+def test_replay_diverged(capture):
+    filename, values = capture
+    ctlr = TC3625(port='replay://%s?speed=max'%(filename,), max_attempt=1)
+    with pytest.raises(IOError):
+        ctlr.get_input2()
+    ctlr.close()
+
+
+def test_replay_timeout_fixed(capture):
+    filename, values = capture
+    dev = TC3625_Serial(port=TC3625_Replay(filename, speed=None), timeout=0.5)
+    dev.open()
+    for i in range(20):
+        dev._update_link(8, 0.001)
+    assert dev.get_timeout(8) == 0.5
+    dev.close()
@@ -0,0 +1,73 @@
+"""
+Frame encoding and response decoding of tc3625_codec.
+"""
+import pytest
+
+from tc3625.tc3625_codec import TC3625_Codec, NAK_VALUE, HEX_BYTE, ACK
+from tc3625.tc3625_codec import TC3625_ChecksumError, TC3625_NakError, TC3625_FrameError
+from tc3625.tc3625_serial import SERIAL_CMDS
+from tc3625.tc3625_emulator import TC3625_Emulator
+from conftest import response, value_response
+
+
+@pytest.fixture
+def codec():
+    return TC3625_Codec('00', SERIAL_CMDS)
+
+
+@pytest.mark.parametrize('val', [0, 1, 2500, -1, -2500, 0x7fffffff, -0x80000000])
+def test_write_round_trip(codec, val):
+    # The emulator decodes the frame independently and echoes the value
+    emu = TC3625_Emulator()
+    replies = emu.process(codec.write_frame('fixed desired control setting', val))
+    assert len(replies) == 1
+    assert emu.checksum_errors == 0
+    assert codec.decode(replies[0][0]) == val
+
+
+def test_read_frames(codec):
+    emu = TC3625_Emulator()
+    for cmd in ('input1', 'proportional bandwidth', 'alarm status'):
+        replies = emu.process(codec.read_frame(cmd))
+        assert len(replies) == 1
+        assert codec.decode(replies[0][0]) == emu.device().read(cmd)
+    assert emu.checksum_errors == 0
+
+
+def test_unsupported_commands(codec):
+    with pytest.raises(ValueError):
+        codec.read_frame('alarm latch request')
+    with pytest.raises(ValueError):
+        codec.write_frame('input1', 0)
+
+
+@pytest.mark.parametrize('val', [0x100000000, -0x80000001, 2**40])
+def test_write_out_of_range(codec, val):
+    with pytest.raises(ValueError):
+        codec.write_frame('proportional bandwidth', val)
+
+
+@pytest.mark.parametrize('val', [0, 1234, -1234])
+def test_decode(codec, val):
+    assert codec.decode(value_response(val)) == val
+    assert codec.decode(bytearray(value_response(val))) == val
+    assert codec.decode('garbage' + value_response(val), 7) == val
+
+
+def test_decode_errors(codec):
+    with pytest.raises(TC3625_NakError):
+        codec.decode(response(NAK_VALUE))
+    bad = value_response(1234)
+    bad = bad[:-3] + HEX_BYTE[(int(bad[-3:-1], 16) + 1) & 0xff] + ACK
+    with pytest.raises(TC3625_ChecksumError):
+        codec.decode(bad)
+    with pytest.raises(TC3625_FrameError):
+        codec.decode(value_response(1234)[:-1])
+    with pytest.raises(TC3625_FrameError):
+        codec.decode(response('0000zz00'))
+
+
+def test_errors_are_ioerrors():
+    for cls in (TC3625_ChecksumError, TC3625_NakError, TC3625_FrameError):
+        assert issubclass(cls, IOError)
+
@@ -0,0 +1,99 @@
+"""
+Emulated controller - register map, EEPROM, thermal plant, alarms and
+the framing of the replies.
+"""
+import pytest
+
+from tc3625 import TC3625
+from tc3625.tc3625_codec import TC3625_Codec, NAK_VALUE, HEX_BYTE, ETX
+from tc3625.tc3625_serial import SERIAL_CMDS
+from tc3625.tc3625_emulator import TC3625_Emulator, TC3625_EmulatedDevice
+from tc3625.tc3625_emulator import ALARM_HIGH_BIT
+from conftest import response
+
+
+@pytest.fixture
+def device():
+    return TC3625_EmulatedDevice()
+
+
+def test_eeprom(device):
+    device.write('proportional bandwidth', 700)
+    device.write('eeprom write enable', 0)
+    device.write('integral gain', 50)
+    device.power_on_reset()
+    # Only the write made while eeprom writes were enabled survives
+    assert device.read('proportional bandwidth') == 700
+    assert device.read('integral gain') == 0
+    assert device.read('eeprom write enable') == 1
+
+
+def test_plant(device):
+    t0 = device.last_update
+    assert device.read('input1') == 2500
+    device.write('fixed desired control setting', 3000)
+    device.write('power on/off', 1)
+    device.update(t0 + 30.0)
+    temp = device.temp
+    assert 25.0 < temp < 30.5
+    assert device.read('power output') > 0
+    # Working units F
+    device.write('temperature working units', 0)
+    assert device.read('input1') == int(round(100*(temp*9.0/5.0 + 32.0)))
+    # Power off - back to ambient
+    device.write('power on/off', 0)
+    device.update(t0 + 30.0 + 600.0)
+    assert device.temp == pytest.approx(25.0, abs=0.1)
+
+
+def test_alarm_latch(device):
+    device.write('alarm type', 2)
+    device.write('alarm latch enable', 1)
+    device.write('high alarm setting', 2000)
+    assert device.read('alarm status') == 1<<ALARM_HIGH_BIT
+    device.write('high alarm setting', 5000)
+    # Latched until reset
+    assert device.read('alarm status') == 1<<ALARM_HIGH_BIT
+    device.write('alarm latch request', 0)
+    assert device.read('alarm status') == 0
+
+
+def test_frames():
+    emu = TC3625_Emulator(devices=['01', '02'], baud_rate=9600)
+    codec = TC3625_Codec('02', SERIAL_CMDS)
+    frame = codec.read_frame('proportional bandwidth')
+    # A frame split over several reads, with leading garbage
+    assert emu.process('\x00' + frame[:4]) == []
+    [(reply, delay)] = emu.process(frame[4:])
+    assert reply == response('%08x'%(500,))
+    assert delay == pytest.approx(emu.wire_time(len(frame) + len(reply)))
+    # Bad checksum
+    bad = frame[:-3] + HEX_BYTE[(int(frame[-3:-1], 16) + 1) & 0xff] + ETX
+    assert emu.process(bad) == [(response(NAK_VALUE), delay)]
+    assert emu.checksum_errors == 1
+    # No device at the address - no reply
+    assert emu.process(TC3625_Codec('03', SERIAL_CMDS).read_frame('input1')) == []
+    assert emu.frames_received == 3
+
+
+def test_error_injection():
+    emu = TC3625_Emulator(error_rate=0.5, seed=1)
+    codec = TC3625_Codec('00', SERIAL_CMDS)
+    errors = 0
+    for i in range(100):
+        [(reply, delay)] = emu.process(codec.read_frame('input2'))
+        if reply != response('%08x'%(2500,)):
+            errors += 1
+    assert errors == emu.errors_injected
+    assert 25 < errors < 75
+
+
+def test_pty():
+    emu = TC3625_Emulator()
+    emu.start()
+    try:
+        ctlr = TC3625(port=emu.port, timeout=1.0)
+        assert ctlr.get_proportional_bandwidth() == 5.0
+        ctlr.close()
+    finally:
+        emu.stop()
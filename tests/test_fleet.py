@@ -0,0 +1,44 @@
+"""
+TC3625Fleet - controllers on several ports and on a shared line.
+"""
+import pytest
+
+from tc3625 import TC3625Fleet
+
+BUS_PORT='loop://?realtime=0&devices=01,02'
+
+
+@pytest.fixture
+def fleet():
+    fleet = TC3625Fleet({
+        'a': 'loop://?realtime=0',
+        'b': (BUS_PORT, '01'),
+        'c': (BUS_PORT, '02'),
+        })
+    yield fleet
+    fleet.close()
+
+
+def test_read_write(fleet):
+    assert fleet.open_errors == {}
+    results, errors = fleet.write('proportional bandwidth', {'a': 6.0, 'c': 7.0})
+    assert sorted(results) == ['a', 'c']
+    assert errors == {}
+    results, errors = fleet.read('proportional bandwidth')
+    assert results == {'a': 6.0, 'b': 5.0, 'c': 7.0}
+    assert errors == {}
+
+
+def test_unknown_controller(fleet):
+    with pytest.raises(ValueError):
+        fleet.write('proportional bandwidth', {'d': 1.0})
+
+
+def test_empty_fleet():
+    fleet = TC3625Fleet([])
+    try:
+        assert fleet.keys() == []
+        assert fleet.read('input1') == ({}, {})
+        assert fleet.get_all() == ({}, {})
+    finally:
+        fleet.close()
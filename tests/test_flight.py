@@ -0,0 +1,78 @@
+"""
+Single-flight reads - concurrent reads of a register share one
+transaction.
+"""
+import time
+import threading
+import pytest
+
+from tc3625 import TC3625, TC3625_RetryPolicy
+from conftest import LOOP_PORT, transactions
+
+NUM_READERS=4
+
+
+def concurrent_reads(ctlr, read):
+    """
+    Start NUM_READERS threads calling read while the line is held, so
+    that they all join the first read. Returns the results, values or
+    exceptions, in thread order.
+    """
+    results = [None]*NUM_READERS
+    def reader(i):
+        try:
+            results[i] = read()
+        except Exception, err:
+            results[i] = err
+    ctlr.lock.acquire()
+    try:
+        threads = []
+        for i in range(NUM_READERS):
+            thread = threading.Thread(target=reader, args=(i,))
+            thread.start()
+            threads.append(thread)
+        t_end = time.time() + 2.0
+        while ctlr.coalesced_reads < NUM_READERS - 1 and time.time() < t_end:
+            time.sleep(0.01)
+    finally:
+        ctlr.lock.release()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_reads(ctlr):
+    results = concurrent_reads(ctlr, ctlr.get_input1)
+    assert results == [25.0]*NUM_READERS
+    assert ctlr.coalesced_reads == NUM_READERS - 1
+    assert transactions(ctlr, 'input1') == 1
+    # The flight has ended - the next read is sent
+    ctlr.get_input1()
+    assert transactions(ctlr, 'input1') == 2
+
+
+def test_shared_error(ctlr):
+    calls = []
+    def failing_read(cmd, *args):
+        calls.append(cmd)
+        raise IOError('no response')
+    ctlr.dev.read = failing_read
+    results = concurrent_reads(ctlr, ctlr.get_input1)
+    assert [type(err) for err in results] == [IOError]*NUM_READERS
+    assert len(set([id(err) for err in results])) == 1
+    assert len(calls) == ctlr.retry_policy.max_attempt
+
+
+def test_coalesce_window():
+    ctlr = TC3625(port=LOOP_PORT, metrics=True, coalesce_window=10.0)
+    try:
+        assert ctlr.get_proportional_bandwidth() == 5.0
+        assert ctlr.get_proportional_bandwidth() == 5.0
+        assert ctlr.coalesced_reads == 1
+        assert transactions(ctlr, 'proportional bandwidth') == 1
+        # A write ends the sharing of the earlier read
+        ctlr.set_proportional_bandwidth(7.5)
+        assert ctlr.get_proportional_bandwidth() == 7.5
+        assert ctlr.coalesced_reads == 1
+    finally:
+        ctlr.close()
@@ -0,0 +1,57 @@
+"""
+Memory mapped telemetry log - segments, time ranges and reopening.
+"""
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from tc3625.tc3625_log import TC3625_LogWriter, TC3625_LogReader, list_segments
+
+
+def fill(path, n, segment_records=4):
+    log = TC3625_LogWriter(path, segment_records=segment_records)
+    for i in range(n):
+        log.append(float(i), input1=2500 + i, alarm_status=i % 2)
+    return log
+
+
+def test_segment_roll(tmpdir):
+    path = str(tmpdir)
+    log = fill(path, 10)
+    assert len(list_segments(path)) == 3
+    reader = TC3625_LogReader(path)
+    assert len(reader) == 10
+    data = reader.range()
+    assert list(data['time']) == [float(i) for i in range(10)]
+    assert list(data['input1']) == [2500 + i for i in range(10)]
+    # Ranges within a segment and across segments
+    assert list(reader.range(1.0, 3.0)['time']) == [1.0, 2.0]
+    assert list(reader.range(3.0, 9.0)['time']) == [3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+    assert list(reader.range(9.5)['time']) == []
+    assert list(reader.latest(5)['time']) == [5.0, 6.0, 7.0, 8.0, 9.0]
+    assert reader.convert(reader.latest(1))['input1'][0] == pytest.approx(25.09)
+    log.close()
+    reader.close()
+
+
+def test_reader_follows_writer(tmpdir):
+    path = str(tmpdir)
+    log = fill(path, 3)
+    reader = TC3625_LogReader(path)
+    assert len(reader) == 3
+    log.append(3.0)
+    log.append(4.0)
+    assert len(reader) == 5
+    assert list(reader.latest(2)['time']) == [3.0, 4.0]
+    log.close()
+
+
+def test_reopen(tmpdir):
+    path = str(tmpdir)
+    fill(path, 6).close()
+    log = TC3625_LogWriter(path, segment_records=4)
+    with pytest.raises(ValueError):
+        log.append(4.0)
+    log.append(6.0)
+    log.close()
+    assert list(TC3625_LogReader(path).range()['time']) == [float(i) for i in range(7)]
@@ -0,0 +1,44 @@
+"""
+The get_*/set_* methods generated from METHOD_DICT.
+"""
+import pytest
+
+from tc3625 import TC3625, METHOD_DICT, method_stub
+from conftest import LOOP_PORT
+
+
+def test_methods_per_class():
+    for k in METHOD_DICT:
+        for kind in ('get', 'set'):
+            name = kind + method_stub(k)
+            if kind in METHOD_DICT[k]:
+                method = getattr(TC3625, name)
+                assert method.__name__ == name
+                assert method.__doc__ == METHOD_DICT[k][kind].__doc__
+                assert method.__doc__
+            else:
+                assert not hasattr(TC3625, name)
+
+
+def test_controllers_independent():
+    # Each controller talks to its own device, whichever was created
+    # last
+    ctlr1 = TC3625(port=LOOP_PORT)
+    ctlr2 = TC3625(port=LOOP_PORT)
+    try:
+        ctlr1.set_proportional_bandwidth(7.5)
+        assert ctlr1.get_proportional_bandwidth() == 7.5
+        assert ctlr2.get_proportional_bandwidth() == 5.0
+        ctlr2.set_control_type('deadband')
+        assert ctlr1.get_control_type() == 'PID'
+        assert not 'get_proportional_bandwidth' in vars(ctlr1)
+    finally:
+        ctlr1.close()
+        ctlr2.close()
+
+
+def test_set_argument_count(ctlr):
+    with pytest.raises(TypeError):
+        ctlr.set_proportional_bandwidth()
+    with pytest.raises(TypeError):
+        ctlr.get_input1(1)
@@ -0,0 +1,61 @@
+"""
+Array conversions of tc3625_numeric against the scalar functions.
+"""
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from tc3625 import int2dec, int2perc, amp2cnt, cnt2amp, dec2int
+from tc3625 import METHOD_DICT, ALARM_VALUES
+from tc3625.tc3625_serial import to_twoscomp, from_twoscomp
+from tc3625.tc3625_numeric import int2dec_array, dec2int_array, int2perc_array
+from tc3625.tc3625_numeric import amp2cnt_array, cnt2amp_array
+from tc3625.tc3625_numeric import from_twoscomp_array, to_twoscomp_array
+from tc3625.tc3625_numeric import alarm_status_array, alarm_bits_array
+
+VALUES=[-0x80000000, -15000, -1, 0, 1, 511, 2534, 15000, 0x7fffffff]
+
+
+def test_conversions():
+    for func, func_array in ((int2dec, int2dec_array),
+                             (int2perc, int2perc_array),
+                             (amp2cnt, amp2cnt_array),
+                             (cnt2amp, cnt2amp_array)):
+        assert list(func_array(VALUES)) == [func(x) for x in VALUES]
+    temps = [-20.5, -0.015, 0.0, 25.34, 99.999]
+    assert list(dec2int_array(temps)) == [dec2int(x) for x in temps]
+
+
+def test_twoscomp():
+    fields = [to_twoscomp(x) for x in VALUES]
+    assert list(to_twoscomp_array(VALUES)) == fields
+    # A buffer of concatenated fields, a list and an S8 array
+    assert list(from_twoscomp_array(''.join(fields))) == VALUES
+    assert list(from_twoscomp_array(fields)) == VALUES
+    assert list(from_twoscomp_array(to_twoscomp_array(VALUES))) == VALUES
+    assert from_twoscomp_array('0000ABCD')[0] == from_twoscomp('0000ABCD')
+    assert to_twoscomp_array(numpy.zeros((2, 3))).shape == (2, 3)
+
+
+def test_twoscomp_errors():
+    with pytest.raises(ValueError):
+        from_twoscomp_array('0000000')
+    with pytest.raises(ValueError):
+        from_twoscomp_array('0000000g')
+    with pytest.raises(ValueError):
+        from_twoscomp_array(numpy.array([1, 2]))
+
+
+def test_alarm_status():
+    mask = METHOD_DICT['alarm status']['get']
+    status = numpy.arange(128)
+    flags, lists = alarm_status_array(status)
+    for x in status:
+        assert (flags[x], lists[x]) == mask.decode(int(x))
+    # Bits outside the table are decoded one by one
+    flags, lists = alarm_status_array([[0x80, 0x81]])
+    assert flags.shape == (1, 2)
+    assert (flags[0, 1], lists[0, 1]) == mask.decode(0x81)
+    bits = alarm_bits_array([0, 1<<ALARM_VALUES['low'], 0x7f])
+    assert list(bits['low']) == [False, True, True]
+    assert list(bits['high']) == [False, False, True]
@@ -0,0 +1,48 @@
+"""
+Stream resynchronisation of the tc3625_codec response parser.
+"""
+import pytest
+
+from tc3625.tc3625_codec import TC3625_Codec, TC3625_Parser
+from tc3625.tc3625_codec import STX, NAK_VALUE, RETURN_SIZE
+from tc3625.tc3625_codec import TC3625_NakError
+from tc3625.tc3625_serial import SERIAL_CMDS
+from conftest import response, value_response
+
+
+@pytest.fixture
+def codec():
+    return TC3625_Codec('00', SERIAL_CMDS)
+
+
+def test_parser_incremental(codec):
+    parser = TC3625_Parser(codec)
+    data = value_response(42)
+    for c in data[:-1]:
+        parser.feed(c)
+        assert parser.next_value() == None
+    assert parser.needed() == 1
+    parser.feed(data[-1])
+    assert parser.next_value() == 42
+    assert parser.needed() == RETURN_SIZE
+
+
+def test_parser_resync(codec):
+    parser = TC3625_Parser(codec)
+    # Leading garbage, a frame cut short by a dropped byte and a stray
+    # stx are skipped - only the complete frames are returned
+    partial = value_response(7)
+    partial = partial[:5] + partial[6:]
+    parser.feed('\x00\xff' + partial + value_response(1) + STX + value_response(-2))
+    assert parser.next_value() == 1
+    assert parser.next_value() == -2
+    assert parser.next_value() == None
+    assert parser.dropped > 0
+
+
+def test_parser_consumes_bad_frame(codec):
+    parser = TC3625_Parser(codec)
+    parser.feed(response(NAK_VALUE) + value_response(5))
+    with pytest.raises(TC3625_NakError):
+        parser.next_value()
+    assert parser.next_value() == 5
@@ -0,0 +1,92 @@
+"""
+Background polling - listeners and the sharing of the wire time of a
+bus.
+"""
+import time
+import pytest
+
+from tc3625 import TC3625, TC3625_Bus
+from tc3625.tc3625_poller import TC3625_Poller, DFLT_MAX_UTILIZATION
+from conftest import LOOP_PORT, transactions
+
+
+def wait_for(cond, timeout=2.0):
+    t_end = time.time() + timeout
+    while not cond() and time.time() < t_end:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_failing_listener(ctlr):
+    samples = []
+    def bad_listener(prop, t, raw, value):
+        raise IOError('log is closed')
+    poller = ctlr.start_polling({'input1': 100.0})
+    poller.add_listener(bad_listener)
+    poller.add_listener(lambda *sample: samples.append(sample))
+    try:
+        assert wait_for(lambda: len(samples) >= 5)
+        assert poller.thread.isAlive()
+        assert poller.listener_errors >= 5
+    finally:
+        ctlr.stop_polling()
+
+
+def test_poll_bypasses_cache():
+    ctlr = TC3625(port=LOOP_PORT, metrics=True, cache=True)
+    poller = ctlr.start_polling({'proportional bandwidth': 100.0})
+    try:
+        assert wait_for(lambda: transactions(ctlr, 'proportional bandwidth') >= 5)
+    finally:
+        ctlr.close()
+
+
+def test_failing_poll(ctlr):
+    def broken(cmd, fresh=False):
+        raise RuntimeError('broken')
+    ctlr._get_value = broken
+    poller = ctlr.start_polling({'input1': 100.0})
+    try:
+        assert wait_for(lambda: poller.errors.get('input1', 0) >= 5)
+        assert poller.thread.isAlive()
+    finally:
+        ctlr.stop_polling()
+
+
+@pytest.fixture
+def bus():
+    bus = TC3625_Bus(port='loop://?devices=01,02')
+    bus.open()
+    yield bus
+    bus.close()
+
+
+def test_shared_bus_load(bus):
+    ctlr1 = TC3625(address='01', bus=bus)
+    ctlr2 = TC3625(address='02', bus=bus)
+    # Each scan list alone fits in the wire time, both together do not
+    scan_list = {'input1': 0.6*DFLT_MAX_UTILIZATION/TC3625_Poller(ctlr1).transaction_time}
+    poller1 = ctlr1.start_polling(scan_list)
+    try:
+        poller2 = TC3625_Poller(ctlr2, scan_list)
+        assert poller2.scale < 0.9
+        assert poller2.scale*(poller1.load() + poller2.load()) == pytest.approx(DFLT_MAX_UTILIZATION)
+        poller2.start()
+        assert bus.pollers == [poller1, poller2]
+        assert wait_for(lambda: poller1.scale < 0.9)
+        poller2.stop()
+    finally:
+        ctlr1.stop_polling()
+    assert bus.pollers == []
+    poller2._update_scale()
+    assert poller2.scale == 1.0
+
+
+def test_own_line_not_shared(ctlr):
+    other = TC3625(port=LOOP_PORT)
+    try:
+        scan_list = {'input1': 0.6*DFLT_MAX_UTILIZATION/TC3625_Poller(ctlr).transaction_time}
+        other.start_polling(scan_list)
+        assert TC3625_Poller(ctlr, scan_list).scale == 1.0
+    finally:
+        other.close()
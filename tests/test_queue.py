@@ -0,0 +1,79 @@
+"""
+Priority classes of TC3625_CommandQueue.
+"""
+import time
+import threading
+import pytest
+
+from tc3625 import TC3625, TC3625_Serial, TC3625_TraceHook
+from tc3625.tc3625_queue import TC3625_CommandQueue
+from tc3625.tc3625_queue import PRIORITY_SAFETY, PRIORITY_OPERATOR, PRIORITY_TELEMETRY, PRIORITY_CONFIG
+from conftest import LOOP_PORT
+
+
+class Transmitted(TC3625_TraceHook):
+
+    def __init__(self):
+        self.cmds=[]
+
+    def on_transmit(self, cmd, frame, t):
+        self.cmds.append(cmd)
+
+
+@pytest.fixture
+def queue():
+    queue = TC3625_CommandQueue(TC3625_Serial(port=LOOP_PORT))
+    queue.open()
+    yield queue
+    queue.close()
+
+
+def wait_for(cond, timeout=2.0):
+    t_end = time.time() + timeout
+    while not cond() and time.time() < t_end:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_default_priorities(queue):
+    assert queue.write_priority['alarm latch request'] == PRIORITY_SAFETY
+    assert queue.write_priority['power on/off'] == PRIORITY_SAFETY
+    assert queue.read_priority['alarm status'] == PRIORITY_SAFETY
+    assert queue.read_priority['input1'] == PRIORITY_TELEMETRY
+    assert queue.read_priority['proportional bandwidth'] == PRIORITY_CONFIG
+    assert queue.write_priority['proportional bandwidth'] == PRIORITY_OPERATOR
+
+
+@pytest.mark.filterwarnings('ignore')
+def test_safety_first(queue):
+    ctlr = TC3625(queue=queue)
+    hook = Transmitted()
+    queue.dev.hooks = [hook]
+    # Hold the line while the requests queue up
+    queue.acquire(PRIORITY_CONFIG)
+    threads = []
+    for func in (ctlr.get_proportional_bandwidth, ctlr.get_input1, ctlr.set_alarm_latch_reset):
+        thread = threading.Thread(target=func)
+        thread.start()
+        threads.append(thread)
+        assert wait_for(lambda: len(queue.waiting) == len(threads))
+    queue.release()
+    for thread in threads:
+        thread.join()
+    assert hook.cmds == ['alarm latch request', 'input1', 'proportional bandwidth']
+    stats = queue.stats()
+    assert stats['safety']['count'] == 1
+    assert stats['telemetry']['count'] == 1
+    # The line held by the test counts as a config transaction
+    assert stats['config']['count'] == 2
+
+
+def test_wait_stats_wall_clock_jump(queue, monkeypatch):
+    # Setting the system clock does not show up as a wait
+    wall = [time.time()]
+    def jumping_time():
+        wall[0] += 3600.0
+        return wall[0]
+    monkeypatch.setattr(time, 'time', jumping_time)
+    queue.read('input1')
+    assert queue.stats()['telemetry']['max_wait'] < 1.0
@@ -0,0 +1,118 @@
+"""
+Reconnection of TC3625 after a failure of the port and restoring of
+the values written while eeprom write was off.
+"""
+import errno
+import pytest
+
+from tc3625 import TC3625, TC3625_RetryPolicy, TC3625_CircuitBreaker
+from tc3625 import TC3625_LinkError, TC3625_CircuitOpenError
+from conftest import LOOP_PORT
+
+
+def unplug(ctlr):
+    """
+    Make the port of ctlr fail as an unplugged USB serial adapter does.
+    The controller is reset, a new loop:// emulator is opened on
+    reconnecting.
+    """
+    def write(data):
+        raise IOError(errno.EIO, 'Input/output error')
+    ctlr.dev.serial.write = write
+
+
+@pytest.fixture
+def linked():
+    ctlr = TC3625(
+        port=LOOP_PORT,
+        metrics=True,
+        retry_policy=TC3625_RetryPolicy(backoff=0.0),
+        reconnect_interval=0.0,
+        )
+    yield ctlr
+    ctlr.close()
+
+
+def test_reconnect(linked):
+    old_dev = linked.dev
+    unplug(linked)
+    assert linked.get_proportional_bandwidth() == 5.0
+    assert linked.dev is not old_dev
+    assert linked.link_down == None
+    stats = linked.stats()
+    assert stats['counters']['link_errors']['proportional bandwidth'] == 1
+    assert stats['counters']['reconnects'][''] == 1
+    assert stats['histograms']['outage_time']['']['count'] == 1
+
+
+def test_restore_ram_settings(linked):
+    # Written with eeprom write off (the default), so lost on reset
+    linked.set_proportional_bandwidth(7.5)
+    linked.set_integral_gain(0.5)
+    linked.set_eeprom_write('on')
+    linked.set_derivative_gain(0.25)
+    linked.set_eeprom_write('off')
+    assert linked.ram_config.keys() == ['proportional bandwidth', 'integral gain']
+    unplug(linked)
+    assert linked.get_proportional_bandwidth() == 7.5
+    assert linked.get_integral_gain() == 0.5
+    assert linked.get_eeprom_write() == 'off'
+    # Not restored - in a real controller it would have been kept in eeprom
+    assert linked.get_derivative_gain() == 0.0
+
+
+def test_no_reconnect():
+    ctlr = TC3625(
+        port=LOOP_PORT,
+        retry_policy=TC3625_RetryPolicy(max_attempt=2, backoff=0.0),
+        reconnect=False,
+        )
+    try:
+        unplug(ctlr)
+        with pytest.raises(IOError) as info:
+            ctlr.get_input1()
+        assert 'TC3625_LinkError' in str(info.value)
+    finally:
+        ctlr.close()
+
+
+def test_reconnect_interval(linked):
+    linked.reconnect_interval = 60.0
+    unplug(linked)
+    linked.t_reconnect = 0.0
+    linked.port = '/dev/no_such_tty'
+    # The first reconnect fails, later ones wait for the interval
+    with pytest.raises(IOError):
+        linked.get_input1()
+    assert linked.link_down != None
+    with pytest.raises(TC3625_LinkError):
+        linked._reconnect()
+
+
+def test_failed_reconnect_is_an_attempt(linked):
+    linked.breaker = TC3625_CircuitBreaker(threshold=2, probe_interval=60.0)
+    linked.retry_policy = TC3625_RetryPolicy(max_attempt=3, backoff=0.0)
+    linked.reconnect_interval = 60.0
+    unplug(linked)
+    linked.port = '/dev/no_such_tty'
+    # Each request fails after its attempts, the first reconnect of the
+    # first request fails and the others wait for the interval
+    for i in range(2):
+        with pytest.raises(IOError) as info:
+            linked.get_input1()
+        assert 'TC3625_LinkError' in str(info.value)
+    stats = linked.stats()
+    assert stats['counters']['failures']['input1'] == 2
+    assert stats['counters']['retries']['input1'] == 4
+    assert stats['histograms']['request_time']['input1']['count'] == 2
+    # The breaker has heard about the failures
+    with pytest.raises(TC3625_CircuitOpenError):
+        linked.get_input1()
+    assert linked.stats()['counters']['rejected']['input1'] == 1
+    # Back - the probe reconnects
+    linked.port = LOOP_PORT
+    linked.t_reconnect = 0.0
+    linked.breaker.probe_interval = 0.0
+    assert linked.get_proportional_bandwidth() == 5.0
+    assert not linked.breaker.is_open()
+    assert linked.link_down == None
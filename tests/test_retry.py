@@ -0,0 +1,129 @@
+"""
+Retry policy and circuit breaker, on their own and in TC3625.
+"""
+import time
+import pytest
+
+from tc3625 import TC3625, TC3625_RetryPolicy, TC3625_CircuitBreaker
+from tc3625 import TC3625_CircuitOpenError, TC3625_TimeoutError, TC3625_ChecksumError
+from conftest import LOOP_PORT, transactions
+
+
+def test_policy_limits():
+    policy = TC3625_RetryPolicy(max_attempt=5, timeout_attempt=2)
+    assert policy.limit(TC3625_ChecksumError()) == 5
+    assert policy.limit(TC3625_TimeoutError()) == 2
+    assert policy.limit(IOError()) == 5
+    policy.set_limit(TC3625_ChecksumError, 8)
+    assert policy.limit(TC3625_ChecksumError()) == 8
+    # The timeout limit can not exceed max_attempt
+    assert TC3625_RetryPolicy(max_attempt=2, timeout_attempt=3).limit(TC3625_TimeoutError()) == 2
+
+
+def test_policy_backoff():
+    policy = TC3625_RetryPolicy(max_attempt=10, backoff=0.01, backoff_factor=2.0, max_backoff=0.05)
+    err = TC3625_ChecksumError()
+    delays = [policy.delay(err, cnt) for cnt in range(1, 10)]
+    assert delays[:3] == pytest.approx([0.01, 0.02, 0.04])
+    assert max(delays) == pytest.approx(0.05)
+    assert policy.delay(err, 10) == None
+
+
+def test_breaker_states():
+    breaker = TC3625_CircuitBreaker(threshold=2, probe_interval=0.05)
+    assert breaker.allow() == False
+    breaker.failure()
+    assert not breaker.is_open()
+    breaker.failure()
+    assert breaker.is_open()
+    with pytest.raises(TC3625_CircuitOpenError):
+        breaker.allow()
+    time.sleep(0.06)
+    # One probe is let through, the others still fail fast
+    assert breaker.allow() == True
+    with pytest.raises(TC3625_CircuitOpenError):
+        breaker.allow()
+    breaker.failure()
+    with pytest.raises(TC3625_CircuitOpenError):
+        breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow() == True
+    breaker.success()
+    assert not breaker.is_open()
+    assert breaker.allow() == False
+
+
+def test_retry_corrupted_responses():
+    # A third of the transactions are corrupted on the wire
+    ctlr = TC3625(
+        port=LOOP_PORT + '&error_rate=0.3&seed=1',
+        metrics=True,
+        retry_policy=TC3625_RetryPolicy(max_attempt=20, backoff=0.0),
+        )
+    try:
+        for i in range(50):
+            assert ctlr.get_proportional_bandwidth() == 5.0
+        counters = ctlr.stats()['counters']
+        assert counters['retries']['proportional bandwidth'] > 0
+        assert counters['failures'] == {}
+    finally:
+        ctlr.close()
+
+
+def test_breaker_fails_fast():
+    # No controller answers at address 02
+    ctlr = TC3625(
+        port=LOOP_PORT + '&devices=01',
+        address='02',
+        timeout=0.02,
+        eeprom=None,
+        metrics=True,
+        retry_policy=TC3625_RetryPolicy(max_attempt=10, timeout_attempt=2, backoff=0.0),
+        breaker=TC3625_CircuitBreaker(threshold=2, probe_interval=0.1),
+        )
+    try:
+        for i in range(2):
+            with pytest.raises(IOError) as info:
+                ctlr.get_input1()
+            assert not isinstance(info.value, TC3625_CircuitOpenError)
+        counters = ctlr.stats()['counters']
+        assert counters['timeouts']['input1'] == 4
+        assert counters['failures']['input1'] == 2
+        with pytest.raises(TC3625_CircuitOpenError):
+            ctlr.get_input1()
+        assert counters['timeouts']['input1'] == 4
+        assert ctlr.stats()['counters']['rejected']['input1'] == 1
+        # A probe is a single attempt
+        time.sleep(0.11)
+        with pytest.raises(IOError):
+            ctlr.get_input1()
+        assert ctlr.stats()['counters']['timeouts']['input1'] == 5
+    finally:
+        ctlr.close()
+
+
+def test_default_policy():
+    # As before the retry policy - max_attempt attempts whatever the
+    # error, no backoff and no circuit breaker
+    ctlr = TC3625(port=LOOP_PORT, max_attempt=4)
+    try:
+        assert ctlr.breaker == None
+        assert ctlr.retry_policy.limit(TC3625_TimeoutError()) == 4
+        assert ctlr.retry_policy.limit(TC3625_ChecksumError()) == 4
+        assert ctlr.retry_policy.delay(TC3625_TimeoutError(), 1) == 0.0
+    finally:
+        ctlr.close()
+
+
+def test_breaker_closes_on_success(ctlr):
+    ctlr.breaker = TC3625_CircuitBreaker()
+    ctlr.breaker.failure()
+    ctlr.breaker.failure()
+    ctlr.breaker.failure()
+    assert ctlr.breaker.is_open()
+    with pytest.raises(TC3625_CircuitOpenError):
+        ctlr.get_input1()
+    ctlr.breaker.probe_interval = 0.0
+    ctlr.get_input1()
+    assert not ctlr.breaker.is_open()
+    assert transactions(ctlr, 'input1') == 1
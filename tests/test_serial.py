@@ -0,0 +1,69 @@
+"""
+Transactions of TC3625_Serial - timing of the response and the adaptive
+read timeout.
+"""
+import time
+import pytest
+
+from tc3625.tc3625_serial import TC3625_Serial
+from tc3625.tc3625_serial import TIMEOUT_MIN_SAMPLES, TIMEOUT_MARGIN, TIMEOUT_RESOLUTION
+from tc3625.tc3625_codec import SEND_SIZE_READ, SEND_SIZE_WRITE, TC3625_TimeoutError
+from conftest import LOOP_PORT
+
+
+@pytest.fixture
+def dev():
+    dev = TC3625_Serial(port=LOOP_PORT, timeout=0.5)
+    dev.open()
+    yield dev
+    dev.close()
+
+
+def test_wall_clock_jump(dev, monkeypatch):
+    # Setting the system clock must not time out or skew the round trip
+    # times of the transactions
+    wall = [time.time()]
+    def jumping_time():
+        wall[0] += 3600.0
+        return wall[0]
+    monkeypatch.setattr(time, 'time', jumping_time)
+    assert dev.read('proportional bandwidth') == 500
+    assert 0 <= dev.last_rtt < 0.5
+
+
+def test_adaptive_timeout(dev):
+    # The configured timeout until enough responses have been seen
+    for i in range(TIMEOUT_MIN_SAMPLES - 1):
+        dev.read('input1')
+    assert dev.get_timeout(SEND_SIZE_READ) == 0.5
+    dev.read('input1')
+    timeout = dev.get_timeout(SEND_SIZE_READ)
+    assert dev.wire_time(SEND_SIZE_READ) + TIMEOUT_MARGIN <= timeout < 0.5
+    # Writes are tracked separately
+    assert dev.get_timeout(SEND_SIZE_WRITE) == 0.5
+    # and used for the next read
+    dev.read('input1')
+    assert dev.read_timeout == timeout
+    assert dev.serial.timeout == timeout
+
+
+def test_adaptive_timeout_backoff(dev):
+    for i in range(TIMEOUT_MIN_SAMPLES):
+        dev.read('input1')
+    timeout = dev.get_timeout(SEND_SIZE_READ)
+    # No controller answers at this address
+    with pytest.raises(TC3625_TimeoutError):
+        dev.read('input1', '07')
+    # Doubled, up to the rounding to TIMEOUT_RESOLUTION
+    assert timeout < dev.get_timeout(SEND_SIZE_READ) <= 2*timeout + TIMEOUT_RESOLUTION
+    dev.read('input1')
+    assert dev.get_timeout(SEND_SIZE_READ) == pytest.approx(timeout, abs=TIMEOUT_RESOLUTION)
+
+
+def test_fixed_timeout():
+    dev = TC3625_Serial(port=LOOP_PORT, timeout=0.5, adaptive_timeout=False)
+    dev.open()
+    for i in range(TIMEOUT_MIN_SAMPLES):
+        dev.read('input1')
+    assert dev.get_timeout(SEND_SIZE_READ) == 0.5
+    dev.close()
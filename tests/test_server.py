@@ -0,0 +1,78 @@
+"""
+TC3625_Server and TC3625_Client on a local TCP socket.
+"""
+import pytest
+
+from tc3625 import TC3625, TC3625_Server, TC3625_Client
+from conftest import LOOP_PORT, transactions
+
+
+@pytest.fixture
+def server():
+    ctlr = TC3625(port=LOOP_PORT, metrics=True)
+    server = TC3625_Server({'bath': ctlr}, address=('127.0.0.1', 0))
+    server.start()
+    yield server
+    server.shutdown()
+    ctlr.close()
+
+
+@pytest.fixture
+def client(server):
+    client = TC3625_Client('bath', address=server.address, timeout=5.0)
+    yield client
+    client.close()
+
+
+def test_client_api(server, client):
+    assert client.get_proportional_bandwidth() == 5.0
+    client.set_proportional_bandwidth(7.5)
+    assert client.get_proportional_bandwidth() == 7.5
+    assert 'input1' in client.get_all()
+    # One read and the write, the other reads are served from the
+    # cache of the controller in the server
+    assert transactions(server.ctlrs['bath'], 'proportional bandwidth') == 2
+
+
+def test_client_stats(client):
+    assert client.stats() == None
+    assert client.breaker == None
+    assert client.link_down == None
+    client.invalidate('proportional bandwidth')
+    client.get_proportional_bandwidth()
+
+
+def test_client_attributes(client):
+    # The client is set up like a TC3625, with the settings of the
+    # server side features turned off
+    ctlr = TC3625(port=LOOP_PORT, open=False, eeprom=None)
+    assert set(vars(ctlr)) <= set(vars(client))
+    assert client.retry_policy.limit(IOError()) == 1
+    assert client.cache_enabled == False
+    assert client.reconnect == False
+
+
+def test_unknown_controller(server):
+    with pytest.raises(ValueError):
+        TC3625_Client('stage', address=server.address)
+
+
+def test_client_timeout():
+    ctlr = TC3625(port='loop://?response_delay=0.3')
+    server = TC3625_Server({'bath': ctlr}, address=('127.0.0.1', 0))
+    server.start()
+    client = TC3625_Client('bath', address=server.address, timeout=0.1)
+    try:
+        with pytest.raises(IOError):
+            client.get_input1()
+        assert client.link_down != None
+        # The late response of the failed request is not taken for the
+        # response of the next one
+        client.timeout = 5.0
+        assert client.get_proportional_bandwidth() == 5.0
+        assert client.link_down == None
+        assert client.get_control_type() == 'PID'
+    finally:
+        client.close()
+        server.shutdown()
+        ctlr.close()
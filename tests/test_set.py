@@ -0,0 +1,83 @@
+"""
+Writing properties by name with TC3625.set and TC3625.set_by_dict -
+actions, the write order and diff mode.
+"""
+import warnings
+import pytest
+
+from tc3625 import TC3625_TraceHook
+from conftest import transactions
+
+
+class Transmitted(TC3625_TraceHook):
+
+    def __init__(self):
+        self.cmds=[]
+
+    def on_transmit(self, cmd, frame, t):
+        self.cmds.append(cmd)
+
+
+@pytest.fixture(autouse=True)
+def no_warnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def test_set_action(ctlr):
+    ctlr.set('alarm latch reset')
+    ctlr.set('alarm latch reset', None)
+    assert transactions(ctlr, 'alarm latch request') == 2
+
+
+def test_set_by_dict_action(ctlr):
+    changed = ctlr.set_by_dict({'alarm latch reset': None})
+    assert changed == [('alarm latch reset', None, None)]
+    assert transactions(ctlr, 'alarm latch request') == 1
+
+
+def test_set_by_dict_order(ctlr):
+    hook = Transmitted()
+    ctlr.add_hook(hook)
+    ctlr.set_by_dict({
+        'alarm latch reset': None,
+        'power state': 'on',
+        'proportional bandwidth': 6.0,
+        'control type': 'PID',
+        'working units': 'C',
+        'eeprom write': 'off',
+        })
+    assert hook.cmds == [
+        'eeprom write enable',
+        'temperature working units',
+        'control type',
+        'proportional bandwidth',
+        'power on/off',
+        'alarm latch request',
+        ]
+
+
+def test_set_by_dict_diff(ctlr):
+    ctlr.set_proportional_bandwidth(5.0)
+    ctlr.set_control_type('PID')
+    hook = Transmitted()
+    ctlr.add_hook(hook)
+    changed = ctlr.set_by_dict({
+        'proportional bandwidth': 5.0,
+        'control type': 'deadband',
+        'alarm latch reset': None,
+        }, diff=True)
+    assert changed == [
+        ('control type', 'PID', 'deadband'),
+        ('alarm latch reset', None, None),
+        ]
+    # Every property is read, only the changed ones and the action are
+    # written
+    assert hook.cmds == [
+        'control type', 'control type',
+        'proportional bandwidth',
+        'alarm latch request',
+        ]
+    assert ctlr.get_proportional_bandwidth() == 5.0
+    assert ctlr.get_control_type() == 'deadband'
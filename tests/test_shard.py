@@ -0,0 +1,72 @@
+"""
+Shared memory latest value table and the process sharded fleet.
+"""
+import os
+import time
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from tc3625.tc3625_shard import TC3625_SharedTable, TC3625_ShardedFleet
+from conftest import LOOP_PORT
+
+
+@pytest.fixture
+def table():
+    table = TC3625_SharedTable('test_table_%d'%(os.getpid(),), ['a', 'b'], ['input1', 'control type'])
+    yield table
+    table.close()
+    table.unlink()
+
+
+def test_table(table):
+    assert table.get('a', 'input1') == None
+    table.write('a', 'input1', 10.0, 2534, 25.34)
+    table.write('b', 'control type', 11.0, 1, numpy.nan)
+    assert table.get('a', 'input1') == (10.0, 25.34)
+    assert table.get_raw('b', 'control type') == (11.0, 1)
+    assert table.get('b', 'control type') == (11.0, 'PID')
+    assert table.column('input1') == {'a': (10.0, 25.34)}
+    # Every write bumps the sequence number twice, it is even between
+    # writes
+    assert table.seq[0,table.prop_index['input1']] == 2
+    snapshot = table.snapshot()
+    assert snapshot['raw'][table.ctlr_index['a'],table.prop_index['input1']] == 2534
+
+
+def test_table_by_name(table):
+    table.write('a', 'input1', 10.0, 2534, 25.34)
+    other = TC3625_SharedTable(table.name)
+    assert other.controllers == ['a', 'b']
+    assert other.get('a', 'input1') == (10.0, 25.34)
+    other.close()
+
+
+def test_torn_read(table):
+    # A slot left odd by a writer is never returned
+    table.write('a', 'input1', 10.0, 2534, 25.34)
+    table.seq[0,table.prop_index['input1']] += 1
+    with pytest.raises(IOError):
+        table.get('a', 'input1')
+
+
+def test_sharded_fleet():
+    ports = {'a': LOOP_PORT, 'b': LOOP_PORT + '&seed=1'}
+    # At this rate only the first sample of each controller is taken
+    # during the test, the table must still have it
+    fleet = TC3625_ShardedFleet(ports, shards=2, scan_list={'input1': 0.01},
+                                name='test_fleet_%d'%(os.getpid(),))
+    assert len(fleet.shards) == 2
+    fleet.start()
+    try:
+        # The samples of the worker processes are read in this process
+        t_end = time.time() + 10.0
+        while len(fleet.column('input1')) < 2 and time.time() < t_end:
+            time.sleep(0.05)
+        temps = fleet.column('input1')
+        assert sorted(temps) == ['a', 'b']
+        for t, temp in temps.values():
+            assert isinstance(temp, float)
+        assert fleet.is_alive() == [True, True]
+    finally:
+        fleet.stop()
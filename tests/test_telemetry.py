@@ -0,0 +1,54 @@
+"""
+Telemetry ring buffer - wrap around, views and conversion.
+"""
+import time
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from tc3625.tc3625_telemetry import TC3625_RingBuffer
+
+
+def test_wrap_around():
+    ring = TC3625_RingBuffer(capacity=4)
+    assert len(ring) == 0
+    assert len(ring.latest()) == 0
+    for i in range(10):
+        ring.append(float(i), input1=i)
+    assert len(ring) == 4
+    # The latest records are contiguous across the wrap around point
+    data = ring.latest()
+    assert list(data['time']) == [6.0, 7.0, 8.0, 9.0]
+    assert data.base is ring.data
+    assert list(ring.latest(2)['input1']) == [8, 9]
+    assert list(ring.latest(100)['input1']) == [6, 7, 8, 9]
+    with pytest.raises(ValueError):
+        data['input1'][0] = 0
+
+
+def test_convert():
+    ring = TC3625_RingBuffer(capacity=8)
+    ring.append(1.0, input1=2534, input2=-150, power_output=511,
+                output_current_counts=2, alarm_status=3)
+    values = ring.convert(ring.latest())
+    assert values['input1'][0] == pytest.approx(25.34)
+    assert values['input2'][0] == pytest.approx(-1.5)
+    assert values['power_output'][0] == pytest.approx(100.0)
+    assert values['output_current_counts'][0] == pytest.approx(5.0)
+    assert values['alarm_status'][0] == 3
+
+
+def test_poller_feed(ctlr):
+    ring = TC3625_RingBuffer(capacity=16)
+    poller = ctlr.start_polling({'input1': 100.0, 'input2': 100.0})
+    ring.attach(poller)
+    try:
+        t_end = time.time() + 2.0
+        while len(ring) < 5 and time.time() < t_end:
+            time.sleep(0.01)
+    finally:
+        ctlr.stop_polling()
+    data = ring.latest()
+    assert len(data) >= 5
+    assert (numpy.diff(data['time']) >= 0).all()
+    assert (data['input1'] == 2500).all()
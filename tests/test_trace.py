@@ -0,0 +1,74 @@
+"""
+Tracing hooks of TC3625_Serial and TC3625, and the Chrome trace.
+"""
+import json
+import pytest
+
+from tc3625 import TC3625, TC3625_TraceHook, TC3625_ChromeTrace
+from tc3625.tc3625_codec import RETURN_SIZE
+
+BAUD_RATE=1200
+CHAR_TIME=10.0/BAUD_RATE
+
+
+class Recorder(TC3625_TraceHook):
+
+    def __init__(self):
+        self.events=[]
+
+    def on_call(self, name, t):
+        self.events.append(('call', name, t))
+
+    def on_return(self, name, t, error):
+        self.events.append(('return', name, t))
+
+    def on_transmit(self, cmd, frame, t):
+        self.events.append(('transmit', cmd, t))
+
+    def on_first_byte(self, cmd, data, t):
+        self.events.append(('first_byte', data, t))
+
+    def on_response(self, cmd, response, t, error):
+        self.events.append(('response', response, t))
+
+
+@pytest.fixture
+def slow():
+    # Emulated wire time at a low baud rate and a delayed reply
+    ctlr = TC3625(port='loop://?response_delay=0.05', baudrate=BAUD_RATE)
+    yield ctlr
+    ctlr.close()
+
+
+def test_first_byte_before_response(slow):
+    hook = Recorder()
+    slow.add_hook(hook)
+    slow.get_input1()
+    kinds = [e[0] for e in hook.events]
+    assert kinds == ['call', 'transmit', 'first_byte', 'response', 'return']
+    t_transmit = hook.events[1][2]
+    first_byte, t_first = hook.events[2][1:]
+    response, t_response = hook.events[3][1:]
+    assert len(first_byte) == 1
+    assert len(response) == RETURN_SIZE
+    assert t_first - t_transmit >= 0.05
+    # The rest of the response takes 11 characters on the wire
+    assert t_response - t_first >= 0.8*(RETURN_SIZE - 1)*CHAR_TIME
+    slow.remove_hook(hook)
+    slow.get_input1()
+    assert len(hook.events) == 5
+
+
+def test_chrome_trace(slow, tmpdir):
+    filename = str(tmpdir.join('trace.json'))
+    trace = TC3625_ChromeTrace(filename)
+    slow.add_hook(trace)
+    slow.get_input1()
+    slow.set_proportional_bandwidth(5.0)
+    trace.close()
+    events = json.load(open(filename))
+    slices = dict([(e['name'], e) for e in events if e.get('cat') == 'frame'])
+    assert sorted(slices) == ['input1', 'proportional bandwidth', 'receive', 'wait']
+    assert slices['receive']['dur'] > 0
+    calls = [e['name'] for e in events if e.get('cat') == 'call']
+    assert calls == ['get_input1', 'get_input1', 'set_proportional_bandwidth', 'set_proportional_bandwidth']
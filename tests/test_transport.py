@@ -0,0 +1,137 @@
+"""
+Transports selected by URL - loop://, pty:// and tcp://, the url
+options and link_lost.
+"""
+import time
+import errno
+import socket
+import threading
+import pytest
+
+from tc3625 import TC3625
+from tc3625.tc3625_codec import TC3625_Codec
+from tc3625.tc3625_serial import SERIAL_CMDS
+from tc3625.tc3625_emulator import TC3625_Emulator
+from tc3625.tc3625_transport import open_transport, link_lost
+from tc3625.tc3625_transport import TC3625_LoopTransport, TC3625_PtyTransport
+from tc3625.tc3625_transport import TC3625_TCPTransport
+from conftest import response
+
+
+class EmulatorServer(threading.Thread):
+
+    """
+    Emulated controller behind a TCP socket, like a terminal server.
+    Serves a single connection.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon=True
+        self.emulator=TC3625_Emulator()
+        self.listener=socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.port=self.listener.getsockname()[1]
+
+    def run(self):
+        conn, addr = self.listener.accept()
+        self.listener.close()
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                break
+            for reply, delay in self.emulator.process(data):
+                conn.sendall(reply)
+        conn.close()
+
+
+def test_open_transport():
+    dev = open_transport('loop://?devices=01,02&seed=3&realtime=0', 0.1, 9600)
+    assert isinstance(dev, TC3625_LoopTransport)
+    assert sorted(dev.emulator.devices) == ['01', '02']
+    assert not dev.realtime
+    dev.close()
+    assert not dev.isOpen()
+
+
+def test_bad_urls():
+    with pytest.raises(ValueError):
+        open_transport('tcp://localhost', 0.1, 9600)
+    with pytest.raises(ValueError):
+        open_transport('loop://?baud=9600', 0.1, 9600)
+    with pytest.raises(ValueError):
+        open_transport('loop://?error_rate=high', 0.1, 9600)
+
+
+def test_loop_realtime():
+    dev = open_transport('loop://', 1.0, 9600)
+    frame = TC3625_Codec('00', SERIAL_CMDS).read_frame('input1')
+    t_start = time.time()
+    dev.write(frame)
+    # Nothing has arrived yet, the reply comes after the wire time
+    assert dev.inWaiting() == 0
+    reply = dev.read(12)
+    assert reply == response('%08x'%(2500,))
+    assert time.time() - t_start >= dev.emulator.wire_time(len(frame) + len(reply)) - 0.001
+    # No reply pending - read waits out the timeout
+    dev.timeout = 0.05
+    t_start = time.time()
+    assert dev.read(12) == ''
+    assert time.time() - t_start >= 0.05
+
+
+def test_loop_partial_read():
+    dev = open_transport('loop://', 0.001, 9600)
+    dev.write(TC3625_Codec('00', SERIAL_CMDS).read_frame('input1'))
+    # Only part of the reply arrives by the timeout
+    data = dev.read(12)
+    assert 0 <= len(data) < 12
+    dev.timeout = 1.0
+    assert data + dev.read(12 - len(data)) == response('%08x'%(2500,))
+
+
+def test_pty():
+    dev = open_transport('pty://', 1.0, 9600)
+    assert isinstance(dev, TC3625_PtyTransport)
+    dev.timeout = 0.5
+    assert dev.serial.timeout == 0.5
+    dev.write(TC3625_Codec('00', SERIAL_CMDS).read_frame('input1'))
+    assert dev.read(12) == response('%08x'%(2500,))
+    dev.close()
+    assert not dev.emulator.running
+
+
+def test_tcp():
+    server = EmulatorServer()
+    server.start()
+    ctlr = TC3625(port='tcp://127.0.0.1:%d'%(server.port,), timeout=1.0)
+    assert isinstance(ctlr.dev.serial, TC3625_TCPTransport)
+    ctlr.set_proportional_bandwidth(6.5)
+    assert ctlr.get_proportional_bandwidth() == 6.5
+    ctlr.close()
+    server.join(1.0)
+    assert not server.is_alive()
+
+
+def test_tcp_closed():
+    server = EmulatorServer()
+    server.start()
+    dev = TC3625_TCPTransport('127.0.0.1', server.port, 0.5)
+    dev.write(TC3625_Codec('00', SERIAL_CMDS).read_frame('input1'))
+    assert dev.read(12) == response('%08x'%(2500,))
+    dev.sock.shutdown(socket.SHUT_WR)
+    server.join(1.0)
+    with pytest.raises(IOError) as excinfo:
+        dev.read(12)
+    assert link_lost(excinfo.value)
+    dev.close()
+    assert not dev.isOpen()
+
+
+def test_link_lost():
+    assert link_lost(IOError(errno.EIO, 'input/output error'))
+    assert link_lost(OSError(errno.ENXIO, 'no such device'))
+    assert not link_lost(IOError(errno.EAGAIN, 'try again'))
+    assert not link_lost(IOError('timeout'))
+    assert not link_lost(IOError())